@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow relative imports when being executed as script.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.utils.anchors import anchor_grid_for_shape, anchor_targets_bbox, anchors_for_grid  # noqa: E402
+
+
+def create_batch(batch_size, height, width, num_boxes, num_classes, seed=0):
+    """ Create a batch of (empty) images with random annotations. """
+    prng              = np.random.RandomState(seed)
+    image_group       = [np.zeros((height, width, 3), dtype=np.float32) for _ in range(batch_size)]
+    annotations_group = []
+    for _ in range(batch_size):
+        corners = prng.uniform(0, [width - 64, height - 64], (num_boxes, 2))
+        sizes   = prng.uniform(32, 400, (num_boxes, 2))
+        annotations_group.append({
+            'labels' : prng.randint(0, num_classes, num_boxes),
+            'bboxes' : np.concatenate([corners, np.minimum(corners + sizes, [width - 1, height - 1])], axis=1),
+        })
+    return image_group, annotations_group
+
+
+def benchmark(function, repeats):
+    """ Return the average time in milliseconds to compute the targets of a batch. """
+    function()
+    start = time.time()
+    for _ in range(repeats):
+        function()
+    return (time.time() - start) / repeats * 1000
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark for computing the anchor targets of a batch.')
+    parser.add_argument('--batch-sizes', help='Batch sizes to benchmark with.', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--height',      help='Height of the images.', type=int, default=800)
+    parser.add_argument('--width',       help='Width of the images.', type=int, default=1333)
+    parser.add_argument('--num-boxes',   help='Number of annotations per image.', type=int, default=20)
+    parser.add_argument('--num-classes', help='Number of classes.', type=int, default=80)
+    parser.add_argument('--repeats',     help='Number of batches to time.', type=int, default=5)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    anchor_grid = anchor_grid_for_shape((args.height, args.width, 3))
+    anchors     = anchors_for_grid(anchor_grid)
+
+    print('Anchor targets for {}x{} images, {} anchors, {} boxes per image, {} classes:'.format(
+        args.height, args.width, anchors.shape[0], args.num_boxes, args.num_classes))
+    for batch_size in args.batch_sizes:
+        image_group, annotations_group = create_batch(batch_size, args.height, args.width, args.num_boxes, args.num_classes)
+
+        dense = benchmark(lambda: anchor_targets_bbox(anchors, image_group, annotations_group, args.num_classes), args.repeats)
+        grid  = benchmark(lambda: anchor_targets_bbox(anchors, image_group, annotations_group, args.num_classes, anchor_grid=anchor_grid), args.repeats)
+        print('    batch size {:2d}: {:7.1f} ms/batch, {:7.1f} ms/batch with the anchor grid'.format(batch_size, dense, grid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# Allow relative imports when being executed as script.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.layers import ClipBoxes, DecodeBoxes, RegressBoxes  # noqa: E402
+
+
+def create_inputs(batch_size, num_boxes, image_size, seed=0):
+    """ Create an image, random anchors and random regression values. """
+    prng       = np.random.RandomState(seed)
+    corners    = prng.uniform(-100, image_size, (batch_size, num_boxes, 2))
+    sizes      = prng.uniform(16, 500, (batch_size, num_boxes, 2))
+    anchors    = np.concatenate([corners, corners + sizes], axis=2).astype(np.float32)
+    regression = prng.uniform(-1, 1, (batch_size, num_boxes, 4)).astype(np.float32)
+    image      = np.zeros((batch_size, image_size, image_size, 3), dtype=np.float32)
+    return tf.constant(image), tf.constant(anchors), tf.constant(regression)
+
+
+def benchmark(function, inputs, repeats):
+    """ Return the number of ops in the graph and the average time in milliseconds to decode a batch. """
+    function = tf.function(function)
+    graph    = function.get_concrete_function(*inputs).graph
+
+    function(*inputs)
+    start = time.time()
+    for _ in range(repeats):
+        function(*inputs)
+    return len(graph.get_operations()), (time.time() - start) / repeats * 1000
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark for decoding and clipping boxes with RegressBoxes and ClipBoxes, and with DecodeBoxes.')
+    parser.add_argument('--batch-size', help='Number of images in a batch.', type=int, default=1)
+    parser.add_argument('--num-boxes',  help='Number of boxes (anchors) per image.', type=int, default=200000)
+    parser.add_argument('--image-size', help='Size of the (square) image.', type=int, default=1024)
+    parser.add_argument('--repeats',    help='Number of batches to time.', type=int, default=100)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    inputs        = create_inputs(args.batch_size, args.num_boxes, args.image_size)
+    regress_boxes = RegressBoxes()
+    clip_boxes    = ClipBoxes()
+    decode_boxes  = DecodeBoxes()
+
+    def separate(image, anchors, regression):
+        return clip_boxes.call([image, regress_boxes.call([anchors, regression])])
+
+    def fused(image, anchors, regression):
+        return decode_boxes.call([image, anchors, regression])
+
+    print('{} boxes, batch size {}:'.format(args.num_boxes, args.batch_size))
+    ops, duration = benchmark(separate, inputs, args.repeats)
+    print('    RegressBoxes + ClipBoxes: {:.2f} ms/batch ({} ops)'.format(duration, ops))
+    ops, duration = benchmark(fused, inputs, args.repeats)
+    print('    DecodeBoxes:              {:.2f} ms/batch ({} ops)'.format(duration, ops))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# Allow relative imports when being executed as script.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.layers import FilterDetections  # noqa: E402
+
+
+def create_inputs(batch_size, num_boxes, num_classes, seed=0):
+    """ Create random boxes and sparse classification scores, similar to the output of a trained model. """
+    prng           = np.random.RandomState(seed)
+    corners        = prng.uniform(0, 1000, (batch_size, num_boxes, 2))
+    sizes          = prng.uniform(16, 300, (batch_size, num_boxes, 2))
+    boxes          = np.concatenate([corners, corners + sizes], axis=2).astype(np.float32)
+    classification = (prng.uniform(0, 1, (batch_size, num_boxes, num_classes)) ** 16).astype(np.float32)
+    return tf.constant(boxes), tf.constant(classification)
+
+
+def benchmark(layer, inputs, repeats):
+    """ Return the time to build the graph in seconds and the average time in milliseconds to filter a batch. """
+    function = tf.function(layer.call)
+
+    start = time.time()
+    function(inputs)
+    build = time.time() - start
+
+    start = time.time()
+    for _ in range(repeats):
+        function(inputs)
+    return build, (time.time() - start) / repeats * 1000
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark for filtering detections per class, and batched with a single NMS.')
+    parser.add_argument('--batch-size',    help='Number of images in a batch.', type=int, default=1)
+    parser.add_argument('--num-boxes',     help='Number of boxes (anchors) per image.', type=int, default=120087)
+    parser.add_argument('--num-classes',   help='Number of classes to benchmark with.', type=int, nargs='+', default=[80, 500])
+    parser.add_argument('--pre-nms-top-k', help='Number of candidates per image for the batched filtering.', type=int, default=1000)
+    parser.add_argument('--repeats',       help='Number of batches to time.', type=int, default=5)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    for num_classes in args.num_classes:
+        inputs = list(create_inputs(args.batch_size, args.num_boxes, num_classes))
+
+        build, per_class = benchmark(FilterDetections(), inputs, args.repeats)
+        print('{} classes, {} boxes, batch size {}:'.format(num_classes, args.num_boxes, args.batch_size))
+        print('    per class: {:.1f} ms/batch (graph built in {:.1f} s)'.format(per_class, build))
+
+        build, batched = benchmark(FilterDetections(pre_nms_top_k=args.pre_nms_top_k), inputs, args.repeats)
+        print('    batched:   {:.1f} ms/batch (graph built in {:.1f} s)'.format(batched, build))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow relative imports when being executed as script.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.utils.image import read_image_bgr, read_image_bgr_reduced, resize_image  # noqa: E402
+
+
+def load_full(path, min_side, max_side):
+    image, scale = resize_image(read_image_bgr(path), min_side=min_side, max_side=max_side)
+    return image, scale
+
+
+def load_reduced(path, min_side, max_side):
+    image, decode_scale = read_image_bgr_reduced(path, min_side=min_side, max_side=max_side)
+    image, scale        = resize_image(image, min_side=min_side, max_side=max_side)
+    return image, scale * decode_scale
+
+
+def benchmark(function, paths, min_side, max_side):
+    """ Return the average time in milliseconds to load and resize an image, and the resized images. """
+    start  = time.time()
+    images = [function(path, min_side, max_side)[0] for path in paths]
+    return (time.time() - start) / len(paths) * 1000, images
+
+
+def evaluate_map(args):
+    """ Return the mAP of a model on a CSV dataset, with and without reduced decoding. """
+    from keras_retinanet import models
+    from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+    from keras_retinanet.utils.eval import evaluate
+
+    model = models.load_model(args.model, backbone_name=args.backbone)
+
+    results = {}
+    for reduced_decode in (False, True):
+        generator = CSVGenerator(
+            args.annotations,
+            args.classes,
+            image_min_side=args.min_side,
+            image_max_side=args.max_side,
+            shuffle_groups=False,
+            reduced_decode=reduced_decode,
+        )
+        average_precisions, _ = evaluate(generator, model)
+        precisions            = [precision for precision, num_annotations in average_precisions.values() if num_annotations > 0]
+        results[reduced_decode] = sum(precisions) / max(len(precisions), 1)
+    return results
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark for decoding and resizing JPEG images, at full and at reduced resolution.')
+    parser.add_argument('image_dir',     help='Directory with sample JPEG images.')
+    parser.add_argument('--min-side',    help='Rescale the image so the smallest side is min_side.', type=int, default=800)
+    parser.add_argument('--max-side',    help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
+    parser.add_argument('--model',       help='Optional inference model, to compare the mAP on a CSV dataset.')
+    parser.add_argument('--backbone',    help='The backbone of the model.', default='resnet50')
+    parser.add_argument('--annotations', help='Path to CSV file containing annotations (used with --model).')
+    parser.add_argument('--classes',     help='Path to a CSV file containing class label mapping (used with --model).')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    paths = sorted(
+        os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+        if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg')
+    )
+    if not paths:
+        raise ValueError('no JPEG images found in {}'.format(args.image_dir))
+
+    full, full_images       = benchmark(load_full, paths, args.min_side, args.max_side)
+    reduced, reduced_images = benchmark(load_reduced, paths, args.min_side, args.max_side)
+
+    # the resized images can differ by a pixel in size, compare the overlapping region
+    differences = []
+    for full_image, reduced_image in zip(full_images, reduced_images):
+        rows = min(full_image.shape[0], reduced_image.shape[0])
+        cols = min(full_image.shape[1], reduced_image.shape[1])
+        differences.append(np.abs(full_image[:rows, :cols].astype(np.int16) - reduced_image[:rows, :cols]).mean())
+
+    print('Decode and resize {} images to min side {}, max side {}:'.format(len(paths), args.min_side, args.max_side))
+    print('    full resolution:    {:.2f} ms/image ({:.1f} images/s)'.format(full, 1000 / full))
+    print('    reduced resolution: {:.2f} ms/image ({:.1f} images/s)'.format(reduced, 1000 / reduced))
+    print('    mean absolute pixel difference: {:.2f}'.format(np.mean(differences)))
+
+    if args.model:
+        results = evaluate_map(args)
+        print('    mAP full resolution:    {:.4f}'.format(results[False]))
+        print('    mAP reduced resolution: {:.4f}'.format(results[True]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow relative imports when being executed as script.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from keras_retinanet.utils.image import random_visual_effect_generator  # noqa: E402
+
+
+def benchmark(function, images, effects):
+    """ Return the average time in milliseconds to apply function to an image. """
+    start = time.time()
+    for image, effect in zip(images, effects):
+        function(effect, image)
+    return (time.time() - start) / len(images) * 1000
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Micro-benchmark for the visual effects used during training.')
+    parser.add_argument('--images', help='Number of images to process.', type=int, default=20)
+    parser.add_argument('--height', help='Height of the images.', type=int, default=800)
+    parser.add_argument('--width',  help='Width of the images.', type=int, default=1333)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    prng      = np.random.RandomState(0)
+    images    = [prng.randint(0, 256, (args.height, args.width, 3)).astype(np.uint8) for _ in range(args.images)]
+    generator = random_visual_effect_generator()
+    effects   = [next(generator) for _ in range(args.images)]
+
+    separately    = benchmark(lambda effect, image: effect.apply_separately(image), images, effects)
+    lookup_tables = benchmark(lambda effect, image: effect.apply_lookup_tables(image), images, effects)
+
+    max_difference = max(
+        np.abs(effect.apply_separately(image).astype(np.int16) - effect.apply_lookup_tables(image)).max()
+        for image, effect in zip(images, effects)
+    )
+
+    print('Visual effects on {}x{} images:'.format(args.height, args.width))
+    print('    separately:    {:.2f} ms/image'.format(separately))
+    print('    lookup tables: {:.2f} ms/image'.format(lookup_tables))
+    print('    max difference: {}'.format(max_difference))
+
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,12 @@ def non_max_suppression(*args, **kwargs):
     return tensorflow.image.non_max_suppression(*args, **kwargs)
 
 
+def non_max_suppression_padded(*args, **kwargs):
+    """ See https://www.tensorflow.org/api_docs/python/tf/image/non_max_suppression_padded .
+    """
+    return tensorflow.image.non_max_suppression_padded(*args, **kwargs)
+
+
 def range(*args, **kwargs):
     """ See https://www.tensorflow.org/api_docs/python/tf/range .
     """
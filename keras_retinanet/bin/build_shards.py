@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Allow relative imports when being executed as script.
+if __name__ == "__main__" and __package__ is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    import keras_retinanet.bin  # noqa: F401
+    __package__ = "keras_retinanet.bin"
+
+# Change these to absolute imports if you copy this script outside the keras_retinanet package.
+from ..preprocessing.csv_generator import CSVGenerator
+from ..preprocessing.kitti import KittiGenerator
+from ..preprocessing.pascal_voc import PascalVocGenerator
+from ..preprocessing.sharded import write_shards
+
+
+def create_generator(args):
+    """ Create the generator with the images to write to shards.
+
+    Args:
+        args: parseargs arguments object.
+    """
+    common_args = {
+        'group_method'        : 'none',
+        'shuffle_groups'      : False,
+        'image_metadata_path' : args.image_metadata,
+    }
+
+    if args.dataset_type == 'coco':
+        # import here to prevent unnecessary dependency on cocoapi
+        from ..preprocessing.coco import CocoGenerator
+
+        generator = CocoGenerator(
+            args.coco_path,
+            args.coco_set,
+            **common_args
+        )
+    elif args.dataset_type == 'pascal':
+        generator = PascalVocGenerator(
+            args.pascal_path,
+            args.pascal_set,
+            image_extension=args.image_extension,
+            **common_args
+        )
+    elif args.dataset_type == 'csv':
+        generator = CSVGenerator(
+            args.annotations,
+            args.classes,
+            **common_args
+        )
+    elif args.dataset_type == 'kitti':
+        generator = KittiGenerator(
+            args.kitti_path,
+            subset=args.subset,
+            **common_args
+        )
+    else:
+        raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
+
+    return generator
+
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser     = argparse.ArgumentParser(description='Write the images and annotations of a dataset to sequential shard files, for training with the shards dataset type.')
+    subparsers = parser.add_subparsers(help='Arguments for specific dataset types.', dest='dataset_type')
+    subparsers.required = True
+
+    coco_parser = subparsers.add_parser('coco')
+    coco_parser.add_argument('coco_path',  help='Path to dataset directory (ie. /tmp/COCO).')
+    coco_parser.add_argument('--coco-set', help='Name of the set to write (defaults to train2017).', default='train2017')
+
+    pascal_parser = subparsers.add_parser('pascal')
+    pascal_parser.add_argument('pascal_path',       help='Path to dataset directory (ie. /tmp/VOCdevkit).')
+    pascal_parser.add_argument('--pascal-set',      help='Name of the set to write (defaults to trainval).', default='trainval')
+    pascal_parser.add_argument('--image-extension', help='Declares the dataset images\' extension.', default='.jpg')
+
+    kitti_parser = subparsers.add_parser('kitti')
+    kitti_parser.add_argument('kitti_path', help='Path to dataset directory (ie. /tmp/kitti).')
+    kitti_parser.add_argument('subset',     help='Argument for loading a subset from train/val.')
+
+    csv_parser = subparsers.add_parser('csv')
+    csv_parser.add_argument('annotations', help='Path to CSV file containing annotations.')
+    csv_parser.add_argument('classes',     help='Path to a CSV file containing class label mapping.')
+
+    parser.add_argument('output_dir',         help='Directory to write the shards to.')
+    parser.add_argument('--images-per-shard', help='Number of images in every shard (defaults to 1000).', type=int, default=1000)
+    parser.add_argument('--image-metadata',   help='Path to an image metadata index, so image sizes are read in parallel and only once.')
+
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    # parse arguments
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    generator = create_generator(args)
+
+    start = time.time()
+    write_shards(generator, args.output_dir, images_per_shard=args.images_per_shard)
+    print('Wrote {} images in {:.1f} seconds.'.format(generator.size(), time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -42,6 +42,10 @@ def parse_args(args):
     parser.add_argument('--backbone', help='The backbone of the model to convert.', default='resnet50')
     parser.add_argument('--no-nms', help='Disables non maximum suppression.', dest='nms', action='store_false')
     parser.add_argument('--no-class-specific-filter', help='Disables class specific filtering.', dest='class_specific_filter', action='store_false')
+    parser.add_argument('--pre-nms-top-k', help='Filter the detections of a batch at once, with a single NMS on this many best candidates per image (faster for many classes).', type=int)
+    parser.add_argument('--level-top-k', help='Only decode and filter this many highest scoring anchors of every pyramid level (faster for large images).', type=int)
+    parser.add_argument('--raw-outputs', help='Output the anchors and raw regression and classification values, to decode and filter detections on the host.', action='store_true')
+    parser.add_argument('--image-shape', help='Only accept images of this height and width, with the anchors as constants in the graph.', type=int, nargs=2, metavar=('HEIGHT', 'WIDTH'))
     parser.add_argument('--config', help='Path to a configuration parameters .ini file.')
 
     return parser.parse_args(args)
@@ -74,7 +78,7 @@ def main(args=None):
     models.check_training_model(model)
 
     # convert the model
-    model = models.convert_model(model, nms=args.nms, class_specific_filter=args.class_specific_filter, anchor_params=anchor_parameters)
+    model = models.convert_model(model, nms=args.nms, class_specific_filter=args.class_specific_filter, anchor_params=anchor_parameters, pre_nms_top_k=args.pre_nms_top_k, level_top_k=args.level_top_k, raw_outputs=args.raw_outputs, image_shape=args.image_shape)
 
     # save model
     model.save(args.model_out)
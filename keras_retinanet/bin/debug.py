@@ -181,6 +181,7 @@ def parse_args(args):
     parser.add_argument('--display-name', help='Display image name on the bottom left corner.', action='store_true')
     parser.add_argument('--annotations', help='Show annotations on the image. Green annotations have anchors, red annotations don\'t and therefore don\'t contribute to training.', action='store_true')
     parser.add_argument('--random-transform', help='Randomly transform image and annotations.', action='store_true')
+    parser.add_argument('--resize-before-augment', help='Compose the resize into the random transformation (as done during training with --resize-before-augment).', action='store_true')
     parser.add_argument('--image-min-side', help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side', help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
     parser.add_argument('--config', help='Path to a configuration parameters .ini file.')
@@ -205,15 +206,20 @@ def run(generator, args, anchor_params):
         image       = generator.load_image(i)
         annotations = generator.load_annotations(i)
         if len(annotations['labels']) > 0 :
-            # apply random transformations
-            if args.random_transform:
-                image, annotations = generator.random_transform_group_entry(image, annotations)
+            if args.random_transform and args.resize and args.resize_before_augment:
+                # resize and transform in a single step, like the generator does with resize_before_augment
+                image, annotations = generator.resize_transform_group_entry(image, annotations)
                 image, annotations = generator.random_visual_effect_group_entry(image, annotations)
-
-            # resize the image and annotations
-            if args.resize:
-                image, image_scale = generator.resize_image(image)
-                annotations['bboxes'] *= image_scale
+            else:
+                # apply random transformations
+                if args.random_transform:
+                    image, annotations = generator.random_transform_group_entry(image, annotations)
+                    image, annotations = generator.random_visual_effect_group_entry(image, annotations)
+
+                # resize the image and annotations
+                if args.resize:
+                    image, image_scale = generator.resize_image(image)
+                    annotations['bboxes'] = annotations['bboxes'] * image_scale
 
             anchors = anchors_for_shape(image.shape, anchor_params=anchor_params)
             positive_indices, _, max_indices = compute_gt_annotations(anchors, annotations['bboxes'])
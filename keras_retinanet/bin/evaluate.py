@@ -49,6 +49,8 @@ def create_generator(args):
             image_max_side=args.image_max_side,
             config=args.config,
             shuffle_groups=False,
+            image_cache_path=args.image_cache,
+            reduced_decode=args.reduced_decode,
         )
     elif args.dataset_type == 'pascal':
         validation_generator = PascalVocGenerator(
@@ -59,6 +61,8 @@ def create_generator(args):
             image_max_side=args.image_max_side,
             config=args.config,
             shuffle_groups=False,
+            image_cache_path=args.image_cache,
+            reduced_decode=args.reduced_decode,
         )
     elif args.dataset_type == 'csv':
         validation_generator = CSVGenerator(
@@ -68,6 +72,8 @@ def create_generator(args):
             image_max_side=args.image_max_side,
             config=args.config,
             shuffle_groups=False,
+            image_cache_path=args.image_cache,
+            reduced_decode=args.reduced_decode,
         )
     else:
         raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
@@ -104,6 +110,11 @@ def parse_args(args):
     parser.add_argument('--image-min-side',   help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side',   help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
     parser.add_argument('--config',           help='Path to a configuration parameters .ini file (only used with --convert-model).')
+    parser.add_argument('--reduced-decode',   help='Decode JPEG images at a reduced resolution when they are downscaled by at least a factor 2.', action='store_true')
+    parser.add_argument('--image-cache',      help='Directory with an image cache of the evaluation images, created with retinanet-build-image-cache.')
+    parser.add_argument('--workers',          help='Number of processes used to compute the average precisions (defaults to 1).', type=int, default=1)
+    parser.add_argument('--eval-batch-size',  help='Number of images per call to the model (defaults to 1).', type=int, default=1)
+    parser.add_argument('--eval-prefetch',    help='Number of batches to load in the background while the model runs (defaults to 2).', type=int, default=2)
 
     return parser.parse_args(args)
 
@@ -152,15 +163,18 @@ def main(args=None):
     # start evaluation
     if args.dataset_type == 'coco':
         from ..utils.coco_eval import evaluate_coco
-        evaluate_coco(generator, model, args.score_threshold)
+        evaluate_coco(generator, model, args.score_threshold, batch_size=args.eval_batch_size, prefetch=args.eval_prefetch)
     else:
-        average_precisions, inference_time = evaluate(
+        average_precisions, timings = evaluate(
             generator,
             model,
             iou_threshold=args.iou_threshold,
             score_threshold=args.score_threshold,
             max_detections=args.max_detections,
-            save_path=args.save_path
+            save_path=args.save_path,
+            workers=args.workers,
+            batch_size=args.eval_batch_size,
+            prefetch=args.eval_prefetch
         )
 
         # print evaluation
@@ -176,7 +190,9 @@ def main(args=None):
             print('No test instances found.')
             return
 
-        print('Inference time for {:.0f} images: {:.4f}'.format(generator.size(), inference_time))
+        print('Average time per image for {:.0f} images:'.format(generator.size()))
+        for stage, duration in timings.items():
+            print('    {:<12} {:.4f}s'.format(stage + ':', duration))
 
         print('mAP using the weighted average of precisions among classes: {:.4f}'.format(sum([a * b for a, b in zip(total_instances, precisions)]) / sum(total_instances)))
         print('mAP: {:.4f}'.format(sum(precisions) / sum(x > 0 for x in total_instances)))
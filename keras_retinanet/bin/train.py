@@ -35,14 +35,16 @@ if __name__ == "__main__" and __package__ is None:
 from .. import layers  # noqa: F401
 from .. import losses
 from .. import models
-from ..callbacks import RedirectModel
+from ..callbacks import LoaderMetrics, RedirectModel
 from ..callbacks.eval import Evaluate
 from ..models.retinanet import retinanet_bbox
 from ..preprocessing.csv_generator import CSVGenerator
 from ..preprocessing.kitti import KittiGenerator
+from ..preprocessing.loader import MultiprocessLoader
 from ..preprocessing.open_images import OpenImagesGenerator
 from ..preprocessing.pascal_voc import PascalVocGenerator
-from ..utils.anchors import make_shapes_callback
+from ..preprocessing.sharded import ShardedGenerator
+from ..utils.anchors import anchor_targets_bbox, anchor_targets_bbox_sparse, make_shapes_callback
 from ..utils.config import read_config_file, parse_anchor_parameters
 from ..utils.gpu import setup_gpu
 from ..utils.image import random_visual_effect_generator
@@ -77,7 +79,7 @@ def model_with_weights(model, weights, skip_mismatch):
 
 
 def create_models(backbone_retinanet, num_classes, weights, multi_gpu=0,
-                  freeze_backbone=False, lr=1e-5, config=None):
+                  freeze_backbone=False, lr=1e-5, config=None, sparse_targets=False):
     """ Creates three models (model, training_model, prediction_model).
 
     Args
@@ -87,6 +89,7 @@ def create_models(backbone_retinanet, num_classes, weights, multi_gpu=0,
         multi_gpu          : The number of GPUs to use for training.
         freeze_backbone    : If True, disables learning for the backbone.
         config             : Config parameters, None indicates the default configuration.
+        sparse_targets     : If True, compile with the losses for sparse targets (see anchor_targets_bbox_sparse).
 
     Returns
         model            : The base model. This is also the model that is saved in snapshots.
@@ -118,11 +121,19 @@ def create_models(backbone_retinanet, num_classes, weights, multi_gpu=0,
     prediction_model = retinanet_bbox(model=model, anchor_params=anchor_params)
 
     # compile model
-    training_model.compile(
-        loss={
+    if sparse_targets:
+        loss = {
+            'regression'    : losses.smooth_l1_sparse(),
+            'classification': losses.focal_sparse()
+        }
+    else:
+        loss = {
             'regression'    : losses.smooth_l1(),
             'classification': losses.focal()
-        },
+        }
+
+    training_model.compile(
+        loss=loss,
         optimizer=keras.optimizers.adam(lr=lr, clipnorm=0.001)
     )
 
@@ -165,9 +176,15 @@ def create_callbacks(model, training_model, prediction_model, validation_generat
             from ..callbacks.coco import CocoEval
 
             # use prediction model for evaluation
-            evaluation = CocoEval(validation_generator, tensorboard=tensorboard_callback)
+            evaluation = CocoEval(validation_generator, tensorboard=tensorboard_callback, batch_size=args.eval_batch_size)
         else:
-            evaluation = Evaluate(validation_generator, tensorboard=tensorboard_callback, weighted_average=args.weighted_average)
+            evaluation = Evaluate(
+                validation_generator,
+                tensorboard=tensorboard_callback,
+                weighted_average=args.weighted_average,
+                workers=args.workers,
+                batch_size=args.eval_batch_size
+            )
         evaluation = RedirectModel(evaluation, prediction_model)
         callbacks.append(evaluation)
 
@@ -213,14 +230,33 @@ def create_generators(args, preprocess_image):
         preprocess_image : Function that preprocesses an image for the network.
     """
     common_args = {
-        'batch_size'       : args.batch_size,
-        'config'           : args.config,
-        'image_min_side'   : args.image_min_side,
-        'image_max_side'   : args.image_max_side,
-        'no_resize'        : args.no_resize,
-        'preprocess_image' : preprocess_image,
+        'batch_size'             : args.batch_size,
+        'config'                 : args.config,
+        'image_min_side'         : args.image_min_side,
+        'image_max_side'         : args.image_max_side,
+        'no_resize'              : args.no_resize,
+        'resize_before_augment'  : args.resize_before_augment,
+        'image_metadata_workers' : args.image_metadata_workers,
+        'reduced_decode'         : args.reduced_decode,
+        'compute_anchor_targets' : anchor_targets_bbox_sparse if args.sparse_targets else anchor_targets_bbox,
+        'preprocess_image'       : preprocess_image,
     }
 
+    def annotation_store_path(subset):
+        if args.annotation_store_dir is None:
+            return None
+        return os.path.join(args.annotation_store_dir, subset)
+
+    def image_metadata_path(subset):
+        if args.image_metadata_dir is None:
+            return None
+        return os.path.join(args.image_metadata_dir, subset + '.npz')
+
+    def image_cache_path(subset):
+        if args.image_cache_dir is None:
+            return None
+        return os.path.join(args.image_cache_dir, subset)
+
     # create random transform generator for augmenting training data
     if args.random_transform:
         transform_generator = random_transform_generator(
@@ -254,6 +290,9 @@ def create_generators(args, preprocess_image):
             'train2017',
             transform_generator=transform_generator,
             visual_effect_generator=visual_effect_generator,
+            annotation_store_path=annotation_store_path('train'),
+            image_metadata_path=image_metadata_path('train'),
+            image_cache_path=image_cache_path('train'),
             **common_args
         )
 
@@ -261,6 +300,9 @@ def create_generators(args, preprocess_image):
             args.coco_path,
             'val2017',
             shuffle_groups=False,
+            annotation_store_path=annotation_store_path('validation'),
+            image_metadata_path=image_metadata_path('validation'),
+            image_cache_path=image_cache_path('validation'),
             **common_args
         )
     elif args.dataset_type == 'pascal':
@@ -270,6 +312,9 @@ def create_generators(args, preprocess_image):
             image_extension=args.image_extension,
             transform_generator=transform_generator,
             visual_effect_generator=visual_effect_generator,
+            annotation_store_path=annotation_store_path('train'),
+            image_metadata_path=image_metadata_path('train'),
+            image_cache_path=image_cache_path('train'),
             **common_args
         )
 
@@ -278,6 +323,9 @@ def create_generators(args, preprocess_image):
             'val',
             image_extension=args.image_extension,
             shuffle_groups=False,
+            annotation_store_path=annotation_store_path('validation'),
+            image_metadata_path=image_metadata_path('validation'),
+            image_cache_path=image_cache_path('validation'),
             **common_args
         )
     elif args.dataset_type == 'csv':
@@ -286,6 +334,9 @@ def create_generators(args, preprocess_image):
             args.classes,
             transform_generator=transform_generator,
             visual_effect_generator=visual_effect_generator,
+            annotation_store_path=annotation_store_path('train'),
+            image_metadata_path=image_metadata_path('train'),
+            image_cache_path=image_cache_path('train'),
             **common_args
         )
 
@@ -294,6 +345,9 @@ def create_generators(args, preprocess_image):
                 args.val_annotations,
                 args.classes,
                 shuffle_groups=False,
+                annotation_store_path=annotation_store_path('validation'),
+                image_metadata_path=image_metadata_path('validation'),
+                image_cache_path=image_cache_path('validation'),
                 **common_args
             )
         else:
@@ -308,6 +362,9 @@ def create_generators(args, preprocess_image):
             parent_label=args.parent_label,
             transform_generator=transform_generator,
             visual_effect_generator=visual_effect_generator,
+            annotation_store_path=annotation_store_path('train'),
+            image_metadata_path=image_metadata_path('train'),
+            image_cache_path=image_cache_path('train'),
             **common_args
         )
 
@@ -319,6 +376,9 @@ def create_generators(args, preprocess_image):
             annotation_cache_dir=args.annotation_cache_dir,
             parent_label=args.parent_label,
             shuffle_groups=False,
+            annotation_store_path=annotation_store_path('validation'),
+            image_metadata_path=image_metadata_path('validation'),
+            image_cache_path=image_cache_path('validation'),
             **common_args
         )
     elif args.dataset_type == 'kitti':
@@ -327,6 +387,9 @@ def create_generators(args, preprocess_image):
             subset='train',
             transform_generator=transform_generator,
             visual_effect_generator=visual_effect_generator,
+            annotation_store_path=annotation_store_path('train'),
+            image_metadata_path=image_metadata_path('train'),
+            image_cache_path=image_cache_path('train'),
             **common_args
         )
 
@@ -334,8 +397,22 @@ def create_generators(args, preprocess_image):
             args.kitti_path,
             subset='val',
             shuffle_groups=False,
+            annotation_store_path=annotation_store_path('validation'),
+            image_metadata_path=image_metadata_path('validation'),
+            image_cache_path=image_cache_path('validation'),
+            **common_args
+        )
+    elif args.dataset_type == 'shards':
+        # shards can only be streamed, so there is no validation generator
+        train_generator = ShardedGenerator(
+            args.shard_dir,
+            shuffle_buffer_size=args.shuffle_buffer_size,
+            transform_generator=transform_generator,
+            visual_effect_generator=visual_effect_generator,
             **common_args
         )
+
+        validation_generator = None
     else:
         raise ValueError('Invalid data type received: {}'.format(args.dataset_type))
 
@@ -367,6 +444,11 @@ def check_args(parsed_args):
     if parsed_args.multi_gpu > 1 and not parsed_args.multi_gpu_force:
         raise ValueError("Multi-GPU support is experimental, use at own risk! Run with --multi-gpu-force if you wish to continue.")
 
+    if parsed_args.dataset_type == 'shards' and parsed_args.multiprocessing and parsed_args.loader_workers == 0:
+        # fit_generator workers would all fork the same shard stream, the loader splits the shards over its workers
+        warnings.warn('Streaming shards with --multiprocessing uses {} loader workers (--loader-workers).'.format(parsed_args.workers))
+        parsed_args.loader_workers = parsed_args.workers
+
     if 'resnet' not in parsed_args.backbone:
         warnings.warn('Using experimental backbone {}. Only resnet50 has been properly tested.'.format(parsed_args.backbone))
 
@@ -405,6 +487,10 @@ def parse_args(args):
     csv_parser.add_argument('classes', help='Path to a CSV file containing class label mapping.')
     csv_parser.add_argument('--val-annotations', help='Path to CSV file containing annotations for validation (optional).')
 
+    shards_parser = subparsers.add_parser('shards')
+    shards_parser.add_argument('shard_dir', help='Path to a directory with shards created with retinanet-build-shards.')
+    shards_parser.add_argument('--shuffle-buffer-size', help='Number of images in the shuffle buffer.', type=int, default=1000)
+
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--snapshot',          help='Resume training from a snapshot.')
     group.add_argument('--imagenet-weights',  help='Initialize the model with pretrained imagenet weights. This is the default behaviour.', action='store_const', const=True, default=True)
@@ -428,14 +514,24 @@ def parse_args(args):
     parser.add_argument('--image-min-side',   help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side',   help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
     parser.add_argument('--no-resize',        help='Don''t rescale the image.', action='store_true')
+    parser.add_argument('--reduced-decode',   help='Decode JPEG images at a reduced resolution when they are downscaled by at least a factor 2 (faster, not bit-identical).', action='store_true')
+    parser.add_argument('--resize-before-augment', help='Compose the resize into the random transformation and apply visual effects after resizing (faster for large images).', action='store_true')
+    parser.add_argument('--annotation-store-dir', help='Directory to store binary annotation caches in, so annotations are parsed only once.')
+    parser.add_argument('--image-metadata-dir', help='Directory to store image metadata indices in, so image sizes are read only once.')
+    parser.add_argument('--image-cache-dir',  help='Directory with image caches (train/ and validation/) created with retinanet-build-image-cache.')
+    parser.add_argument('--image-metadata-workers', help='Number of threads used to read image sizes when building the image metadata index.', type=int, default=8)
+    parser.add_argument('--sparse-targets',   help='Use compact anchor targets that store class indices instead of one-hot labels (less memory and transfer for many classes).', action='store_true')
     parser.add_argument('--config',           help='Path to a configuration parameters .ini file.')
     parser.add_argument('--weighted-average', help='Compute the mAP using the weighted average of precisions among classes.', action='store_true')
+    parser.add_argument('--eval-batch-size',  help='Number of images per call to the model during evaluation.', type=int, default=1)
     parser.add_argument('--compute-val-loss', help='Compute validation loss during training', dest='compute_val_loss', action='store_true')
 
     # Fit generator arguments
     parser.add_argument('--multiprocessing',  help='Use multiprocessing in fit_generator.', action='store_true')
-    parser.add_argument('--workers',          help='Number of generator workers.', type=int, default=1)
+    parser.add_argument('--workers',          help='Number of generator workers (also the number of processes that compute the average precisions during evaluation).', type=int, default=1)
     parser.add_argument('--max-queue-size',   help='Queue length for multiprocessing workers in fit_generator.', type=int, default=10)
+    parser.add_argument('--loader-workers',   help='Number of processes that compute batches and return them through shared memory (replaces the fit_generator workers).', type=int, default=0)
+    parser.add_argument('--loader-slots',     help='Number of shared memory batch slots of the loader (defaults to twice the number of loader workers).', type=int)
 
     return check_args(parser.parse_args(args))
 
@@ -487,7 +583,8 @@ def main(args=None):
             multi_gpu=args.multi_gpu,
             freeze_backbone=args.freeze_backbone,
             lr=args.lr,
-            config=args.config
+            config=args.config,
+            sparse_targets=args.sparse_targets
         )
 
     # print model summary
@@ -511,6 +608,20 @@ def main(args=None):
     if not args.compute_val_loss:
         validation_generator = None
 
+    if args.loader_workers > 0:
+        # compute batches in worker processes, which return them through shared memory
+        with MultiprocessLoader(train_generator, workers=args.loader_workers, num_slots=args.loader_slots) as loader:
+            return training_model.fit_generator(
+                generator=loader,
+                steps_per_epoch=args.steps,
+                epochs=args.epochs,
+                verbose=1,
+                callbacks=[LoaderMetrics(loader)] + callbacks,
+                workers=0,
+                validation_data=validation_generator,
+                initial_epoch=args.initial_epoch
+            )
+
     # start training
     return training_model.fit_generator(
         generator=train_generator,
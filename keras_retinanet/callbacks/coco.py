@@ -21,17 +21,19 @@ from ..utils.coco_eval import evaluate_coco
 class CocoEval(keras.callbacks.Callback):
     """ Performs COCO evaluation on each epoch.
     """
-    def __init__(self, generator, tensorboard=None, threshold=0.05):
+    def __init__(self, generator, tensorboard=None, threshold=0.05, batch_size=1):
         """ CocoEval callback intializer.
 
         Args
             generator   : The generator used for creating validation data.
             tensorboard : If given, the results will be written to tensorboard.
             threshold   : The score threshold to use.
+            batch_size  : The number of images per call to the model.
         """
         self.generator = generator
         self.threshold = threshold
         self.tensorboard = tensorboard
+        self.batch_size = batch_size
 
         super(CocoEval, self).__init__()
 
@@ -50,7 +52,7 @@ class CocoEval(keras.callbacks.Callback):
                     'AR @[ IoU=0.50:0.95 | area= small | maxDets=100 ]',
                     'AR @[ IoU=0.50:0.95 | area=medium | maxDets=100 ]',
                     'AR @[ IoU=0.50:0.95 | area= large | maxDets=100 ]']
-        coco_eval_stats = evaluate_coco(self.generator, self.model, self.threshold)
+        coco_eval_stats = evaluate_coco(self.generator, self.model, self.threshold, batch_size=self.batch_size)
 
         if coco_eval_stats is not None:
             for index, result in enumerate(coco_eval_stats):
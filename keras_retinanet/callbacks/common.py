@@ -44,3 +44,26 @@ class RedirectModel(keras.callbacks.Callback):
 
     def on_train_end(self, logs=None):
         self.callback.on_train_end(logs=logs)
+
+
+class LoaderMetrics(keras.callbacks.Callback):
+    """Callback which adds the metrics of a MultiprocessLoader (throughput and queue depth) to the logs at the end of every epoch.
+
+    Add it before other callbacks that use the logs (for example TensorBoard).
+
+    Args
+        loader : the MultiprocessLoader that produces the training data.
+    """
+
+    def __init__(self, loader):
+        super(LoaderMetrics, self).__init__()
+
+        self.loader = loader
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs is None:
+            return
+
+        metrics = self.loader.metrics()
+        logs['loader_batches_per_second'] = metrics['batches_per_second']
+        logs['loader_queue_depth']        = metrics['queue_depth']
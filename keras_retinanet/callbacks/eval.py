@@ -31,6 +31,8 @@ class Evaluate(keras.callbacks.Callback):
         save_path=None,
         tensorboard=None,
         weighted_average=False,
+        workers=1,
+        batch_size=1,
         verbose=1
     ):
         """ Evaluate a given dataset using a given model at the end of every epoch during training.
@@ -43,6 +45,8 @@ class Evaluate(keras.callbacks.Callback):
             save_path        : The path to save images with visualized detections to.
             tensorboard      : Instance of keras.callbacks.TensorBoard used to log the mAP value.
             weighted_average : Compute the mAP using the weighted average of precisions among classes.
+            workers          : The number of processes used to compute the average precisions.
+            batch_size       : The number of images per call to the model.
             verbose          : Set the verbosity level, by default this is set to 1.
         """
         self.generator       = generator
@@ -52,6 +56,8 @@ class Evaluate(keras.callbacks.Callback):
         self.save_path       = save_path
         self.tensorboard     = tensorboard
         self.weighted_average = weighted_average
+        self.workers         = workers
+        self.batch_size      = batch_size
         self.verbose         = verbose
 
         super(Evaluate, self).__init__()
@@ -66,7 +72,9 @@ class Evaluate(keras.callbacks.Callback):
             iou_threshold=self.iou_threshold,
             score_threshold=self.score_threshold,
             max_detections=self.max_detections,
-            save_path=self.save_path
+            save_path=self.save_path,
+            workers=self.workers,
+            batch_size=self.batch_size
         )
 
         # compute per class average precision
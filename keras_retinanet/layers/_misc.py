@@ -93,6 +93,60 @@ class Anchors(keras.layers.Layer):
         return config
 
 
+class StaticAnchors(keras.layers.Layer):
+    """ Keras layer with the anchors for a feature map of a fixed shape, as a constant.
+    """
+
+    def __init__(self, size, stride, shape, ratios=None, scales=None, *args, **kwargs):
+        """ Initializer for a StaticAnchors layer.
+
+        Args
+            size: The base size of the anchors to generate.
+            stride: The stride of the anchors to generate.
+            shape: The (height, width) of the feature map.
+            ratios: The ratios of the anchors to generate (defaults to AnchorParameters.default.ratios).
+            scales: The scales of the anchors to generate (defaults to AnchorParameters.default.scales).
+        """
+        self.size   = size
+        self.stride = stride
+        self.shape  = tuple(shape)
+        self.ratios = ratios
+        self.scales = scales
+
+        if ratios is None:
+            self.ratios  = utils_anchors.AnchorParameters.default.ratios
+        elif isinstance(ratios, list):
+            self.ratios  = np.array(ratios)
+        if scales is None:
+            self.scales  = utils_anchors.AnchorParameters.default.scales
+        elif isinstance(scales, list):
+            self.scales  = np.array(scales)
+
+        # the anchors are the same for every image, so they are broadcast over the batch instead of tiled
+        anchors      = utils_anchors.generate_anchors(base_size=self.size, ratios=self.ratios, scales=self.scales)
+        self.anchors = utils_anchors.shift(self.shape, self.stride, anchors)[np.newaxis].astype(keras.backend.floatx())
+
+        super(StaticAnchors, self).__init__(*args, **kwargs)
+
+    def call(self, inputs, **kwargs):
+        return keras.backend.constant(self.anchors)
+
+    def compute_output_shape(self, input_shape):
+        return self.anchors.shape
+
+    def get_config(self):
+        config = super(StaticAnchors, self).get_config()
+        config.update({
+            'size'   : self.size,
+            'stride' : self.stride,
+            'shape'  : list(self.shape),
+            'ratios' : self.ratios.tolist(),
+            'scales' : self.scales.tolist(),
+        })
+
+        return config
+
+
 class UpsampleLike(keras.layers.Layer):
     """ Keras layer for upsampling a Tensor to be the same shape as another Tensor.
     """
@@ -150,7 +204,7 @@ class RegressBoxes(keras.layers.Layer):
         return backend.bbox_transform_inv(anchors, regression, mean=self.mean, std=self.std)
 
     def compute_output_shape(self, input_shape):
-        return input_shape[0]
+        return input_shape[1]
 
     def get_config(self):
         config = super(RegressBoxes, self).get_config()
@@ -165,13 +219,26 @@ class RegressBoxes(keras.layers.Layer):
 class ClipBoxes(keras.layers.Layer):
     """ Keras layer to clip box values to lie inside a given shape.
     """
+
+    def __init__(self, image_shape=None, *args, **kwargs):
+        """ Initializer for the ClipBoxes layer.
+
+        Args
+            image_shape: Optional fixed (height, width) of the images. If None, the shape of the image input is used.
+        """
+        self.image_shape = None if image_shape is None else tuple(image_shape)
+        super(ClipBoxes, self).__init__(*args, **kwargs)
+
     def call(self, inputs, **kwargs):
         image, boxes = inputs
-        shape = keras.backend.cast(keras.backend.shape(image), keras.backend.floatx())
-        if keras.backend.image_data_format() == 'channels_first':
-            _, _, height, width = backend.unstack(shape, axis=0)
+        if self.image_shape is not None:
+            height, width = [keras.backend.cast_to_floatx(x) for x in self.image_shape]
         else:
-            _, height, width, _ = backend.unstack(shape, axis=0)
+            shape = keras.backend.cast(keras.backend.shape(image), keras.backend.floatx())
+            if keras.backend.image_data_format() == 'channels_first':
+                _, _, height, width = backend.unstack(shape, axis=0)
+            else:
+                _, height, width, _ = backend.unstack(shape, axis=0)
 
         x1, y1, x2, y2 = backend.unstack(boxes, axis=-1)
         x1 = backend.clip_by_value(x1, 0, width  - 1)
@@ -183,3 +250,148 @@ class ClipBoxes(keras.layers.Layer):
 
     def compute_output_shape(self, input_shape):
         return input_shape[1]
+
+    def get_config(self):
+        config = super(ClipBoxes, self).get_config()
+        config.update({
+            'image_shape' : None if self.image_shape is None else list(self.image_shape),
+        })
+
+        return config
+
+
+class SelectTopKPerLevel(keras.layers.Layer):
+    """ Keras layer to select the highest scoring anchors of every pyramid level, before their boxes are decoded.
+    """
+
+    def __init__(self, k=1000, num_levels=5, *args, **kwargs):
+        """ Initializer for the SelectTopKPerLevel layer.
+
+        Args
+            k: The number of anchors to select on every pyramid level (by their maximum class score).
+            num_levels: The number of pyramid levels.
+        """
+        self.k          = k
+        self.num_levels = num_levels
+        super(SelectTopKPerLevel, self).__init__(*args, **kwargs)
+
+    def call(self, inputs, **kwargs):
+        """ Select the anchors.
+
+        Args
+            inputs : List of [anchors[0], ..., anchors[num_levels - 1], regression, classification, other[0], other[1], ...] tensors,
+                     where anchors[i] are the anchors of pyramid level i and the other tensors contain the values of all levels.
+
+        Returns
+            List of [anchors, regression, classification, other[0], other[1], ...] for the selected anchors.
+        """
+        level_anchors = inputs[:self.num_levels]
+        values        = inputs[self.num_levels:]
+        scores        = keras.backend.max(values[1], axis=2)
+
+        # the values of the levels are concatenated in the same order as the anchors
+        indices = []
+        offset  = 0
+        for anchors in level_anchors:
+            size             = keras.backend.shape(anchors)[1]
+            _, level_indices = backend.top_k(scores[:, offset:offset + size], k=keras.backend.minimum(self.k, size))
+            indices.append(level_indices + offset)
+            offset          += size
+        indices = keras.backend.concatenate(indices, axis=1)
+
+        # the anchors are the same for every image in the batch (static anchors have a batch size of 1)
+        anchors = keras.backend.gather(keras.backend.concatenate(level_anchors, axis=1)[0], indices)
+        return [anchors] + [backend.gather_nd(value, indices[..., None], batch_dims=1) for value in values]
+
+    def compute_output_shape(self, input_shape):
+        return [(input_shape[0][0], None, 4)] + [(s[0], None) + tuple(s[2:]) for s in input_shape[self.num_levels:]]
+
+    def compute_mask(self, inputs, mask=None):
+        return (len(inputs) - self.num_levels + 1) * [None]
+
+    def get_config(self):
+        config = super(SelectTopKPerLevel, self).get_config()
+        config.update({
+            'k'          : self.k,
+            'num_levels' : self.num_levels,
+        })
+
+        return config
+
+
+class DecodeBoxes(keras.layers.Layer):
+    """ Keras layer that applies regression values to anchors and clips the boxes to the image, like RegressBoxes followed by ClipBoxes.
+
+    The boxes are decoded and clipped with whole (B, N, 4) tensor operations, without unstacking the coordinates.
+    """
+
+    def __init__(self, mean=None, std=None, image_shape=None, *args, **kwargs):
+        """ Initializer for the DecodeBoxes layer.
+
+        Args
+            mean: The mean value of the regression values which was used for normalization.
+            std: The standard value of the regression values which was used for normalization.
+            image_shape: Optional fixed (height, width) of the images. If None, the shape of the image input is used.
+        """
+        if mean is None:
+            mean = np.array([0, 0, 0, 0])
+        if std is None:
+            std = np.array([0.2, 0.2, 0.2, 0.2])
+
+        if isinstance(mean, (list, tuple)):
+            mean = np.array(mean)
+        elif not isinstance(mean, np.ndarray):
+            raise ValueError('Expected mean to be a np.ndarray, list or tuple. Received: {}'.format(type(mean)))
+
+        if isinstance(std, (list, tuple)):
+            std = np.array(std)
+        elif not isinstance(std, np.ndarray):
+            raise ValueError('Expected std to be a np.ndarray, list or tuple. Received: {}'.format(type(std)))
+
+        self.mean        = mean
+        self.std         = std
+        self.image_shape = None if image_shape is None else tuple(image_shape)
+        super(DecodeBoxes, self).__init__(*args, **kwargs)
+
+    def call(self, inputs, **kwargs):
+        """ Decode and clip the boxes.
+
+        Args
+            inputs : List of [image, anchors, regression] tensors.
+        """
+        image, anchors, regression = inputs
+
+        # the upper bound of (x1, y1, x2, y2)
+        if self.image_shape is not None:
+            height, width = self.image_shape
+            upper         = keras.backend.constant([width - 1, height - 1, width - 1, height - 1], dtype=keras.backend.floatx())
+        else:
+            shape = keras.backend.cast(keras.backend.shape(image), keras.backend.floatx())
+            if keras.backend.image_data_format() == 'channels_first':
+                size = shape[3:1:-1]
+            else:
+                size = shape[2:0:-1]
+            upper = keras.backend.concatenate([size, size]) - 1
+
+        # (width, height, width, height) of every anchor
+        sizes = anchors[:, :, 2:] - anchors[:, :, :2]
+        sizes = keras.backend.concatenate([sizes, sizes], axis=2)
+
+        mean  = keras.backend.constant(self.mean, dtype=keras.backend.floatx())
+        std   = keras.backend.constant(self.std, dtype=keras.backend.floatx())
+        boxes = anchors + (regression * std + mean) * sizes
+
+        return keras.backend.minimum(keras.backend.maximum(boxes, 0), upper)
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[2]
+
+    def get_config(self):
+        config = super(DecodeBoxes, self).get_config()
+        config.update({
+            'mean'        : self.mean.tolist(),
+            'std'         : self.std.tolist(),
+            'image_shape' : None if self.image_shape is None else list(self.image_shape),
+        })
+
+        return config
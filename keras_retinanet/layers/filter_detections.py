@@ -16,6 +16,10 @@ limitations under the License.
 
 import keras
 from .. import backend
+from ..utils.tf_version import tf_version, tf_version_ok
+
+# tf.image.non_max_suppression_padded accepts batched boxes (and sorted_input) since tensorflow 2.3.0
+BATCHED_NMS_TF_VERSION = 2, 3, 0
 
 
 def filter_detections(
@@ -112,6 +116,120 @@ def filter_detections(
     return [boxes, scores, labels] + other_
 
 
+def filter_detections_batched(
+    boxes,
+    classification,
+    other                 = [],
+    class_specific_filter = True,
+    nms                   = True,
+    score_threshold       = 0.05,
+    max_detections        = 300,
+    nms_threshold         = 0.5,
+    pre_nms_top_k         = 1000
+):
+    """ Filter the detections of a batch of images using the boxes and classification values.
+
+    Instead of filtering every class separately, the pre_nms_top_k highest scoring (anchor, class) pairs of every image are selected
+    first, and a single NMS is performed on these candidates for the whole batch. With class specific filtering, the boxes of each
+    class are offset so boxes of different classes never overlap, which makes one NMS equivalent to an NMS per class.
+
+    Args
+        boxes                 : Tensor of shape (batch_size, num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
+        classification        : Tensor of shape (batch_size, num_boxes, num_classes) containing the classification scores.
+        other                 : List of tensors of shape (batch_size, num_boxes, ...) to filter along with the boxes and classification scores.
+        class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+        nms                   : Flag to enable/disable non maximum suppression.
+        score_threshold       : Threshold used to prefilter the boxes with.
+        max_detections        : Maximum number of detections to keep.
+        nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
+        pre_nms_top_k         : Number of highest scoring candidates per image to perform NMS on.
+
+    Returns
+        A list of [boxes, scores, labels, other[0], other[1], ...], shaped like the outputs of filter_detections with a batch dimension.
+        In case there are less than max_detections detections, the tensors are padded with -1's.
+
+    Raises
+        ValueError: If the tensorflow version doesn't support batched NMS.
+    """
+    if nms and not tf_version_ok(BATCHED_NMS_TF_VERSION, []):
+        raise ValueError('Batched filtering (pre_nms_top_k) requires tensorflow {} or newer, found {}.'.format(
+            '.'.join(map(str, BATCHED_NMS_TF_VERSION)), '.'.join(map(str, tf_version()))))
+
+    batch_size  = keras.backend.shape(classification)[0]
+    num_classes = keras.backend.shape(classification)[2]
+
+    # select the highest scoring candidates of every image
+    if class_specific_filter:
+        scores = keras.backend.reshape(classification, (batch_size, -1))
+    else:
+        scores = keras.backend.max(classification, axis=2)
+
+    scores, indices = backend.top_k(scores, k=keras.backend.minimum(pre_nms_top_k, keras.backend.shape(scores)[1]))
+
+    if class_specific_filter:
+        labels  = indices % num_classes
+        indices = indices // num_classes
+    else:
+        labels  = backend.gather_nd(keras.backend.argmax(classification, axis=2), indices[..., None], batch_dims=1)
+        labels  = keras.backend.cast(labels, 'int32')
+
+    boxes = backend.gather_nd(boxes, indices[..., None], batch_dims=1)
+
+    if nms:
+        nms_boxes = boxes
+        if class_specific_filter:
+            # move the boxes of every class to a separate region, so only boxes of the same class suppress each other
+            # the boxes of an image are shifted to start at 0 first, which keeps the offsets (and the loss of precision) small
+            lower     = keras.backend.min(boxes, axis=(1, 2), keepdims=True)
+            upper     = keras.backend.max(boxes, axis=(1, 2), keepdims=True)
+            offsets   = keras.backend.cast(labels, keras.backend.floatx())[..., None] * (upper - lower + 1)
+            nms_boxes = boxes - lower + offsets
+
+        selected, num_valid = backend.non_max_suppression_padded(
+            nms_boxes,
+            scores,
+            max_output_size        = max_detections,
+            iou_threshold          = nms_threshold,
+            score_threshold        = score_threshold,
+            pad_to_max_output_size = True,
+            sorted_input           = True,
+        )
+    else:
+        # the candidates are sorted by score, so the detections are the first candidates above the threshold
+        num_candidates = keras.backend.shape(scores)[1]
+        selected       = keras.backend.minimum(backend.range(max_detections), num_candidates - 1)
+        selected       = keras.backend.tile(selected[None], (batch_size, 1))
+        num_valid      = keras.backend.sum(keras.backend.cast(keras.backend.greater(scores, score_threshold), 'int32'), axis=1)
+        num_valid      = keras.backend.minimum(num_valid, max_detections)
+
+    # filter input using the final set of indices
+    indices = backend.gather_nd(indices, selected[..., None], batch_dims=1)
+    boxes   = backend.gather_nd(boxes, selected[..., None], batch_dims=1)
+    scores  = backend.gather_nd(scores, selected[..., None], batch_dims=1)
+    labels  = backend.gather_nd(labels, selected[..., None], batch_dims=1)
+    other_  = [backend.gather_nd(o, indices[..., None], batch_dims=1) for o in other]
+
+    # pad the outputs beyond the number of detections with -1
+    valid  = keras.backend.less(backend.range(max_detections)[None], num_valid[:, None])
+    boxes  = backend.where(valid[..., None], boxes, -keras.backend.ones_like(boxes))
+    scores = backend.where(valid, scores, -keras.backend.ones_like(scores))
+    labels = backend.where(valid, keras.backend.cast(labels, 'int32'), -keras.backend.ones_like(labels, dtype='int32'))
+    for i, o in enumerate(other_):
+        mask = valid
+        for _ in range(2, len(o.shape)):
+            mask = mask[..., None]
+        other_[i] = backend.where(mask, o, -keras.backend.ones_like(o))
+
+    # set shapes, since we know what they are
+    boxes.set_shape([None, max_detections, 4])
+    scores.set_shape([None, max_detections])
+    labels.set_shape([None, max_detections])
+    for o, s in zip(other_, [list(keras.backend.int_shape(o)) for o in other]):
+        o.set_shape([None, max_detections] + s[2:])
+
+    return [boxes, scores, labels] + other_
+
+
 class FilterDetections(keras.layers.Layer):
     """ Keras layer for filtering detections using score threshold and NMS.
     """
@@ -124,6 +242,7 @@ class FilterDetections(keras.layers.Layer):
         score_threshold       = 0.05,
         max_detections        = 300,
         parallel_iterations   = 32,
+        pre_nms_top_k         = None,
         **kwargs
     ):
         """ Filters detections using score threshold, NMS and selecting the top-k detections.
@@ -135,6 +254,8 @@ class FilterDetections(keras.layers.Layer):
             score_threshold       : Threshold used to prefilter the boxes with.
             max_detections        : Maximum number of detections to keep.
             parallel_iterations   : Number of batch items to process in parallel.
+            pre_nms_top_k         : If set, filter the whole batch at once: keep the pre_nms_top_k highest scoring candidates of every image
+                                    and perform a single NMS on them (see filter_detections_batched), instead of an NMS per class per image.
         """
         self.nms                   = nms
         self.class_specific_filter = class_specific_filter
@@ -142,6 +263,7 @@ class FilterDetections(keras.layers.Layer):
         self.score_threshold       = score_threshold
         self.max_detections        = max_detections
         self.parallel_iterations   = parallel_iterations
+        self.pre_nms_top_k         = pre_nms_top_k
         super(FilterDetections, self).__init__(**kwargs)
 
     def call(self, inputs, **kwargs):
@@ -154,6 +276,19 @@ class FilterDetections(keras.layers.Layer):
         classification = inputs[1]
         other          = inputs[2:]
 
+        if self.pre_nms_top_k is not None:
+            return filter_detections_batched(
+                boxes,
+                classification,
+                other,
+                nms                   = self.nms,
+                class_specific_filter = self.class_specific_filter,
+                score_threshold       = self.score_threshold,
+                max_detections        = self.max_detections,
+                nms_threshold         = self.nms_threshold,
+                pre_nms_top_k         = self.pre_nms_top_k,
+            )
+
         # wrap nms with our parameters
         def _filter_detections(args):
             boxes          = args[0]
@@ -218,6 +353,7 @@ class FilterDetections(keras.layers.Layer):
             'score_threshold'       : self.score_threshold,
             'max_detections'        : self.max_detections,
             'parallel_iterations'   : self.parallel_iterations,
+            'pre_nms_top_k'         : self.pre_nms_top_k,
         })
 
         return config
@@ -18,6 +18,50 @@ import keras
 from . import backend
 
 
+def _focal_loss(labels, anchor_state, classification, alpha, gamma):
+    """ Compute the focal loss of classification w.r.t. the (one-hot) labels, normalized by the number of positive anchors.
+    """
+    # filter out "ignore" anchors
+    indices        = backend.where(keras.backend.not_equal(anchor_state, -1))
+    labels         = backend.gather_nd(labels, indices)
+    classification = backend.gather_nd(classification, indices)
+
+    # compute the focal loss
+    alpha_factor = keras.backend.ones_like(labels) * alpha
+    alpha_factor = backend.where(keras.backend.equal(labels, 1), alpha_factor, 1 - alpha_factor)
+    focal_weight = backend.where(keras.backend.equal(labels, 1), 1 - classification, classification)
+    focal_weight = alpha_factor * focal_weight ** gamma
+
+    cls_loss = focal_weight * keras.backend.binary_crossentropy(labels, classification)
+
+    # compute the normalizer: the number of positive anchors
+    normalizer = backend.where(keras.backend.equal(anchor_state, 1))
+    normalizer = keras.backend.cast(keras.backend.shape(normalizer)[0], keras.backend.floatx())
+    normalizer = keras.backend.maximum(keras.backend.cast_to_floatx(1.0), normalizer)
+
+    return keras.backend.sum(cls_loss) / normalizer
+
+
+def _smooth_l1_loss(regression, regression_target, sigma_squared):
+    """ Compute the smooth L1 loss of the regression of the positive anchors, normalized by the number of positive anchors.
+    """
+    # compute smooth L1 loss
+    # f(x) = 0.5 * (sigma * x)^2          if |x| < 1 / sigma / sigma
+    #        |x| - 0.5 / sigma / sigma    otherwise
+    regression_diff = regression - regression_target
+    regression_diff = keras.backend.abs(regression_diff)
+    regression_loss = backend.where(
+        keras.backend.less(regression_diff, 1.0 / sigma_squared),
+        0.5 * sigma_squared * keras.backend.pow(regression_diff, 2),
+        regression_diff - 0.5 / sigma_squared
+    )
+
+    # compute the normalizer: the number of positive anchors
+    normalizer = keras.backend.maximum(1, keras.backend.shape(regression)[0])
+    normalizer = keras.backend.cast(normalizer, dtype=keras.backend.floatx())
+    return keras.backend.sum(regression_loss) / normalizer
+
+
 def focal(alpha=0.25, gamma=2.0):
     """ Create a functor for computing the focal loss.
 
@@ -44,25 +88,7 @@ def focal(alpha=0.25, gamma=2.0):
         anchor_state   = y_true[:, :, -1]  # -1 for ignore, 0 for background, 1 for object
         classification = y_pred
 
-        # filter out "ignore" anchors
-        indices        = backend.where(keras.backend.not_equal(anchor_state, -1))
-        labels         = backend.gather_nd(labels, indices)
-        classification = backend.gather_nd(classification, indices)
-
-        # compute the focal loss
-        alpha_factor = keras.backend.ones_like(labels) * alpha
-        alpha_factor = backend.where(keras.backend.equal(labels, 1), alpha_factor, 1 - alpha_factor)
-        focal_weight = backend.where(keras.backend.equal(labels, 1), 1 - classification, classification)
-        focal_weight = alpha_factor * focal_weight ** gamma
-
-        cls_loss = focal_weight * keras.backend.binary_crossentropy(labels, classification)
-
-        # compute the normalizer: the number of positive anchors
-        normalizer = backend.where(keras.backend.equal(anchor_state, 1))
-        normalizer = keras.backend.cast(keras.backend.shape(normalizer)[0], keras.backend.floatx())
-        normalizer = keras.backend.maximum(keras.backend.cast_to_floatx(1.0), normalizer)
-
-        return keras.backend.sum(cls_loss) / normalizer
+        return _focal_loss(labels, anchor_state, classification, alpha, gamma)
 
     return _focal
 
@@ -98,20 +124,72 @@ def smooth_l1(sigma=3.0):
         regression        = backend.gather_nd(regression, indices)
         regression_target = backend.gather_nd(regression_target, indices)
 
-        # compute smooth L1 loss
-        # f(x) = 0.5 * (sigma * x)^2          if |x| < 1 / sigma / sigma
-        #        |x| - 0.5 / sigma / sigma    otherwise
-        regression_diff = regression - regression_target
-        regression_diff = keras.backend.abs(regression_diff)
-        regression_loss = backend.where(
-            keras.backend.less(regression_diff, 1.0 / sigma_squared),
-            0.5 * sigma_squared * keras.backend.pow(regression_diff, 2),
-            regression_diff - 0.5 / sigma_squared
-        )
-
-        # compute the normalizer: the number of positive anchors
-        normalizer = keras.backend.maximum(1, keras.backend.shape(indices)[0])
-        normalizer = keras.backend.cast(normalizer, dtype=keras.backend.floatx())
-        return keras.backend.sum(regression_loss) / normalizer
+        return _smooth_l1_loss(regression, regression_target, sigma_squared)
 
     return _smooth_l1
+
+
+def focal_sparse(alpha=0.25, gamma=2.0):
+    """ Create a functor for computing the focal loss with sparse targets (see utils.anchors.anchor_targets_bbox_sparse).
+
+    Args
+        alpha: Scale the focal weight with alpha.
+        gamma: Take the power of the focal weight with gamma.
+
+    Returns
+        A functor that computes the focal loss using the alpha and gamma.
+    """
+    def _focal_sparse(y_true, y_pred):
+        """ Compute the focal loss given the sparse target tensor and the predicted tensor.
+
+        Args
+            y_true: Tensor of target data from the generator with shape (B, N, 2), the label of positive anchors (-1 otherwise) and the anchor state.
+            y_pred: Tensor of predicted data from the network with shape (B, N, num_classes).
+
+        Returns
+            The focal loss of y_pred w.r.t. y_true.
+        """
+        # expand the labels to one-hot labels on the device, one_hot gives all zeros for label -1
+        labels         = keras.backend.one_hot(keras.backend.cast(y_true[:, :, 0], 'int32'), keras.backend.shape(y_pred)[2])
+        anchor_state   = y_true[:, :, 1]  # -1 for ignore, 0 for background, 1 for object
+        classification = y_pred
+
+        return _focal_loss(labels, anchor_state, classification, alpha, gamma)
+
+    return _focal_sparse
+
+
+def smooth_l1_sparse(sigma=3.0):
+    """ Create a smooth L1 loss functor for sparse targets (see utils.anchors.anchor_targets_bbox_sparse).
+
+    Args
+        sigma: This argument defines the point where the loss changes from L2 to L1.
+
+    Returns
+        A functor for computing the smooth L1 loss given target data and predicted data.
+    """
+    sigma_squared = sigma ** 2
+
+    def _smooth_l1_sparse(y_true, y_pred):
+        """ Compute the smooth L1 loss of y_pred w.r.t. y_true.
+
+        Args
+            y_true: Tensor from the generator of shape (B, M, 5), the index of a positive anchor (-1 for padding) and its regression target.
+            y_pred: Tensor from the network of shape (B, N, 4).
+
+        Returns
+            The smooth L1 loss of y_pred w.r.t. y_true.
+        """
+        # select the rows that describe a positive anchor
+        anchor_index      = y_true[:, :, 0]
+        indices           = backend.where(keras.backend.greater_equal(anchor_index, 0))
+        regression_target = backend.gather_nd(y_true[:, :, 1:], indices)
+
+        # gather the regression of the positive anchors, indexed by (batch, anchor)
+        anchor_index = keras.backend.cast(backend.gather_nd(anchor_index, indices), 'int64')
+        indices      = keras.backend.stack([indices[:, 0], anchor_index], axis=1)
+        regression   = backend.gather_nd(y_pred, indices)
+
+        return _smooth_l1_loss(regression, regression_target, sigma_squared)
+
+    return _smooth_l1_sparse
@@ -10,14 +10,19 @@ class Backbone(object):
         from .. import losses
         from .. import initializers
         self.custom_objects = {
-            'UpsampleLike'     : layers.UpsampleLike,
-            'PriorProbability' : initializers.PriorProbability,
-            'RegressBoxes'     : layers.RegressBoxes,
-            'FilterDetections' : layers.FilterDetections,
-            'Anchors'          : layers.Anchors,
-            'ClipBoxes'        : layers.ClipBoxes,
-            '_smooth_l1'       : losses.smooth_l1(),
-            '_focal'           : losses.focal(),
+            'UpsampleLike'       : layers.UpsampleLike,
+            'PriorProbability'   : initializers.PriorProbability,
+            'RegressBoxes'       : layers.RegressBoxes,
+            'FilterDetections'   : layers.FilterDetections,
+            'Anchors'            : layers.Anchors,
+            'ClipBoxes'          : layers.ClipBoxes,
+            'DecodeBoxes'        : layers.DecodeBoxes,
+            'SelectTopKPerLevel' : layers.SelectTopKPerLevel,
+            'StaticAnchors'      : layers.StaticAnchors,
+            '_smooth_l1'         : losses.smooth_l1(),
+            '_focal'             : losses.focal(),
+            '_smooth_l1_sparse'  : losses.smooth_l1_sparse(),
+            '_focal_sparse'      : losses.focal_sparse(),
         }
 
         self.backbone = backbone
@@ -88,7 +93,7 @@ def load_model(filepath, backbone_name='resnet50'):
     return keras.models.load_model(filepath, custom_objects=backbone(backbone_name).custom_objects)
 
 
-def convert_model(model, nms=True, class_specific_filter=True, anchor_params=None):
+def convert_model(model, nms=True, class_specific_filter=True, anchor_params=None, pre_nms_top_k=None, level_top_k=None, raw_outputs=False, image_shape=None):
     """ Converts a training model to an inference model.
 
     Args
@@ -96,6 +101,11 @@ def convert_model(model, nms=True, class_specific_filter=True, anchor_params=Non
         nms                   : Boolean, whether to add NMS filtering to the converted model.
         class_specific_filter : Whether to use class specific filtering or filter for the best scoring class only.
         anchor_params         : Anchor parameters object. If omitted, default values are used.
+        pre_nms_top_k         : If set, filter the detections of a batch at once, with a single NMS on the pre_nms_top_k best candidates per image.
+        level_top_k           : If set, only the level_top_k highest scoring anchors of every pyramid level are decoded and filtered.
+        raw_outputs           : If True, output the anchors and raw regression and classification values instead of detections,
+                                to compute the detections on the host with utils.postprocess.PostProcessor.
+        image_shape           : If set, the converted model only accepts images of this (height, width), and its anchors are constants.
 
     Returns
         A keras.models.Model object.
@@ -104,8 +114,10 @@ def convert_model(model, nms=True, class_specific_filter=True, anchor_params=Non
         ImportError: if h5py is not available.
         ValueError: In case of an invalid savefile.
     """
-    from .retinanet import retinanet_bbox
-    return retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, anchor_params=anchor_params)
+    from .retinanet import retinanet_bbox, retinanet_raw
+    if raw_outputs:
+        return retinanet_raw(model=model, anchor_params=anchor_params)
+    return retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, anchor_params=anchor_params, pre_nms_top_k=pre_nms_top_k, level_top_k=level_top_k, image_shape=image_shape)
 
 
 def assert_training_model(model):
@@ -207,22 +207,17 @@ def __build_pyramid(models, features):
     return [__build_model_pyramid(n, m, features) for n, m in models]
 
 
-def __build_anchors(anchor_parameters, features):
-    """ Builds anchors for the shape of the features from FPN.
+def __build_level_anchors(anchor_parameters, features):
+    """ Builds anchors for the shape of every feature map from FPN.
 
     Args
         anchor_parameters : Parameteres that determine how anchors are generated.
         features          : The FPN features.
 
     Returns
-        A tensor containing the anchors for the FPN features.
-
-        The shape is:
-        ```
-        (batch_size, num_anchors, 4)
-        ```
+        A list with a tensor containing the anchors for every feature map.
     """
-    anchors = [
+    return [
         layers.Anchors(
             size=anchor_parameters.sizes[i],
             stride=anchor_parameters.strides[i],
@@ -232,6 +227,51 @@ def __build_anchors(anchor_parameters, features):
         )(f) for i, f in enumerate(features)
     ]
 
+
+def __build_static_level_anchors(anchor_parameters, features):
+    """ Builds constant anchors for every feature map from FPN, for features with a static shape.
+
+    Args
+        anchor_parameters : Parameteres that determine how anchors are generated.
+        features          : The FPN features, with a known height and width.
+
+    Returns
+        A list with a constant tensor of shape (1, num_anchors, 4) for every feature map.
+    """
+    if keras.backend.image_data_format() == 'channels_first':
+        shapes = [keras.backend.int_shape(f)[2:4] for f in features]
+    else:
+        shapes = [keras.backend.int_shape(f)[1:3] for f in features]
+
+    return [
+        layers.StaticAnchors(
+            size=anchor_parameters.sizes[i],
+            stride=anchor_parameters.strides[i],
+            shape=shape,
+            ratios=anchor_parameters.ratios,
+            scales=anchor_parameters.scales,
+            name='anchors_{}'.format(i)
+        )(f) for i, (f, shape) in enumerate(zip(features, shapes))
+    ]
+
+
+def __build_anchors(anchor_parameters, features):
+    """ Builds anchors for the shape of the features from FPN.
+
+    Args
+        anchor_parameters : Parameteres that determine how anchors are generated.
+        features          : The FPN features.
+
+    Returns
+        A tensor containing the anchors for the FPN features.
+
+        The shape is:
+        ```
+        (batch_size, num_anchors, 4)
+        ```
+    """
+    anchors = __build_level_anchors(anchor_parameters, features)
+
     return keras.layers.Concatenate(axis=1, name='anchors')(anchors)
 
 
@@ -290,6 +330,9 @@ def retinanet_bbox(
     class_specific_filter = True,
     name                  = 'retinanet-bbox',
     anchor_params         = None,
+    pre_nms_top_k         = None,
+    level_top_k           = None,
+    image_shape           = None,
     **kwargs
 ):
     """ Construct a RetinaNet model on top of a backbone and adds convenience functions to output boxes directly.
@@ -303,6 +346,10 @@ def retinanet_bbox(
         class_specific_filter : Whether to use class specific filtering or filter for the best scoring class only.
         name                  : Name of the model.
         anchor_params         : Struct containing anchor parameters. If None, default values are used.
+        pre_nms_top_k         : If set, filter the detections of a batch at once, with a single NMS on the pre_nms_top_k best candidates per image.
+        level_top_k           : If set, only the level_top_k highest scoring anchors of every pyramid level are decoded and filtered.
+        image_shape           : If set, the model only accepts images of this (height, width),
+                                and the anchors and the image size for clipping are constants in the graph.
         *kwargs               : Additional kwargs to pass to the minimal retinanet model.
 
     Returns
@@ -326,27 +373,92 @@ def retinanet_bbox(
     else:
         assert_training_model(model)
 
-    # compute the anchors
+    inputs   = model.inputs
+    outputs  = model.outputs
     features = [model.get_layer(p_name).output for p_name in ['P3', 'P4', 'P5', 'P6', 'P7']]
-    anchors  = __build_anchors(anchor_params, features)
+
+    if image_shape is not None:
+        # apply the model to an input of a fixed shape, so the shapes of the feature maps are known
+        channels = keras.backend.int_shape(inputs[0])[1 if keras.backend.image_data_format() == 'channels_first' else -1]
+        if keras.backend.image_data_format() == 'channels_first':
+            inputs = [keras.layers.Input(shape=(channels,) + tuple(image_shape))]
+        else:
+            inputs = [keras.layers.Input(shape=tuple(image_shape) + (channels,))]
+
+        outputs  = keras.models.Model(inputs=model.inputs, outputs=model.outputs + features)(inputs)
+        features = outputs[len(model.outputs):]
+        outputs  = outputs[:len(model.outputs)]
 
     # we expect the anchors, regression and classification values as first output
-    regression     = model.outputs[0]
-    classification = model.outputs[1]
+    regression     = outputs[0]
+    classification = outputs[1]
 
     # "other" can be any additional output from custom submodels, by default this will be []
-    other = model.outputs[2:]
+    other = outputs[2:]
+
+    # compute the anchors
+    if image_shape is not None:
+        level_anchors = __build_static_level_anchors(anchor_params, features)
+    else:
+        level_anchors = __build_level_anchors(anchor_params, features)
+
+    if level_top_k is not None:
+        # select the best scoring anchors of every level, so only their boxes are decoded
+        selected = layers.SelectTopKPerLevel(k=level_top_k, num_levels=len(features), name='level_top_k')(
+            level_anchors + [regression, classification] + other
+        )
+        anchors, regression, classification, other = selected[0], selected[1], selected[2], selected[3:]
+    else:
+        anchors = keras.layers.Concatenate(axis=1, name='anchors')(level_anchors)
 
-    # apply predicted regression to anchors
-    boxes = layers.RegressBoxes(name='boxes')([anchors, regression])
-    boxes = layers.ClipBoxes(name='clipped_boxes')([model.inputs[0], boxes])
+    # apply predicted regression to anchors and clip the boxes to the image
+    boxes = layers.DecodeBoxes(image_shape=image_shape, name='clipped_boxes')([inputs[0], anchors, regression])
 
     # filter detections (apply NMS / score threshold / select top-k)
     detections = layers.FilterDetections(
         nms                   = nms,
         class_specific_filter = class_specific_filter,
+        pre_nms_top_k         = pre_nms_top_k,
         name                  = 'filtered_detections'
     )([boxes, classification] + other)
 
     # construct the model
-    return keras.models.Model(inputs=model.inputs, outputs=detections, name=name)
+    return keras.models.Model(inputs=inputs, outputs=detections, name=name)
+
+
+def retinanet_raw(
+    model         = None,
+    name          = 'retinanet-raw',
+    anchor_params = None,
+    **kwargs
+):
+    """ Construct a RetinaNet model that outputs its anchors and the raw regression and classification values.
+
+    The boxes are decoded and filtered on the host instead, with utils.postprocess.PostProcessor.
+
+    Args
+        model         : RetinaNet model to add the anchors to. If None, it will create a RetinaNet model using **kwargs.
+        name          : Name of the model.
+        anchor_params : Struct containing anchor parameters. If None, default values are used.
+        *kwargs       : Additional kwargs to pass to the minimal retinanet model.
+
+    Returns
+        A keras.models.Model which takes an image as input and outputs [anchors, regression, classification, other[0], other[1], ...].
+    """
+
+    # if no anchor parameters are passed, use default values
+    if anchor_params is None:
+        anchor_params = AnchorParameters.default
+
+    # create RetinaNet model
+    if model is None:
+        model = retinanet(num_anchors=anchor_params.num_anchors(), **kwargs)
+    else:
+        assert_training_model(model)
+
+    # compute the anchors
+    features = [model.get_layer(p_name).output for p_name in ['P3', 'P4', 'P5', 'P6', 'P7']]
+    anchors  = __build_anchors(anchor_params, features)
+
+    # construct the model
+    return keras.models.Model(inputs=model.inputs, outputs=[anchors] + model.outputs, name=name)
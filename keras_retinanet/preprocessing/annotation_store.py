@@ -0,0 +1,183 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def _cache_digest(sources, key=None):
+    """ Compute a digest identifying the state of the annotation sources.
+
+    Args
+        sources : List of paths to the files the annotations are parsed from.
+        key     : JSON serializable object with the parameters that influence parsing.
+
+    Returns
+        A hex digest of the key and the path, size and modification time of every source.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps(key, sort_keys=True).encode('utf-8'))
+    for source in sources:
+        stat = os.stat(source)
+        digest.update('{}:{}:{!r}\n'.format(os.path.abspath(source), stat.st_size, stat.st_mtime).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AnnotationStore(object):
+    """ Columnar storage of the annotations of all images in a dataset.
+
+    The labels and boxes of all images are stored in two contiguous arrays,
+    the annotations of image i are found at offsets[i]:offsets[i + 1].
+    The arrays are read-only, so the annotations returned by load_annotations can be slices of the store.
+    """
+
+    def __init__(self, labels, bboxes, offsets):
+        """ Initialize an AnnotationStore.
+
+        Args
+            labels  : (N,) array with the label of every box.
+            bboxes  : (N, 4) array with every box (x1, y1, x2, y2).
+            offsets : (num_images + 1,) array with the index of the first box of every image, followed by N.
+        """
+        self.labels  = np.ascontiguousarray(labels, dtype=np.int32).reshape(-1)
+        self.bboxes  = np.ascontiguousarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int64).reshape(-1)
+
+        if self.labels.shape[0] != self.bboxes.shape[0] or self.offsets[-1] != self.labels.shape[0]:
+            raise ValueError('inconsistent annotation store: {} labels, {} boxes and {} as last offset'.format(
+                self.labels.shape[0], self.bboxes.shape[0], self.offsets[-1]
+            ))
+
+        for array in (self.labels, self.bboxes, self.offsets):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_unsorted(cls, image_indices, labels, bboxes, num_images):
+        """ Create an AnnotationStore from annotations in arbitrary image order.
+
+        Args
+            image_indices : (N,) array with the index of the image of every box.
+            labels        : (N,) array with the label of every box.
+            bboxes        : (N, 4) array with every box (x1, y1, x2, y2).
+            num_images    : The number of images in the dataset (images without boxes are allowed).
+
+        Returns
+            An AnnotationStore, where the boxes of each image are in the same order as they were given.
+        """
+        image_indices = np.asarray(image_indices, dtype=np.int64).reshape(-1)
+        order         = np.argsort(image_indices, kind='stable')
+
+        offsets = np.zeros((num_images + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(image_indices, minlength=num_images), out=offsets[1:])
+
+        return cls(
+            np.asarray(labels).reshape(-1)[order],
+            np.asarray(bboxes).reshape(-1, 4)[order],
+            offsets
+        )
+
+    @classmethod
+    def from_annotations(cls, annotations):
+        """ Create an AnnotationStore from the annotations of every image.
+
+        Args
+            annotations : Iterable of annotation dicts (with 'labels' and 'bboxes'), one for every image.
+        """
+        labels = [np.empty((0,), dtype=np.int32)]
+        bboxes = [np.empty((0, 4), dtype=np.float32)]
+        counts = []
+        for image_annotations in annotations:
+            labels.append(np.asarray(image_annotations['labels']).reshape(-1))
+            bboxes.append(np.asarray(image_annotations['bboxes']).reshape(-1, 4))
+            counts.append(labels[-1].shape[0])
+
+        offsets = np.zeros((len(counts) + 1,), dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(np.concatenate(labels), np.concatenate(bboxes), offsets)
+
+    def save(self, path, sources, key=None, extra=None):
+        """ Save the store as a binary annotation cache.
+
+        The cache is a directory with a .npy file for every array and a metadata file that identifies the sources it was created from.
+
+        Args
+            path    : Directory to store the cache in.
+            sources : List of paths to the files the annotations were parsed from.
+            key     : JSON serializable object with the parameters that influenced parsing.
+            extra   : JSON serializable object with additional data to store (for example the image names).
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # remove the metadata first, so an interrupted save leaves an invalid cache
+        metadata_path = os.path.join(path, 'metadata.json')
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+
+        np.save(os.path.join(path, 'labels.npy'), self.labels)
+        np.save(os.path.join(path, 'bboxes.npy'), self.bboxes)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+        with open(metadata_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'digest': _cache_digest(sources, key), 'extra': extra}, f)
+
+    @classmethod
+    def load(cls, path, sources, key=None):
+        """ Load a binary annotation cache, if it is valid for the given sources.
+
+        The arrays are memory-mapped, so processes loading the same cache share its pages.
+
+        Args
+            path    : Directory the cache was stored in.
+            sources : List of paths to the files the annotations are parsed from.
+            key     : JSON serializable object with the parameters that influence parsing.
+
+        Returns
+            A tuple (store, extra) if the cache exists and matches the sources and key, None otherwise.
+        """
+        try:
+            with open(os.path.join(path, 'metadata.json'), 'r') as f:
+                metadata = json.load(f)
+
+            if metadata.get('version') != CACHE_VERSION or metadata.get('digest') != _cache_digest(sources, key):
+                return None
+
+            store = cls(
+                np.load(os.path.join(path, 'labels.npy'), mmap_mode='r'),
+                np.load(os.path.join(path, 'bboxes.npy'), mmap_mode='r'),
+                np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r'),
+            )
+        except (IOError, OSError, ValueError):
+            return None
+
+        return store, metadata.get('extra')
+
+    def size(self):
+        """ Number of images in the store.
+        """
+        return self.offsets.shape[0] - 1
+
+    def load_annotations(self, image_index):
+        """ Load the annotations of an image, as read-only views into the store.
+        """
+        start, end = self.offsets[image_index], self.offsets[image_index + 1]
+        return {'labels': self.labels[start:end], 'bboxes': self.bboxes[start:end]}
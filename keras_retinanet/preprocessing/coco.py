@@ -111,18 +111,18 @@ class CocoGenerator(Generator):
         """
         return self.coco_labels[label]
 
-    def image_path(self, image_index):
+    def resolve_image_path(self, image_index):
         """ Returns the image path for image_index.
         """
         image_info = self.coco.loadImgs(self.image_ids[image_index])[0]
         path       = os.path.join(self.data_dir, 'images', self.set_name, image_info['file_name'])
         return path
 
-    def image_aspect_ratio(self, image_index):
-        """ Compute the aspect ratio for an image with image_index.
+    def read_image_size(self, image_index):
+        """ Get the (width, height) of an image from the COCO metadata.
         """
         image = self.coco.loadImgs(self.image_ids[image_index])[0]
-        return float(image['width']) / float(image['height'])
+        return image['width'], image['height']
 
     def load_image(self, image_index):
         """ Load an image at the image_index.
@@ -130,8 +130,13 @@ class CocoGenerator(Generator):
         path  = self.image_path(image_index)
         return read_image_bgr(path)
 
-    def load_annotations(self, image_index):
-        """ Load annotations for an image_index.
+    def annotation_sources(self):
+        """ Get the paths of the files the annotations are parsed from.
+        """
+        return [os.path.join(self.data_dir, 'annotations', 'instances_' + self.set_name + '.json')]
+
+    def parse_annotations(self, image_index):
+        """ Parse annotations for an image_index.
         """
         # get ground truth annotations
         annotations_ids = self.coco.getAnnIds(imgIds=self.image_ids[image_index], iscrowd=False)
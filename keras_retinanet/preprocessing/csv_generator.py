@@ -15,13 +15,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from .annotation_store import AnnotationStore
 from .generator import Generator
 from ..utils.image import read_image_bgr
 
 import numpy as np
-from PIL import Image
 from six import raise_from
 
+import array
 import csv
 import sys
 import os.path
@@ -61,10 +62,12 @@ def _read_classes(csv_reader):
     return result
 
 
-def _read_annotations(csv_reader, classes):
-    """ Read annotations from the csv_reader.
+def _iter_annotations(csv_reader, classes):
+    """ Parse and validate the annotations from the csv_reader.
+
+    Yields a tuple (img_file, annotation) for every row, where annotation is None for an image without annotations
+    and a tuple (x1, y1, x2, y2, class_name) otherwise.
     """
-    result = OrderedDict()
     for line, row in enumerate(csv_reader):
         line += 1
 
@@ -73,11 +76,9 @@ def _read_annotations(csv_reader, classes):
         except ValueError:
             raise_from(ValueError('line {}: format should be \'img_file,x1,y1,x2,y2,class_name\' or \'img_file,,,,,\''.format(line)), None)
 
-        if img_file not in result:
-            result[img_file] = []
-
         # If a row contains only an image path, it's an image without annotations.
         if (x1, y1, x2, y2, class_name) == ('', '', '', '', ''):
+            yield img_file, None
             continue
 
         x1 = _parse(x1, int, 'line {}: malformed x1: {{}}'.format(line))
@@ -95,10 +96,54 @@ def _read_annotations(csv_reader, classes):
         if class_name not in classes:
             raise ValueError('line {}: unknown class name: \'{}\' (classes: {})'.format(line, class_name, classes))
 
-        result[img_file].append({'x1': x1, 'x2': x2, 'y1': y1, 'y2': y2, 'class': class_name})
+        yield img_file, (x1, y1, x2, y2, class_name)
+
+
+def _read_annotations(csv_reader, classes):
+    """ Read annotations from the csv_reader.
+    """
+    result = OrderedDict()
+    for img_file, annotation in _iter_annotations(csv_reader, classes):
+        if img_file not in result:
+            result[img_file] = []
+
+        if annotation is not None:
+            x1, y1, x2, y2, class_name = annotation
+            result[img_file].append({'x1': x1, 'x2': x2, 'y1': y1, 'y2': y2, 'class': class_name})
     return result
 
 
+def _read_annotation_store(csv_reader, classes):
+    """ Read annotations from the csv_reader into an AnnotationStore.
+
+    The annotations are accumulated in compact typed arrays instead of per box Python objects.
+
+    Returns
+        A tuple (image_names, store), where image_names lists the images in order of first appearance.
+    """
+    image_indices = OrderedDict()
+    box_images    = array.array('q')
+    labels        = array.array('i')
+    bboxes        = array.array('f')
+
+    for img_file, annotation in _iter_annotations(csv_reader, classes):
+        image_index = image_indices.setdefault(img_file, len(image_indices))
+
+        if annotation is not None:
+            x1, y1, x2, y2, class_name = annotation
+            box_images.append(image_index)
+            labels.append(classes[class_name])
+            bboxes.extend((x1, y1, x2, y2))
+
+    store = AnnotationStore.from_unsorted(
+        np.frombuffer(box_images, dtype=np.int64),
+        np.frombuffer(labels, dtype=np.int32),
+        np.frombuffer(bboxes, dtype=np.float32),
+        len(image_indices)
+    )
+    return list(image_indices.keys()), store
+
+
 def _open_for_csv(path):
     """ Open a file with flags suitable for csv.reader.
 
@@ -132,7 +177,6 @@ class CSVGenerator(Generator):
             base_dir: Directory w.r.t. where the files are to be searched (defaults to the directory containing the csv_data_file).
         """
         self.image_names = []
-        self.image_data  = {}
         self.base_dir    = base_dir
 
         # Take base_dir from annotations file if not explicitly specified.
@@ -150,13 +194,25 @@ class CSVGenerator(Generator):
         for key, value in self.classes.items():
             self.labels[value] = key
 
-        # csv with img_path, x1, y1, x2, y2, class_name
-        try:
-            with _open_for_csv(csv_data_file) as file:
-                self.image_data = _read_annotations(csv.reader(file, delimiter=','), self.classes)
-        except ValueError as e:
-            raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
-        self.image_names = list(self.image_data.keys())
+        # load the annotations from the binary annotation cache, if it is valid
+        self.csv_files        = [csv_data_file, csv_class_file]
+        annotation_store_path = kwargs.get('annotation_store_path')
+        cached                = None
+        if annotation_store_path is not None:
+            cached = AnnotationStore.load(annotation_store_path, self.csv_files)
+
+        if cached is not None:
+            self.annotation_store, self.image_names = cached
+        else:
+            # csv with img_path, x1, y1, x2, y2, class_name
+            try:
+                with _open_for_csv(csv_data_file) as file:
+                    self.image_names, self.annotation_store = _read_annotation_store(csv.reader(file, delimiter=','), self.classes)
+            except ValueError as e:
+                raise_from(ValueError('invalid CSV annotations file: {}: {}'.format(csv_data_file, e)), None)
+
+            if annotation_store_path is not None:
+                self.annotation_store.save(annotation_store_path, self.csv_files, extra=self.image_names)
 
         super(CSVGenerator, self).__init__(**kwargs)
 
@@ -190,36 +246,32 @@ class CSVGenerator(Generator):
         """
         return self.labels[label]
 
-    def image_path(self, image_index):
+    def resolve_image_path(self, image_index):
         """ Returns the image path for image_index.
         """
         return os.path.join(self.base_dir, self.image_names[image_index])
 
-    def image_aspect_ratio(self, image_index):
-        """ Compute the aspect ratio for an image with image_index.
-        """
-        # PIL is fast for metadata
-        image = Image.open(self.image_path(image_index))
-        return float(image.width) / float(image.height)
-
     def load_image(self, image_index):
         """ Load an image at the image_index.
         """
         return read_image_bgr(self.image_path(image_index))
 
-    def load_annotations(self, image_index):
-        """ Load annotations for an image_index.
+    def annotation_sources(self):
+        """ Get the paths of the files the annotations are parsed from.
+        """
+        return self.csv_files
+
+    @property
+    def image_data(self):
+        """ The annotations of every image as {image_name: [{'x1': x1, 'x2': x2, 'y1': y1, 'y2': y2, 'class': class_name}, ...]}.
+
+        This is a read-only view for backwards compatibility, it is rebuilt from the annotation store on every access.
         """
-        path        = self.image_names[image_index]
-        annotations = {'labels': np.empty((0,)), 'bboxes': np.empty((0, 4))}
-
-        for idx, annot in enumerate(self.image_data[path]):
-            annotations['labels'] = np.concatenate((annotations['labels'], [self.name_to_label(annot['class'])]))
-            annotations['bboxes'] = np.concatenate((annotations['bboxes'], [[
-                float(annot['x1']),
-                float(annot['y1']),
-                float(annot['x2']),
-                float(annot['y2']),
-            ]]))
-
-        return annotations
+        result = OrderedDict()
+        for image_index, image_name in enumerate(self.image_names):
+            annotations = self.annotation_store.load_annotations(image_index)
+            result[image_name] = [
+                {'x1': int(x1), 'x2': int(x2), 'y1': int(y1), 'y2': int(y2), 'class': self.labels[int(label)]}
+                for (x1, y1, x2, y2), label in zip(annotations['bboxes'], annotations['labels'])
+            ]
+        return result
@@ -19,10 +19,15 @@ import random
 import warnings
 
 import keras
+from PIL import Image
 
+from .annotation_store import AnnotationStore
+from .image_cache import ImageCache
+from .image_metadata import ImageMetadata
 from ..utils.anchors import (
+    AnchorCache,
     anchor_targets_bbox,
-    anchors_for_shape,
+    anchor_targets_bbox_sparse,
     guess_shapes
 )
 from ..utils.config import parse_anchor_parameters
@@ -30,16 +35,28 @@ from ..utils.image import (
     TransformParameters,
     adjust_transform_for_image,
     apply_transform,
+    compute_image_batch,
+    compute_resize_scale,
     preprocess_image,
+    read_image_bgr_reduced,
     resize_image,
 )
-from ..utils.transform import transform_aabb
+from ..utils.transform import scaling, transform_aabbs
 
 
 class Generator(keras.utils.Sequence):
     """ Abstract generator class.
     """
 
+    # when set, load_annotations returns the annotations from this AnnotationStore
+    annotation_store = None
+
+    # when set, image_path and image_aspect_ratio are answered from this ImageMetadata index
+    image_metadata = None
+
+    # when set, images are loaded already resized from this ImageCache
+    image_cache = None
+
     def __init__(
         self,
         transform_generator = None,
@@ -54,7 +71,14 @@ class Generator(keras.utils.Sequence):
         compute_anchor_targets=anchor_targets_bbox,
         compute_shapes=guess_shapes,
         preprocess_image=preprocess_image,
-        config=None
+        config=None,
+        anchor_cache=None,
+        resize_before_augment=False,
+        annotation_store_path=None,
+        image_metadata_path=None,
+        image_metadata_workers=8,
+        image_cache_path=None,
+        reduced_decode=False
     ):
         """ Initialize Generator object.
 
@@ -70,6 +94,15 @@ class Generator(keras.utils.Sequence):
             compute_anchor_targets : Function handler for computing the targets of anchors for an image and its annotations.
             compute_shapes         : Function handler for computing the shapes of the pyramid for a given input.
             preprocess_image       : Function handler for preprocessing an image (scaling / normalizing) for passing through a network.
+            anchor_cache           : The AnchorCache used to store generated anchors (defaults to AnchorCache.default, which is shared by all generators).
+            resize_before_augment  : If True, the resize is composed into the random transformation so that a single warp produces the resized image,
+                                     and visual effects are applied to the resized image. This is faster for large images, but not bit-identical.
+            annotation_store_path  : If set, the annotations of all images are loaded from (or parsed once and saved to) a binary annotation cache in this directory.
+            image_metadata_path    : If set, the paths and sizes of all images are loaded from (or read once and saved to) an image metadata index in this file.
+            image_metadata_workers : Number of threads used to read the image sizes when (re)building the image metadata index.
+            image_cache_path       : If set, images are loaded from the (pre-decoded and pre-resized) image cache in this directory, see write_image_cache.
+            reduced_decode         : If True, JPEG images that are downscaled by at least a factor 2 are decoded at a reduced resolution (see read_image_bgr_reduced).
+                                     This is faster, but not bit-identical. It requires image_path to point to a file that load_image would read.
         """
         self.transform_generator    = transform_generator
         self.visual_effect_generator = visual_effect_generator
@@ -84,6 +117,26 @@ class Generator(keras.utils.Sequence):
         self.compute_shapes         = compute_shapes
         self.preprocess_image       = preprocess_image
         self.config                 = config
+        self.anchor_cache           = anchor_cache or AnchorCache.default
+        self.resize_before_augment  = resize_before_augment
+        self.reduced_decode         = reduced_decode and not no_resize
+
+        # parse the anchor parameters once, instead of for every batch
+        self.anchor_params = None
+        if self.config and 'anchor_parameters' in self.config:
+            self.anchor_params = parse_anchor_parameters(self.config)
+
+        # load the annotations from a binary annotation cache, unless the subclass already created a store
+        if annotation_store_path is not None and self.annotation_store is None:
+            self.annotation_store = self.load_annotation_store(annotation_store_path)
+
+        # load the image paths and sizes from an image metadata index, so grouping by aspect ratio doesn't open every image
+        if image_metadata_path is not None:
+            self.image_metadata = self.load_image_metadata(image_metadata_path, workers=image_metadata_workers)
+
+        # load the images from an image cache, so they don't need to be decoded and resized every epoch
+        if image_cache_path is not None:
+            self.image_cache = self.load_image_cache(image_cache_path)
 
         # Define groups
         self.group_images()
@@ -96,6 +149,11 @@ class Generator(keras.utils.Sequence):
         if self.shuffle_groups:
             random.shuffle(self.groups)
 
+    def init_worker(self, worker_id, num_workers):
+        """ Prepare the generator for computing batches in one of num_workers worker processes (see MultiprocessLoader).
+        """
+        pass
+
     def size(self):
         """ Size of the dataset.
         """
@@ -129,22 +187,144 @@ class Generator(keras.utils.Sequence):
     def image_aspect_ratio(self, image_index):
         """ Compute the aspect ratio for an image with image_index.
         """
-        raise NotImplementedError('image_aspect_ratio method not implemented')
+        width, height = self.image_size(image_index)
+        return float(width) / float(height)
+
+    def image_size(self, image_index):
+        """ Get the (width, height) of an image, from the image metadata index if the generator has one.
+        """
+        if self.image_metadata is not None:
+            return self.image_metadata.image_size(image_index)
+
+        return self.read_image_size(image_index)
+
+    def read_image_size(self, image_index):
+        """ Read the (width, height) of an image from the dataset.
+        """
+        # PIL is fast for metadata, it only reads the header of the image
+        with Image.open(self.resolve_image_path(image_index)) as image:
+            return image.width, image.height
 
     def image_path(self, image_index):
-        """ Get the path to an image.
+        """ Get the path to an image, from the image metadata index if the generator has one.
+        """
+        if self.image_metadata is not None:
+            return self.image_metadata.paths[image_index]
+
+        return self.resolve_image_path(image_index)
+
+    def resolve_image_path(self, image_index):
+        """ Compute the path to an image from the dataset.
+        """
+        raise NotImplementedError('resolve_image_path method not implemented')
+
+    def load_image_metadata(self, path, workers=8):
+        """ Create an ImageMetadata index with the paths and sizes of all images.
+
+        An existing index in path is reused for all images whose file did not change, the index is saved again if it changed.
         """
-        raise NotImplementedError('image_path method not implemented')
+        previous = ImageMetadata.load(path)
+        paths    = [self.resolve_image_path(image_index) for image_index in range(self.size())]
+        metadata = ImageMetadata.build(paths, self.read_image_size, workers=workers, previous=previous)
+
+        if not metadata.same_as(previous):
+            metadata.save(path)
+
+        return metadata
 
     def load_image(self, image_index):
         """ Load an image at the image_index.
         """
         raise NotImplementedError('load_image method not implemented')
 
+    def image_cache_parameters(self):
+        """ Get the parameters that determine the images stored in an image cache.
+        """
+        return {'image_min_side': self.image_min_side, 'image_max_side': self.image_max_side, 'no_resize': self.no_resize}
+
+    def load_image_cache(self, path):
+        """ Open an ImageCache and verify that it contains the images of this generator, resized with the same parameters.
+        """
+        image_cache = ImageCache(path)
+
+        parameters = self.image_cache_parameters()
+        cached     = dict((key, image_cache.metadata.get(key)) for key in parameters)
+        if cached != parameters:
+            raise ValueError('image cache {} was created with {}, but the generator uses {}'.format(path, cached, parameters))
+
+        if image_cache.paths != [self.image_path(image_index) for image_index in range(self.size())]:
+            raise ValueError('image cache {} does not contain the images of this generator'.format(path))
+
+        return image_cache
+
+    def load_resized_image(self, image_index):
+        """ Load an image at the image_index, resized using image_min_side and image_max_side.
+
+        With an image cache, the image is a read-only view into the cache.
+
+        Returns
+            A tuple (image, scale).
+        """
+        if self.image_cache is not None:
+            return self.image_cache.load_image(image_index), self.image_cache.scale(image_index)
+
+        if self.reduced_decode:
+            image, decode_scale = self.load_reduced_image(image_index)
+            image, image_scale  = self.resize_image(image)
+            return image, image_scale * decode_scale
+
+        return self.resize_image(self.load_image(image_index))
+
+    def load_reduced_image(self, image_index):
+        """ Load an image at the image_index, decoded at a reduced resolution if it is going to be downscaled by at least a factor 2.
+
+        Returns
+            A tuple (image, scale), where scale is the size of the decoded image relative to the full resolution image.
+        """
+        return read_image_bgr_reduced(self.image_path(image_index), min_side=self.image_min_side, max_side=self.image_max_side)
+
     def load_annotations(self, image_index):
         """ Load annotations for an image_index.
+
+        If the generator has an annotation store, the annotations are read-only views into the store.
+        """
+        if self.annotation_store is not None:
+            return self.annotation_store.load_annotations(image_index)
+
+        return self.parse_annotations(image_index)
+
+    def parse_annotations(self, image_index):
+        """ Parse the annotations for an image_index from the dataset.
+        """
+        raise NotImplementedError('parse_annotations method not implemented')
+
+    def annotation_sources(self):
+        """ Get the paths of the files the annotations are parsed from (used to validate the binary annotation cache).
+        """
+        raise NotImplementedError('annotation_sources method not implemented')
+
+    def annotation_cache_key(self):
+        """ Get the (JSON serializable) parameters that influence parsing the annotations (used to validate the binary annotation cache).
+        """
+        return None
+
+    def load_annotation_store(self, path=None):
+        """ Create an AnnotationStore with the annotations of all images.
+
+        If path is given and contains a valid binary annotation cache, the store is loaded from it.
+        Otherwise the annotations of all images are parsed, and saved to path if it is given.
         """
-        raise NotImplementedError('load_annotations method not implemented')
+        if path is not None:
+            cached = AnnotationStore.load(path, self.annotation_sources(), self.annotation_cache_key())
+            if cached is not None:
+                return cached[0]
+
+        store = AnnotationStore.from_annotations(self.parse_annotations(image_index) for image_index in range(self.size()))
+
+        if path is not None:
+            store.save(path, self.annotation_sources(), self.annotation_cache_key())
+
+        return store
 
     def load_annotations_group(self, group):
         """ Load annotations for all images in group.
@@ -189,6 +369,30 @@ class Generator(keras.utils.Sequence):
         """
         return [self.load_image(image_index) for image_index in group]
 
+    def load_reduced_group(self, group):
+        """ Load images at a reduced resolution for all images in a group, with their annotations scaled accordingly.
+        """
+        image_group       = []
+        annotations_group = self.load_annotations_group(group)
+        for image_index, annotations in zip(group, annotations_group):
+            image, decode_scale   = self.load_reduced_image(image_index)
+            annotations['bboxes'] = annotations['bboxes'] * decode_scale
+            image_group.append(image)
+
+        return image_group, annotations_group
+
+    def load_resized_group(self, group):
+        """ Load resized images for all images in a group, with their annotations scaled accordingly.
+        """
+        image_group       = []
+        annotations_group = self.load_annotations_group(group)
+        for image_index, annotations in zip(group, annotations_group):
+            image, image_scale    = self.load_resized_image(image_index)
+            annotations['bboxes'] = annotations['bboxes'] * image_scale
+            image_group.append(image)
+
+        return image_group, annotations_group
+
     def random_visual_effect_group_entry(self, image, annotations):
         """ Randomly transforms image and annotation.
         """
@@ -226,9 +430,7 @@ class Generator(keras.utils.Sequence):
             image = apply_transform(transform, image, self.transform_parameters)
 
             # Transform the bounding boxes in the annotations.
-            annotations['bboxes'] = annotations['bboxes'].copy()
-            for index in range(annotations['bboxes'].shape[0]):
-                annotations['bboxes'][index, :] = transform_aabb(transform, annotations['bboxes'][index, :])
+            annotations['bboxes'] = transform_aabbs(transform, annotations['bboxes']).astype(annotations['bboxes'].dtype)
 
         return image, annotations
 
@@ -244,6 +446,47 @@ class Generator(keras.utils.Sequence):
 
         return image_group, annotations_group
 
+    def resize_transform_group_entry(self, image, annotations, transform=None):
+        """ Resize and randomly transform image and annotations using a single warp.
+
+        This is equivalent to random_transform_group_entry followed by preprocess_group_entry,
+        except that the resize is composed into the transformation, so only the pixels of the resized image are computed.
+        """
+        if transform is None and self.transform_generator:
+            transform = adjust_transform_for_image(next(self.transform_generator), image, self.transform_parameters.relative_translation)
+
+        # without transformation, a regular resize is sufficient
+        if transform is None:
+            return self.preprocess_group_entry(image, annotations)
+
+        if self.no_resize:
+            image_scale = 1
+        else:
+            image_scale = compute_resize_scale(image.shape, min_side=self.image_min_side, max_side=self.image_max_side)
+
+        # scale the output of the transformation, giving the same image size as cv2.resize
+        transform    = np.dot(scaling((image_scale, image_scale)), transform)
+        output_shape = (int(round(image.shape[0] * image_scale)), int(round(image.shape[1] * image_scale)))
+
+        # apply transformation to image
+        image = apply_transform(transform, image, self.transform_parameters, output_shape=output_shape)
+
+        # Transform the bounding boxes in the annotations.
+        annotations['bboxes'] = transform_aabbs(transform, annotations['bboxes']).astype(annotations['bboxes'].dtype)
+
+        return image, annotations
+
+    def resize_transform_group(self, image_group, annotations_group):
+        """ Resize and randomly transform each image and its annotations.
+        """
+        assert(len(image_group) == len(annotations_group))
+
+        for index in range(len(image_group)):
+            # resize and transform a single group entry
+            image_group[index], annotations_group[index] = self.resize_transform_group_entry(image_group[index], annotations_group[index])
+
+        return image_group, annotations_group
+
     def resize_image(self, image):
         """ Resize an image using image_min_side and image_max_side.
         """
@@ -253,19 +496,15 @@ class Generator(keras.utils.Sequence):
             return resize_image(image, min_side=self.image_min_side, max_side=self.image_max_side)
 
     def preprocess_group_entry(self, image, annotations):
-        """ Preprocess image and its annotations.
-        """
-        # preprocess the image
-        image = self.preprocess_image(image)
+        """ Resize image and its annotations.
 
+        The image itself is preprocessed (scaled / normalized) in compute_inputs, after resizing.
+        """
         # resize image
         image, image_scale = self.resize_image(image)
 
         # apply resizing to annotations too
-        annotations['bboxes'] *= image_scale
-
-        # convert to the wanted keras floatx
-        image = keras.backend.cast_to_floatx(image)
+        annotations['bboxes'] = annotations['bboxes'] * image_scale
 
         return image, annotations
 
@@ -295,16 +534,10 @@ class Generator(keras.utils.Sequence):
 
     def compute_inputs(self, image_group):
         """ Compute inputs for the network using an image_group.
-        """
-        # get the max image shape
-        max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
-
-        # construct an image batch object
-        image_batch = np.zeros((self.batch_size,) + max_shape, dtype=keras.backend.floatx())
 
-        # copy all images to the upper left part of the image batch object
-        for image_index, image in enumerate(image_group):
-            image_batch[image_index, :image.shape[0], :image.shape[1], :image.shape[2]] = image
+        The (resized) images are preprocessed while they are copied into the batch.
+        """
+        image_batch = compute_image_batch(image_group, self.preprocess_image, batch_size=self.batch_size, dtype=keras.backend.floatx())
 
         if keras.backend.image_data_format() == 'channels_first':
             image_batch = image_batch.transpose((0, 3, 1, 2))
@@ -312,10 +545,14 @@ class Generator(keras.utils.Sequence):
         return image_batch
 
     def generate_anchors(self, image_shape):
-        anchor_params = None
-        if self.config and 'anchor_parameters' in self.config:
-            anchor_params = parse_anchor_parameters(self.config)
-        return anchors_for_shape(image_shape, anchor_params=anchor_params, shapes_callback=self.compute_shapes)
+        """ Generate (or fetch from the anchor cache) the anchors for a given image shape.
+        """
+        return self.anchor_cache.get(image_shape, anchor_params=self.anchor_params, shapes_callback=self.compute_shapes)
+
+    def generate_anchor_grid(self, image_shape):
+        """ Generate (or fetch from the anchor cache) the layout of the anchors for a given image shape.
+        """
+        return self.anchor_cache.get_grid(image_shape, anchor_params=self.anchor_params, shapes_callback=self.compute_shapes)
 
     def compute_targets(self, image_group, annotations_group):
         """ Compute target outputs for the network using images and their annotations.
@@ -324,11 +561,17 @@ class Generator(keras.utils.Sequence):
         max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
         anchors   = self.generate_anchors(max_shape)
 
+        # the default target computation can use the anchor layout to only visit anchors near each annotation
+        kwargs = {}
+        if self.compute_anchor_targets in (anchor_targets_bbox, anchor_targets_bbox_sparse):
+            kwargs['anchor_grid'] = self.generate_anchor_grid(max_shape)
+
         batches = self.compute_anchor_targets(
             anchors,
             image_group,
             annotations_group,
-            self.num_classes()
+            self.num_classes(),
+            **kwargs
         )
 
         return list(batches)
@@ -337,20 +580,36 @@ class Generator(keras.utils.Sequence):
         """ Compute inputs and target outputs for the network.
         """
         # load images and annotations
-        image_group       = self.load_image_group(group)
-        annotations_group = self.load_annotations_group(group)
+        if self.image_cache is not None:
+            image_group, annotations_group = self.load_resized_group(group)
+        elif self.reduced_decode:
+            image_group, annotations_group = self.load_reduced_group(group)
+        else:
+            image_group       = self.load_image_group(group)
+            annotations_group = self.load_annotations_group(group)
 
         # check validity of annotations
         image_group, annotations_group = self.filter_annotations(image_group, annotations_group, group)
 
-        # randomly apply visual effect
-        image_group, annotations_group = self.random_visual_effect_group(image_group, annotations_group)
+        if self.image_cache is not None:
+            # the cached images are already resized, so they are augmented at the resized resolution
+            image_group, annotations_group = self.random_visual_effect_group(image_group, annotations_group)
+            image_group, annotations_group = self.random_transform_group(image_group, annotations_group)
+        elif self.resize_before_augment:
+            # resize and randomly transform data in a single step
+            image_group, annotations_group = self.resize_transform_group(image_group, annotations_group)
+
+            # randomly apply visual effect on the resized images
+            image_group, annotations_group = self.random_visual_effect_group(image_group, annotations_group)
+        else:
+            # randomly apply visual effect
+            image_group, annotations_group = self.random_visual_effect_group(image_group, annotations_group)
 
-        # randomly transform data
-        image_group, annotations_group = self.random_transform_group(image_group, annotations_group)
+            # randomly transform data
+            image_group, annotations_group = self.random_transform_group(image_group, annotations_group)
 
-        # perform preprocessing steps
-        image_group, annotations_group = self.preprocess_group(image_group, annotations_group)
+            # perform preprocessing steps
+            image_group, annotations_group = self.preprocess_group(image_group, annotations_group)
 
         # compute network inputs
         inputs = self.compute_inputs(image_group)
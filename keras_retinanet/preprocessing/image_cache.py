@@ -0,0 +1,186 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import json
+import os
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def _shard_path(path, shard):
+    return os.path.join(path, 'shard_{:05d}.bin'.format(shard))
+
+
+class ImageCache(object):
+    """ Cache of decoded and resized images, stored in large memory-mapped uint8 shards.
+
+    Loading an image from the cache is a (read-only) slice of a shard, so no decoding or resizing is done during training.
+    Use ImageCacheWriter or write_image_cache (or the retinanet-build-image-cache tool) to create a cache.
+    """
+
+    def __init__(self, path):
+        """ Open an image cache.
+
+        Args
+            path : Directory the cache was written to.
+        """
+        with open(os.path.join(path, 'metadata.json'), 'r') as f:
+            self.metadata = json.load(f)
+
+        if self.metadata.get('version') != CACHE_VERSION:
+            raise ValueError('unsupported image cache version {} in {}, expected {}'.format(self.metadata.get('version'), path, CACHE_VERSION))
+
+        with np.load(os.path.join(path, 'index.npz'), allow_pickle=False) as index:
+            self.paths   = index['paths'].tolist()
+            self.shards  = index['shards']
+            self.offsets = index['offsets']
+            self.shapes  = index['shapes']
+            self.scales  = index['scales']
+
+        self.path        = path
+        self.shard_files = [np.memmap(_shard_path(path, shard), dtype=np.uint8, mode='r') for shard in range(self.metadata['num_shards'])]
+
+    def size(self):
+        """ Number of images in the cache.
+        """
+        return len(self.paths)
+
+    def load_image(self, image_index):
+        """ Load an image from the cache, as a read-only view into its shard.
+        """
+        shape  = self.shapes[image_index]
+        offset = self.offsets[image_index]
+        return self.shard_files[self.shards[image_index]][offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def scale(self, image_index):
+        """ The scale with which an image was resized before it was stored in the cache.
+        """
+        return float(self.scales[image_index])
+
+
+class ImageCacheWriter(object):
+    """ Write images to an ImageCache, filling shards of (approximately) shard_size bytes.
+    """
+
+    def __init__(self, path, shard_size=1 << 30):
+        """ Initialize an ImageCacheWriter.
+
+        Args
+            path       : Directory to write the cache to.
+            shard_size : The size in bytes after which a new shard is started.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # remove the metadata first, so an interrupted write leaves an invalid cache
+        if os.path.exists(os.path.join(path, 'metadata.json')):
+            os.remove(os.path.join(path, 'metadata.json'))
+
+        self.path       = path
+        self.shard_size = shard_size
+        self.paths      = []
+        self.shards     = []
+        self.offsets    = []
+        self.shapes     = []
+        self.scales     = []
+        self.num_shards = 0
+        self.shard_file = None
+        self.offset     = 0
+
+    def add(self, path, image, scale):
+        """ Append an image to the cache.
+
+        Args
+            path  : Path of the original image.
+            image : The resized image, with dtype uint8 and shape (height, width, channels).
+            scale : The scale with which the image was resized.
+        """
+        if image.dtype != np.uint8 or image.ndim != 3:
+            raise ValueError('expected a uint8 image with shape (height, width, channels), got {} with shape {}'.format(image.dtype, image.shape))
+
+        if self.shard_file is None or (self.offset > 0 and self.offset + image.nbytes > self.shard_size):
+            self._next_shard()
+
+        self.paths.append(path)
+        self.shards.append(self.num_shards - 1)
+        self.offsets.append(self.offset)
+        self.shapes.append(image.shape)
+        self.scales.append(scale)
+
+        self.shard_file.write(np.ascontiguousarray(image).tobytes())
+        self.offset += image.nbytes
+
+    def close(self, **metadata):
+        """ Finish the cache by writing the index and the metadata.
+
+        Args
+            metadata : JSON serializable parameters that were used to create the images (for example min_side and max_side).
+        """
+        if self.shard_file is not None:
+            self.shard_file.close()
+            self.shard_file = None
+
+        np.savez(
+            os.path.join(self.path, 'index.npz'),
+            paths   = np.array(self.paths, dtype=np.str_),
+            shards  = np.array(self.shards, dtype=np.int32),
+            offsets = np.array(self.offsets, dtype=np.int64),
+            shapes  = np.array(self.shapes, dtype=np.int32).reshape(-1, 3),
+            scales  = np.array(self.scales, dtype=np.float64),
+        )
+
+        metadata.update({'version': CACHE_VERSION, 'num_shards': self.num_shards})
+        with open(os.path.join(self.path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+
+    def _next_shard(self):
+        if self.shard_file is not None:
+            self.shard_file.close()
+
+        self.shard_file  = open(_shard_path(self.path, self.num_shards), 'wb')
+        self.offset      = 0
+        self.num_shards += 1
+
+
+def write_image_cache(generator, path, shard_size=1 << 30, workers=4):
+    """ Decode and resize all images of a generator and write them to an ImageCache.
+
+    Args
+        generator  : The generator with the images to cache, images are resized using its image_min_side and image_max_side.
+        path       : Directory to write the cache to.
+        shard_size : The size in bytes after which a new shard is started.
+        workers    : Number of threads used to decode and resize the images.
+    """
+    def load_resized_image(image_index):
+        return generator.resize_image(generator.load_image(image_index))
+
+    writer  = ImageCacheWriter(path, shard_size=shard_size)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for image_index in range(generator.size()):
+            # keep a bounded number of images in flight, so the dataset is never held in memory
+            pending.append(executor.submit(load_resized_image, image_index))
+            if len(pending) > 2 * workers:
+                writer.add(generator.image_path(image_index - len(pending) + 1), *pending.popleft().result())
+
+        while pending:
+            writer.add(generator.image_path(generator.size() - len(pending)), *pending.popleft().result())
+
+    writer.close(**generator.image_cache_parameters())
@@ -0,0 +1,147 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+METADATA_VERSION = 1
+
+
+class ImageMetadata(object):
+    """ Index with the path, width, height, file size and modification time of every image in a dataset.
+
+    Reading the size of an image requires opening the file, which is slow for large datasets on network storage.
+    The index is built once using a thread pool, saved to disk and reused (and incrementally updated) in later runs.
+    """
+
+    def __init__(self, paths, widths, heights, file_sizes, mtimes):
+        """ Initialize an ImageMetadata index.
+
+        Args
+            paths      : List of paths to the images.
+            widths     : (num_images,) array with the width of every image.
+            heights    : (num_images,) array with the height of every image.
+            file_sizes : (num_images,) array with the size in bytes of every image file.
+            mtimes     : (num_images,) array with the modification time of every image file.
+        """
+        self.paths      = list(paths)
+        self.widths     = np.asarray(widths, dtype=np.int32).reshape(-1)
+        self.heights    = np.asarray(heights, dtype=np.int32).reshape(-1)
+        self.file_sizes = np.asarray(file_sizes, dtype=np.int64).reshape(-1)
+        self.mtimes     = np.asarray(mtimes, dtype=np.float64).reshape(-1)
+
+        if not (len(self.paths) == self.widths.shape[0] == self.heights.shape[0] == self.file_sizes.shape[0] == self.mtimes.shape[0]):
+            raise ValueError('inconsistent image metadata: {} paths, {} widths, {} heights, {} file sizes and {} mtimes'.format(
+                len(self.paths), self.widths.shape[0], self.heights.shape[0], self.file_sizes.shape[0], self.mtimes.shape[0]
+            ))
+
+    @classmethod
+    def build(cls, paths, read_image_size, workers=8, previous=None):
+        """ Build an index for a list of images.
+
+        Args
+            paths           : List of paths to the images.
+            read_image_size : Function that returns (width, height) for the image at an index in paths.
+            workers         : Number of threads used to stat the files and read the image sizes.
+            previous        : ImageMetadata from an earlier run, entries of unchanged files are reused from it.
+
+        Returns
+            An ImageMetadata for the given paths.
+        """
+        previous_index = {}
+        if previous is not None:
+            previous_index = dict((path, i) for i, path in enumerate(previous.paths))
+
+        def entry(image_index):
+            stat = os.stat(paths[image_index])
+
+            # reuse the size of images that did not change since the previous index was built
+            i = previous_index.get(paths[image_index])
+            if i is not None and previous.file_sizes[i] == stat.st_size and previous.mtimes[i] == stat.st_mtime:
+                return previous.widths[i], previous.heights[i], stat.st_size, stat.st_mtime
+
+            width, height = read_image_size(image_index)
+            return width, height, stat.st_size, stat.st_mtime
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                entries = list(executor.map(entry, range(len(paths))))
+        else:
+            entries = [entry(i) for i in range(len(paths))]
+
+        columns = list(zip(*entries)) if entries else [[], [], [], []]
+        return cls(paths, *columns)
+
+    def save(self, path):
+        """ Save the index to a file.
+
+        The index is written to a temporary file first, so an interrupted save never leaves a corrupt index.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(
+                f,
+                version    = np.array(METADATA_VERSION),
+                paths      = np.array(self.paths, dtype=np.str_),
+                widths     = self.widths,
+                heights    = self.heights,
+                file_sizes = self.file_sizes,
+                mtimes     = self.mtimes,
+            )
+        os.rename(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Load an index from a file.
+
+        Returns
+            The ImageMetadata stored in path, or None if it does not exist or can not be read.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != METADATA_VERSION:
+                    return None
+                return cls(data['paths'].tolist(), data['widths'], data['heights'], data['file_sizes'], data['mtimes'])
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def same_as(self, other):
+        """ Check if this index has the same entries as another index.
+        """
+        return (
+            other is not None and
+            self.paths == other.paths and
+            np.array_equal(self.widths, other.widths) and
+            np.array_equal(self.heights, other.heights) and
+            np.array_equal(self.file_sizes, other.file_sizes) and
+            np.array_equal(self.mtimes, other.mtimes)
+        )
+
+    def size(self):
+        """ Number of images in the index.
+        """
+        return len(self.paths)
+
+    def image_size(self, image_index):
+        """ Get the (width, height) of an image.
+        """
+        return int(self.widths[image_index]), int(self.heights[image_index])
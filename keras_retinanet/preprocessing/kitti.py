@@ -18,7 +18,6 @@ import csv
 import os.path
 
 import numpy as np
-from PIL import Image
 
 from .generator import Generator
 from ..utils.image import read_image_bgr
@@ -81,27 +80,14 @@ class KittiGenerator(Generator):
         for name, label in self.classes.items():
             self.labels[label] = name
 
-        self.image_data = dict()
-        self.images = []
-        for i, fn in enumerate(os.listdir(label_dir)):
-            label_fp = os.path.join(label_dir, fn)
-            image_fp = os.path.join(image_dir, fn.replace('.txt', '.png'))
+        self.images      = []
+        self.label_files = []
+        for fn in os.listdir(label_dir):
+            self.label_files.append(os.path.join(label_dir, fn))
+            self.images.append(os.path.join(image_dir, fn.replace('.txt', '.png')))
 
-            self.images.append(image_fp)
-
-            fieldnames = ['type', 'truncated', 'occluded', 'alpha', 'left', 'top', 'right', 'bottom', 'dh', 'dw', 'dl',
-                          'lx', 'ly', 'lz', 'ry']
-            with open(label_fp, 'r') as csv_file:
-                reader = csv.DictReader(csv_file, delimiter=' ', fieldnames=fieldnames)
-                boxes = []
-                for line, row in enumerate(reader):
-                    label = row['type']
-                    cls_id = kitti_classes[label]
-
-                    annotation = {'cls_id': cls_id, 'x1': row['left'], 'x2': row['right'], 'y2': row['bottom'], 'y1': row['top']}
-                    boxes.append(annotation)
-
-                self.image_data[i] = boxes
+        # parse all label files once (or load them from the binary annotation cache)
+        self.annotation_store = self.load_annotation_store(kwargs.get('annotation_store_path'))
 
         super(KittiGenerator, self).__init__(**kwargs)
 
@@ -135,14 +121,7 @@ class KittiGenerator(Generator):
         """
         return self.labels[label]
 
-    def image_aspect_ratio(self, image_index):
-        """ Compute the aspect ratio for an image with image_index.
-        """
-        # PIL is fast for metadata
-        image = Image.open(self.images[image_index])
-        return float(image.width) / float(image.height)
-
-    def image_path(self, image_index):
+    def resolve_image_path(self, image_index):
         """ Get the path to an image.
         """
         return self.images[image_index]
@@ -152,17 +131,25 @@ class KittiGenerator(Generator):
         """
         return read_image_bgr(self.image_path(image_index))
 
-    def load_annotations(self, image_index):
-        """ Load annotations for an image_index.
+    def annotation_sources(self):
+        """ Get the paths of the files the annotations are parsed from.
+        """
+        return self.label_files
+
+    def parse_annotations(self, image_index):
+        """ Parse annotations for an image_index.
         """
-        image_data = self.image_data[image_index]
-        annotations = {'labels': np.empty((len(image_data),)), 'bboxes': np.empty((len(image_data), 4))}
-
-        for idx, ann in enumerate(image_data):
-            annotations['bboxes'][idx, 0] = float(ann['x1'])
-            annotations['bboxes'][idx, 1] = float(ann['y1'])
-            annotations['bboxes'][idx, 2] = float(ann['x2'])
-            annotations['bboxes'][idx, 3] = float(ann['y2'])
-            annotations['labels'][idx] = int(ann['cls_id'])
+        fieldnames = ['type', 'truncated', 'occluded', 'alpha', 'left', 'top', 'right', 'bottom', 'dh', 'dw', 'dl',
+                      'lx', 'ly', 'lz', 'ry']
+        with open(self.label_files[image_index], 'r') as csv_file:
+            rows = list(csv.DictReader(csv_file, delimiter=' ', fieldnames=fieldnames))
+
+        annotations = {'labels': np.empty((len(rows),)), 'bboxes': np.empty((len(rows), 4))}
+        for idx, row in enumerate(rows):
+            annotations['bboxes'][idx, 0] = float(row['left'])
+            annotations['bboxes'][idx, 1] = float(row['top'])
+            annotations['bboxes'][idx, 2] = float(row['right'])
+            annotations['bboxes'][idx, 3] = float(row['bottom'])
+            annotations['labels'][idx] = kitti_classes[row['type']]
 
         return annotations
@@ -0,0 +1,282 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import multiprocessing
+import random
+import time
+import traceback
+
+import numpy as np
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# arrays in a slot start at a multiple of this many bytes
+_ALIGNMENT = 64
+
+
+def _context():
+    """ Get the multiprocessing context, workers are forked where possible so the generator doesn't need to be pickled.
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return multiprocessing.get_context()
+
+
+def _pack(arrays, buffer):
+    """ Copy arrays into a buffer, one after the other.
+
+    Returns
+        The layout of the arrays in the buffer as a list of (offset, shape, dtype), or None if they don't fit.
+    """
+    layout = []
+    offset = 0
+    for array in arrays:
+        array  = np.ascontiguousarray(array)
+        offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+        if offset + array.nbytes > len(buffer):
+            return None
+        np.frombuffer(buffer, dtype=array.dtype, count=array.size, offset=offset).reshape(array.shape)[...] = array
+        layout.append((offset, array.shape, array.dtype.str))
+        offset += array.nbytes
+    return layout
+
+
+def _unpack(layout, buffer):
+    """ Copy the arrays described by layout out of a buffer.
+    """
+    return [np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape).copy() for offset, shape, dtype in layout]
+
+
+def _worker(generator, worker_id, num_workers, seed, tasks, results, free_slots, slots, ready_count, stop):
+    """ Compute batches for the batch indices in tasks, until stop is set or a None task is received.
+
+    Every batch is written to a free slot, the slot and the layout of the batch are sent to results.
+    Batches that don't fit in a slot are sent (pickled) through results instead.
+    """
+    random.seed(seed + worker_id)
+    np.random.seed((seed + worker_id) % (1 << 32))
+    generator.init_worker(worker_id, num_workers)
+
+    while True:
+        index = tasks.get()
+        if index is None or stop.is_set():
+            return
+
+        try:
+            inputs, targets = generator[index]
+        except Exception:
+            results.put(('error', index, traceback.format_exc()))
+            continue
+
+        arrays = [inputs] + list(targets)
+
+        # wait for a free slot, this is where workers block when the consumer is slower than the workers
+        slot = free_slots.get()
+        if slot is None:
+            return
+
+        layout = _pack(arrays, slots[slot])
+        with ready_count.get_lock():
+            ready_count.value += 1
+
+        if layout is None:
+            free_slots.put(slot)
+            results.put(('pickled', index, arrays))
+        else:
+            results.put(('slot', index, (slot, layout)))
+
+
+class MultiprocessLoader(object):
+    """ Compute the batches of a generator in worker processes and transport them through shared memory.
+
+    The workers write every batch (inputs and targets) into one of a ring of preallocated shared memory slots,
+    so the (large) target arrays are never pickled. The number of slots bounds the number of batches that are
+    computed ahead of the consumer (backpressure).
+
+    The loader is an infinite iterator over batches, in the order in which they are completed.
+    Every pass over the generator visits all its batches once, in a new random order if the generator shuffles its groups.
+    """
+
+    def __init__(self, generator, workers=4, num_slots=None, slot_size=None, seed=None):
+        """ Initialize a MultiprocessLoader and start the workers.
+
+        Args
+            generator : The Generator to compute batches with.
+            workers   : Number of worker processes.
+            num_slots : Number of shared memory slots (defaults to 2 * workers).
+            slot_size : Size in bytes of every slot (defaults to twice the size of the first batch).
+                        Batches that don't fit in a slot are pickled, see metrics()['pickled'].
+            seed      : Seed for the random generators of the workers (defaults to a random seed).
+        """
+        self.generator  = generator
+        self.workers    = max(int(workers), 1)
+        self.num_slots  = int(num_slots or 2 * self.workers)
+        self.seed       = seed if seed is not None else random.randint(0, 1 << 30)
+        self.shuffle    = getattr(generator, 'shuffle_groups', False)
+        self.order      = collections.deque()
+        self.submitted  = 0
+        self.received   = 0
+        self.pickled    = 0
+        self.timestamps = collections.deque(maxlen=100)
+        self.processes  = []
+        self.closed     = False
+
+        if slot_size is None:
+            inputs, targets = generator[0]
+            slot_size       = 2 * sum(array.nbytes + _ALIGNMENT for array in [inputs] + list(targets))
+        self.slot_size = int(slot_size)
+
+        # the slots and queues are created before the workers are started, so they are inherited by the workers
+        context          = _context()
+        self.slots       = [context.RawArray('B', self.slot_size) for _ in range(self.num_slots)]
+        self.tasks       = context.Queue()
+        self.results     = context.Queue()
+        self.free_slots  = context.Queue()
+        self.ready_count = context.Value('i', 0)
+        self.stop        = context.Event()
+        for slot in range(self.num_slots):
+            self.free_slots.put(slot)
+
+        for worker_id in range(self.workers):
+            process = context.Process(
+                target=_worker,
+                args=(generator, worker_id, self.workers, self.seed, self.tasks, self.results, self.free_slots, self.slots, self.ready_count, self.stop)
+            )
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        # keep every worker busy, and every slot filled
+        for _ in range(self.num_slots + self.workers):
+            self._submit()
+
+    def _submit(self):
+        """ Submit the next batch index to the workers, starting a new pass over the generator if needed.
+        """
+        if not self.order:
+            order = list(range(len(self.generator)))
+            if self.shuffle:
+                random.shuffle(order)
+            self.order.extend(order)
+
+        self.tasks.put(self.order.popleft())
+        self.submitted += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """ Get the next completed batch, as a tuple (inputs, targets).
+        """
+        if self.closed:
+            raise StopIteration
+
+        while True:
+            try:
+                kind, index, payload = self.results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    self.close()
+                    raise RuntimeError('a data loading worker exited unexpectedly')
+
+        if kind == 'error':
+            self.close()
+            raise RuntimeError('computing batch {} failed in a data loading worker:\n{}'.format(index, payload))
+
+        with self.ready_count.get_lock():
+            self.ready_count.value -= 1
+
+        if kind == 'slot':
+            slot, layout = payload
+            arrays       = _unpack(layout, self.slots[slot])
+            self.free_slots.put(slot)
+        else:
+            arrays        = payload
+            self.pickled += 1
+
+        self.received += 1
+        self.timestamps.append(time.time())
+        self._submit()
+
+        return arrays[0], arrays[1:]
+
+    next = __next__
+
+    def metrics(self):
+        """ Get the throughput and the queue depth of the loader.
+
+        Returns
+            A dict with the number of batches received, the throughput over the last 100 batches (batches per second),
+            the number of completed batches waiting to be consumed (queue depth) and the number of batches that didn't fit in a slot.
+        """
+        batches_per_second = 0.0
+        if len(self.timestamps) > 1 and self.timestamps[-1] > self.timestamps[0]:
+            batches_per_second = (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+        return {
+            'batches'            : self.received,
+            'batches_per_second' : batches_per_second,
+            'queue_depth'        : self.ready_count.value,
+            'pickled'            : self.pickled,
+        }
+
+    def close(self, timeout=5.0):
+        """ Stop the workers and wait for them to exit.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if not self.processes:
+            return
+
+        # wake up workers waiting for a task or for a free slot
+        self.stop.set()
+        for _ in self.processes:
+            self.tasks.put(None)
+            self.free_slots.put(None)
+
+        # drain the results, workers can't exit before the batches they sent are flushed
+        deadline = time.time() + timeout
+        while any(process.is_alive() for process in self.processes) and time.time() < deadline:
+            try:
+                self.results.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+        for q in (self.tasks, self.results, self.free_slots):
+            q.cancel_join_thread()
+            q.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
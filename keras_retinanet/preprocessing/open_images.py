@@ -234,6 +234,11 @@ class OpenImagesGenerator(Generator):
         metadata_dir          = os.path.join(main_dir, metadata)
         annotation_cache_json = os.path.join(annotation_cache_dir, subset + '.json')
 
+        self.annotation_cache_json = annotation_cache_json
+        self.version               = version
+        self.labels_filter         = labels_filter
+        self.parent_label          = parent_label
+
         self.hierarchy          = load_hierarchy(metadata_dir, version=version)
         id_to_labels, cls_index = get_labels(metadata_dir, version=version)
 
@@ -340,19 +345,24 @@ class OpenImagesGenerator(Generator):
     def label_to_name(self, label):
         return self.id_to_labels[label]
 
-    def image_aspect_ratio(self, image_index):
+    def read_image_size(self, image_index):
         img_annotations = self.annotations[self.id_to_image_id[image_index]]
-        height, width = img_annotations['h'], img_annotations['w']
-        return float(width) / float(height)
+        return img_annotations['w'], img_annotations['h']
 
-    def image_path(self, image_index):
+    def resolve_image_path(self, image_index):
         path = os.path.join(self.base_dir, self.id_to_image_id[image_index] + '.jpg')
         return path
 
     def load_image(self, image_index):
         return read_image_bgr(self.image_path(image_index))
 
-    def load_annotations(self, image_index):
+    def annotation_sources(self):
+        return [self.annotation_cache_json]
+
+    def annotation_cache_key(self):
+        return {'version': self.version, 'labels_filter': self.labels_filter, 'parent_label': self.parent_label}
+
+    def parse_annotations(self, image_index):
         image_annotations = self.annotations[self.id_to_image_id[image_index]]
 
         labels = image_annotations['boxes']
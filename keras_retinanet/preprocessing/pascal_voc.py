@@ -20,7 +20,6 @@ from ..utils.image import read_image_bgr
 import os
 import numpy as np
 from six import raise_from
-from PIL import Image
 
 try:
     import xml.etree.cElementTree as ET
@@ -132,14 +131,7 @@ class PascalVocGenerator(Generator):
         """
         return self.labels[label]
 
-    def image_aspect_ratio(self, image_index):
-        """ Compute the aspect ratio for an image with image_index.
-        """
-        path  = os.path.join(self.data_dir, 'JPEGImages', self.image_names[image_index] + self.image_extension)
-        image = Image.open(path)
-        return float(image.width) / float(image.height)
-
-    def image_path(self, image_index):
+    def resolve_image_path(self, image_index):
         """ Get the path to an image.
         """
         return os.path.join(self.data_dir, 'JPEGImages', self.image_names[image_index] + self.image_extension)
@@ -190,8 +182,22 @@ class PascalVocGenerator(Generator):
 
         return annotations
 
-    def load_annotations(self, image_index):
-        """ Load annotations for an image_index.
+    def annotation_sources(self):
+        """ Get the paths of the files the annotations are parsed from.
+        """
+        return [os.path.join(self.data_dir, 'Annotations', image_name + '.xml') for image_name in self.image_names]
+
+    def annotation_cache_key(self):
+        """ Get the parameters that influence parsing the annotations.
+        """
+        return {
+            'classes'        : self.classes,
+            'skip_truncated' : self.skip_truncated,
+            'skip_difficult' : self.skip_difficult,
+        }
+
+    def parse_annotations(self, image_index):
+        """ Parse annotations for an image_index.
         """
         filename = self.image_names[image_index] + '.xml'
         try:
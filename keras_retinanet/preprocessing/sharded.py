@@ -0,0 +1,331 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import namedtuple
+import io
+import itertools
+import json
+import os
+import random
+import struct
+import threading
+
+import numpy as np
+
+from .generator import Generator
+from ..utils.image import read_image_bgr, read_image_bgr_reduced
+
+SHARD_MAGIC   = b'KRS1'
+SHARD_VERSION = 1
+
+# name length, image length, width, height, number of boxes
+_RECORD_HEADER = struct.Struct('<IIIII')
+
+ShardRecord = namedtuple('ShardRecord', ['name', 'image', 'width', 'height', 'labels', 'bboxes'])
+
+
+def write_record(f, record):
+    """ Write a ShardRecord to a shard file.
+
+    A record is a header followed by the name (utf-8), the encoded image, the labels (int32) and the boxes (float32).
+    """
+    name   = record.name.encode('utf-8')
+    labels = np.ascontiguousarray(record.labels, dtype='<i4').reshape(-1)
+    bboxes = np.ascontiguousarray(record.bboxes, dtype='<f4').reshape(-1, 4)
+
+    f.write(_RECORD_HEADER.pack(len(name), len(record.image), record.width, record.height, labels.shape[0]))
+    f.write(name)
+    f.write(record.image)
+    f.write(labels.tobytes())
+    f.write(bboxes.tobytes())
+
+
+def read_shard(path, buffer_size=1 << 20):
+    """ Read the records of a shard file sequentially.
+
+    Args
+        path        : Path to the shard file.
+        buffer_size : Size of the read buffer in bytes.
+
+    Returns
+        A generator yielding a ShardRecord for every record in the shard.
+    """
+    with open(path, 'rb', buffer_size) as f:
+        if f.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise ValueError('invalid shard file: {}'.format(path))
+
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if not header:
+                return
+            if len(header) != _RECORD_HEADER.size:
+                raise ValueError('truncated record in shard file: {}'.format(path))
+
+            name_length, image_length, width, height, num_boxes = _RECORD_HEADER.unpack(header)
+            name   = f.read(name_length).decode('utf-8')
+            image  = f.read(image_length)
+            labels = np.frombuffer(f.read(4 * num_boxes), dtype='<i4')
+            bboxes = np.frombuffer(f.read(16 * num_boxes), dtype='<f4').reshape(-1, 4)
+            if len(image) != image_length or bboxes.shape[0] != num_boxes:
+                raise ValueError('truncated record in shard file: {}'.format(path))
+
+            yield ShardRecord(name, image, width, height, labels, bboxes)
+
+
+def write_shards(generator, path, images_per_shard=1000):
+    """ Write the (encoded) images and the annotations of a generator to sequential shard files.
+
+    The images are stored as they are on disk, so the shards are about as large as the dataset.
+
+    Args
+        generator        : The generator with the images to write.
+        path             : Directory to write the shards and their index (shards.json) to.
+        images_per_shard : Number of images in every shard.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    shards = []
+    f      = None
+    for image_index in range(generator.size()):
+        if image_index % images_per_shard == 0:
+            if f is not None:
+                f.close()
+            shards.append({'path': 'shard_{:05d}.rec'.format(len(shards)), 'count': 0})
+            f = open(os.path.join(path, shards[-1]['path']), 'wb')
+            f.write(SHARD_MAGIC)
+
+        with open(generator.image_path(image_index), 'rb') as image_file:
+            image = image_file.read()
+
+        width, height = generator.image_size(image_index)
+        annotations   = generator.load_annotations(image_index)
+        write_record(f, ShardRecord(
+            os.path.basename(generator.image_path(image_index)),
+            image,
+            width,
+            height,
+            annotations['labels'],
+            annotations['bboxes'],
+        ))
+        shards[-1]['count'] += 1
+
+    if f is not None:
+        f.close()
+
+    classes = dict((generator.label_to_name(label), label) for label in range(generator.num_classes()) if generator.has_label(label))
+    with open(os.path.join(path, 'shards.json'), 'w') as index:
+        json.dump({'version': SHARD_VERSION, 'classes': classes, 'shards': shards}, index)
+
+
+class ShardedGenerator(Generator):
+    """ Generate data from sequential shard files (see write_shards), for datasets that don't fit in memory.
+
+    Records are streamed from the shards, which are shuffled every pass, through a bounded shuffle buffer.
+    With group_method='ratio', a window of records is sorted by aspect ratio and cut into batches, so the batches still
+    contain images with similar aspect ratios. Only the records in these buffers are kept in memory.
+
+    Every call to __getitem__ returns the next batch of the stream, the index is ignored.
+    The stream continues with a new pass over the shards when all shards have been read.
+    """
+
+    def __init__(
+        self,
+        shard_dir,
+        shuffle_buffer_size=1000,
+        group_buffer_size=32,
+        **kwargs
+    ):
+        """ Initialize a ShardedGenerator.
+
+        Args
+            shard_dir           : Directory with the shards and their index (shards.json).
+            shuffle_buffer_size : Number of records in the shuffle buffer.
+            group_buffer_size   : Number of batches that are grouped by aspect ratio at a time (with group_method='ratio').
+        """
+        with open(os.path.join(shard_dir, 'shards.json'), 'r') as f:
+            index = json.load(f)
+
+        if index.get('version') != SHARD_VERSION:
+            raise ValueError('unsupported shard version {} in {}, expected {}'.format(index.get('version'), shard_dir, SHARD_VERSION))
+
+        self.shard_dir           = shard_dir
+        self.shards              = [os.path.join(shard_dir, shard['path']) for shard in index['shards']]
+        self.num_records         = sum(shard['count'] for shard in index['shards'])
+        self.classes             = index['classes']
+        self.labels              = dict((value, key) for key, value in self.classes.items())
+        self.shuffle_buffer_size = max(int(shuffle_buffer_size), 1)
+        self.group_buffer_size   = max(int(group_buffer_size), 1)
+
+        if self.num_records == 0:
+            raise ValueError('no records in the shards in {}'.format(shard_dir))
+
+        # records of the batches that are being computed, by their record id
+        self.records    = {}
+        self.record_ids = itertools.count()
+        self.lock       = threading.Lock()
+        self.stream     = None
+
+        super(ShardedGenerator, self).__init__(**kwargs)
+
+        self.stream = self.stream_groups()
+
+    def size(self):
+        """ Size of the dataset.
+        """
+        return self.num_records
+
+    def num_classes(self):
+        """ Number of classes in the dataset.
+        """
+        return max(self.classes.values()) + 1
+
+    def has_label(self, label):
+        """ Return True if label is a known label.
+        """
+        return label in self.labels
+
+    def has_name(self, name):
+        """ Returns True if name is a known class.
+        """
+        return name in self.classes
+
+    def name_to_label(self, name):
+        """ Map name to label.
+        """
+        return self.classes[name]
+
+    def label_to_name(self, label):
+        """ Map label to name.
+        """
+        return self.labels[label]
+
+    def image_aspect_ratio(self, record_id):
+        """ Compute the aspect ratio of a record that is in flight.
+        """
+        record = self.records[record_id]
+        return float(record.width) / float(record.height)
+
+    def image_path(self, record_id):
+        """ Get the name of the image of a record that is in flight.
+        """
+        return self.records[record_id].name
+
+    def load_image(self, record_id):
+        """ Decode the image of a record that is in flight.
+        """
+        return read_image_bgr(io.BytesIO(self.records[record_id].image))
+
+    def load_reduced_image(self, record_id):
+        """ Decode the image of a record that is in flight, at a reduced resolution if possible.
+        """
+        return read_image_bgr_reduced(io.BytesIO(self.records[record_id].image), min_side=self.image_min_side, max_side=self.image_max_side)
+
+    def load_annotations(self, record_id):
+        """ Load the annotations of a record that is in flight.
+        """
+        record = self.records[record_id]
+        return {'labels': record.labels, 'bboxes': record.bboxes}
+
+    def init_worker(self, worker_id, num_workers):
+        """ Stream a disjoint subset of the shards in every worker, if there are enough shards.
+        """
+        if len(self.shards) >= num_workers:
+            self.shards = self.shards[worker_id::num_workers]
+        self.stream = self.stream_groups()
+
+    def group_images(self):
+        """ Groups are formed while streaming, see stream_groups.
+        """
+        self.groups = []
+
+    def on_epoch_end(self):
+        """ The stream continues across epochs, shards are shuffled at the start of every pass.
+        """
+        pass
+
+    def stream_records(self):
+        """ Stream the records of all shards, in a new (shuffled) shard order for every pass.
+
+        Returns
+            An infinite generator yielding ShardRecords.
+        """
+        while True:
+            shards = list(self.shards)
+            if self.shuffle_groups:
+                random.shuffle(shards)
+
+            for shard in shards:
+                for record in read_shard(shard):
+                    yield record
+
+    def stream_shuffled(self):
+        """ Stream the records through a bounded shuffle buffer.
+
+        Every record is swapped with a random record from the buffer, which is emitted instead.
+        """
+        records = self.stream_records()
+        if not self.shuffle_groups:
+            for record in records:
+                yield record
+        else:
+            buffer = list(itertools.islice(records, self.shuffle_buffer_size))
+            for record in records:
+                index         = random.randrange(len(buffer))
+                yield buffer[index]
+                buffer[index] = record
+
+    def stream_groups(self):
+        """ Stream groups of records, grouped by aspect ratio if group_method='ratio'.
+
+        Returns
+            An infinite generator yielding lists of batch_size records.
+        """
+        records = self.stream_shuffled()
+        window  = self.batch_size * (self.group_buffer_size if self.group_method == 'ratio' else 1)
+        while True:
+            buffer = list(itertools.islice(records, window))
+            if self.group_method == 'ratio':
+                buffer.sort(key=lambda record: float(record.width) / float(record.height))
+
+            groups = [buffer[i:i + self.batch_size] for i in range(0, len(buffer), self.batch_size)]
+            if self.shuffle_groups:
+                random.shuffle(groups)
+
+            for group in groups:
+                yield group
+
+    def __len__(self):
+        """ Number of batches in a pass over all shards.
+        """
+        return (self.num_records + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, index):
+        """ Compute the next batch of the stream (index is ignored).
+        """
+        with self.lock:
+            group = []
+            for record in next(self.stream):
+                record_id               = next(self.record_ids)
+                self.records[record_id] = record
+                group.append(record_id)
+
+        try:
+            return self.compute_input_output(group)
+        finally:
+            with self.lock:
+                for record_id in group:
+                    self.records.pop(record_id, None)
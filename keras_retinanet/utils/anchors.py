@@ -14,10 +14,13 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import collections
+import threading
+
 import numpy as np
 import keras
 
-from ..utils.compute_overlap import compute_overlap
+from ..utils.compute_overlap import compute_overlap, compute_overlap_grid, compute_overlap_max  # noqa: F401
 
 
 class AnchorParameters:
@@ -38,6 +41,16 @@ class AnchorParameters:
     def num_anchors(self):
         return len(self.ratios) * len(self.scales)
 
+    def key(self):
+        """ A hashable representation of the anchor parameters, used to cache generated anchors.
+        """
+        return (
+            tuple(self.sizes),
+            tuple(self.strides),
+            tuple(np.asarray(self.ratios).tolist()),
+            tuple(np.asarray(self.scales).tolist()),
+        )
+
 
 """
 The default anchor parameters.
@@ -56,7 +69,8 @@ def anchor_targets_bbox(
     annotations_group,
     num_classes,
     negative_overlap=0.4,
-    positive_overlap=0.5
+    positive_overlap=0.5,
+    anchor_grid=None
 ):
     """ Generate anchor targets for bbox detection.
 
@@ -68,6 +82,7 @@ def anchor_targets_bbox(
         mask_shape: If the image is padded with zeros, mask_shape can be used to mark the relevant part of the image.
         negative_overlap: IoU overlap for negative anchors (all anchors with overlap < negative_overlap are negative).
         positive_overlap: IoU overlap or positive anchors (all anchors with overlap > positive_overlap are positive).
+        anchor_grid: Optional AnchorGrid describing the layout of anchors, used to only compute overlaps with nearby anchors.
 
     Returns
         labels_batch: batch that contains labels & anchor states (np.array of shape (batch_size, N, num_classes + 1),
@@ -77,50 +92,144 @@ def anchor_targets_bbox(
                       last column defines anchor states (-1 for ignore, 0 for bg, 1 for fg).
     """
 
-    assert(len(image_group) == len(annotations_group)), "The length of the images and annotations need to be equal."
-    assert(len(annotations_group) > 0), "No data received to compute anchor targets for."
-    for annotations in annotations_group:
-        assert('bboxes' in annotations), "Annotations should contain bboxes."
-        assert('labels' in annotations), "Annotations should contain labels."
+    _check_target_inputs(image_group, annotations_group)
 
     batch_size = len(image_group)
 
     regression_batch  = np.zeros((batch_size, anchors.shape[0], 4 + 1), dtype=keras.backend.floatx())
     labels_batch      = np.zeros((batch_size, anchors.shape[0], num_classes + 1), dtype=keras.backend.floatx())
 
+    # the anchor geometry is the same for every image in the batch, so compute it only once
+    anchors_centers = (anchors[:, :2] + anchors[:, 2:]) / 2
+
     # compute labels and regression targets
     for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
-        if annotations['bboxes'].shape[0]:
-            # obtain indices of gt annotations with the greatest overlap
-            positive_indices, ignore_indices, argmax_overlaps_inds = compute_gt_annotations(anchors, annotations['bboxes'], negative_overlap, positive_overlap)
+        anchor_states, positive_indices, argmax_overlaps_inds = _assign_anchors(
+            anchors, anchors_centers, image, annotations, negative_overlap, positive_overlap, anchor_grid
+        )
+
+        labels_batch[index, :, -1]     = anchor_states
+        regression_batch[index, :, -1] = anchor_states
+
+        # compute target class labels and regression targets, only positive anchors contribute to the loss
+        labels_batch[index, positive_indices, annotations['labels'][argmax_overlaps_inds].astype(int)] = 1
+        regression_batch[index, positive_indices, :-1] = bbox_transform(anchors[positive_indices], annotations['bboxes'][argmax_overlaps_inds, :])
+
+    return regression_batch, labels_batch
+
 
-            labels_batch[index, ignore_indices, -1]       = -1
-            labels_batch[index, positive_indices, -1]     = 1
+def anchor_targets_bbox_sparse(
+    anchors,
+    image_group,
+    annotations_group,
+    num_classes,
+    negative_overlap=0.4,
+    positive_overlap=0.5,
+    anchor_grid=None
+):
+    """ Generate anchor targets for bbox detection in a compact format, for use with losses.focal_sparse and losses.smooth_l1_sparse.
 
-            regression_batch[index, ignore_indices, -1]   = -1
-            regression_batch[index, positive_indices, -1] = 1
+    Instead of a one-hot label per anchor, only the label of positive anchors is stored, and regression targets are only stored
+    for positive anchors. The targets describe the same assignment as anchor_targets_bbox, but don't grow with the number of classes.
 
-            # compute target class labels
-            labels_batch[index, positive_indices, annotations['labels'][argmax_overlaps_inds[positive_indices]].astype(int)] = 1
+    Args
+        anchors: np.array of annotations of shape (N, 4) for (x1, y1, x2, y2).
+        image_group: List of BGR images.
+        annotations_group: List of annotations (np.array of shape (N, 5) for (x1, y1, x2, y2, label)).
+        num_classes: Number of classes to predict (unused, the labels are stored as indices).
+        negative_overlap: IoU overlap for negative anchors (all anchors with overlap < negative_overlap are negative).
+        positive_overlap: IoU overlap or positive anchors (all anchors with overlap > positive_overlap are positive).
+        anchor_grid: Optional AnchorGrid describing the layout of anchors, used to only compute overlaps with nearby anchors.
 
-            regression_batch[index, :, :-1] = bbox_transform(anchors, annotations['bboxes'][argmax_overlaps_inds, :])
+    Returns
+        regression_batch: batch that contains the regression targets of the positive anchors (np.array of shape (batch_size, M, 1 + 4),
+                      where M is the largest number of positive anchors of an image in the batch (at least 1), the first column is the index
+                      of the anchor (-1 for padding) and the last 4 columns define regression targets for (x1, y1, x2, y2).
+        labels_batch: batch that contains labels & anchor states (np.array of shape (batch_size, N, 2), where N is the number of anchors
+                      for an image, the first column is the label of positive anchors (-1 for other anchors) and the last column defines
+                      the anchor state (-1 for ignore, 0 for bg, 1 for fg).
+    """
+    _check_target_inputs(image_group, annotations_group)
 
-        # ignore annotations outside of image
-        if image.shape:
-            anchors_centers = np.vstack([(anchors[:, 0] + anchors[:, 2]) / 2, (anchors[:, 1] + anchors[:, 3]) / 2]).T
-            indices = np.logical_or(anchors_centers[:, 0] >= image.shape[1], anchors_centers[:, 1] >= image.shape[0])
+    batch_size = len(image_group)
 
-            labels_batch[index, indices, -1]     = -1
-            regression_batch[index, indices, -1] = -1
+    labels_batch         = np.zeros((batch_size, anchors.shape[0], 2), dtype=keras.backend.floatx())
+    labels_batch[..., 0] = -1
+
+    anchors_centers = (anchors[:, :2] + anchors[:, 2:]) / 2
+
+    positives = []
+    for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
+        anchor_states, positive_indices, argmax_overlaps_inds = _assign_anchors(
+            anchors, anchors_centers, image, annotations, negative_overlap, positive_overlap, anchor_grid
+        )
+
+        # positive anchors outside of the image are ignored, so they have no label or regression target
+        inside               = anchor_states[positive_indices] == 1
+        positive_indices     = positive_indices[inside]
+        argmax_overlaps_inds = argmax_overlaps_inds[inside]
+
+        labels_batch[index, :, 1]                = anchor_states
+        labels_batch[index, positive_indices, 0] = annotations['labels'][argmax_overlaps_inds]
+
+        positives.append((positive_indices, bbox_transform(anchors[positive_indices], annotations['bboxes'][argmax_overlaps_inds, :])))
+
+    # pad the regression targets to the largest number of positive anchors in the batch
+    regression_batch = np.zeros((batch_size, max([1] + [len(indices) for indices, _ in positives]), 1 + 4), dtype=keras.backend.floatx())
+    regression_batch[..., 0] = -1
+    for index, (positive_indices, targets) in enumerate(positives):
+        regression_batch[index, :len(positive_indices), 0]  = positive_indices
+        regression_batch[index, :len(positive_indices), 1:] = targets
 
     return regression_batch, labels_batch
 
 
+def _check_target_inputs(image_group, annotations_group):
+    """ Check that the images and annotations can be used to compute anchor targets.
+    """
+    assert(len(image_group) == len(annotations_group)), "The length of the images and annotations need to be equal."
+    assert(len(annotations_group) > 0), "No data received to compute anchor targets for."
+    for annotations in annotations_group:
+        assert('bboxes' in annotations), "Annotations should contain bboxes."
+        assert('labels' in annotations), "Annotations should contain labels."
+
+
+def _assign_anchors(anchors, anchors_centers, image, annotations, negative_overlap, positive_overlap, anchor_grid):
+    """ Assign the anchors of an image to its annotations.
+
+    Returns
+        anchor_states: np.array of shape (N,) with the state of every anchor (-1 for ignore, 0 for bg, 1 for fg).
+        positive_indices: indices of the positive anchors.
+        argmax_overlaps_inds: for every positive anchor, the index of the annotation it is assigned to.
+    """
+    anchor_states        = np.zeros(anchors.shape[0], dtype=keras.backend.floatx())
+    positive_indices     = np.zeros((0,), dtype=np.int64)
+    argmax_overlaps_inds = np.zeros((0,), dtype=np.int64)
+
+    if annotations['bboxes'].shape[0]:
+        # obtain indices of gt annotations with the greatest overlap
+        positive_mask, ignore_mask, argmax_overlaps_inds = compute_gt_annotations(anchors, annotations['bboxes'], negative_overlap, positive_overlap, anchor_grid=anchor_grid)
+
+        anchor_states[ignore_mask]   = -1
+        anchor_states[positive_mask] = 1
+
+        positive_indices     = np.where(positive_mask)[0]
+        argmax_overlaps_inds = argmax_overlaps_inds[positive_indices]
+
+    # ignore annotations outside of image
+    if image.shape:
+        indices = np.logical_or(anchors_centers[:, 0] >= image.shape[1], anchors_centers[:, 1] >= image.shape[0])
+        anchor_states[indices] = -1
+
+    return anchor_states, positive_indices, argmax_overlaps_inds
+
+
 def compute_gt_annotations(
     anchors,
     annotations,
     negative_overlap=0.4,
-    positive_overlap=0.5
+    positive_overlap=0.5,
+    anchor_grid=None
 ):
     """ Obtain indices of gt annotations with the greatest overlap.
 
@@ -129,6 +238,8 @@ def compute_gt_annotations(
         annotations: np.array of shape (N, 5) for (x1, y1, x2, y2, label).
         negative_overlap: IoU overlap for negative anchors (all anchors with overlap < negative_overlap are negative).
         positive_overlap: IoU overlap or positive anchors (all anchors with overlap > positive_overlap are positive).
+        anchor_grid: Optional AnchorGrid from which the anchors were generated.
+                     If given, only the anchors near each annotation are visited instead of computing the full overlap matrix.
 
     Returns
         positive_indices: indices of positive anchors
@@ -136,9 +247,15 @@ def compute_gt_annotations(
         argmax_overlaps_inds: ordered overlaps indices
     """
 
-    overlaps = compute_overlap(anchors.astype(np.float64), annotations.astype(np.float64))
-    argmax_overlaps_inds = np.argmax(overlaps, axis=1)
-    max_overlaps = overlaps[np.arange(overlaps.shape[0]), argmax_overlaps_inds]
+    if anchor_grid is not None:
+        max_overlaps, argmax_overlaps_inds = compute_overlap_grid(
+            anchor_grid.base_anchors,
+            anchor_grid.shapes,
+            anchor_grid.strides,
+            annotations.astype(np.float64)
+        )
+    else:
+        max_overlaps, argmax_overlaps_inds = compute_overlap_max(anchors, annotations)
 
     # assign "dont care" labels
     positive_indices = max_overlaps >= positive_overlap
@@ -198,13 +315,24 @@ def guess_shapes(image_shape, pyramid_levels):
     return image_shapes
 
 
-def anchors_for_shape(
+"""
+The layout of anchors over all pyramid levels of an image.
+
+Args
+    base_anchors : np.array of shape (L, A, 4) containing the unshifted anchors of each of the L pyramid levels.
+    shapes       : np.array of shape (L, 2) containing the (height, width) of each pyramid level.
+    strides      : np.array of shape (L,) containing the stride of each pyramid level.
+"""
+AnchorGrid = collections.namedtuple('AnchorGrid', ['base_anchors', 'shapes', 'strides'])
+
+
+def anchor_grid_for_shape(
     image_shape,
     pyramid_levels=None,
     anchor_params=None,
     shapes_callback=None,
 ):
-    """ Generators anchors for a given shape.
+    """ Computes the layout of the anchors for a given shape.
 
     Args
         image_shape: The shape of the image.
@@ -213,7 +341,7 @@ def anchors_for_shape(
         shapes_callback: Function to call for getting the shape of the image at different pyramid levels.
 
     Returns
-        np.array of shape (N, 4) containing the (x1, y1, x2, y2) coordinates for the anchors.
+        An AnchorGrid describing the anchors for the given shape.
     """
 
     if pyramid_levels is None:
@@ -226,18 +354,149 @@ def anchors_for_shape(
         shapes_callback = guess_shapes
     image_shapes = shapes_callback(image_shape, pyramid_levels)
 
-    # compute anchors over all pyramid levels
-    all_anchors = np.zeros((0, 4))
-    for idx, p in enumerate(pyramid_levels):
-        anchors = generate_anchors(
+    base_anchors = np.stack([
+        generate_anchors(
             base_size=anchor_params.sizes[idx],
             ratios=anchor_params.ratios,
             scales=anchor_params.scales
+        ) for idx in range(len(pyramid_levels))
+    ])
+    shapes  = np.array([tuple(image_shapes[idx][:2]) for idx in range(len(pyramid_levels))], dtype=np.int64)
+    strides = np.array(anchor_params.strides[:len(pyramid_levels)], dtype=np.float64)
+
+    return AnchorGrid(base_anchors, shapes, strides)
+
+
+def anchors_for_grid(anchor_grid):
+    """ Generates the anchors described by an AnchorGrid.
+
+    Args
+        anchor_grid: The AnchorGrid to generate anchors for.
+
+    Returns
+        np.array of shape (N, 4) containing the (x1, y1, x2, y2) coordinates for the anchors.
+    """
+    # compute anchors over all pyramid levels
+    all_anchors = [np.zeros((0, 4))]
+    for base_anchors, shape, stride in zip(anchor_grid.base_anchors, anchor_grid.shapes, anchor_grid.strides):
+        all_anchors.append(shift(shape, stride, base_anchors))
+
+    return np.concatenate(all_anchors, axis=0)
+
+
+def anchors_for_shape(
+    image_shape,
+    pyramid_levels=None,
+    anchor_params=None,
+    shapes_callback=None,
+):
+    """ Generators anchors for a given shape.
+
+    Args
+        image_shape: The shape of the image.
+        pyramid_levels: List of ints representing which pyramids to use (defaults to [3, 4, 5, 6, 7]).
+        anchor_params: Struct containing anchor parameters. If None, default values are used.
+        shapes_callback: Function to call for getting the shape of the image at different pyramid levels.
+
+    Returns
+        np.array of shape (N, 4) containing the (x1, y1, x2, y2) coordinates for the anchors.
+    """
+    return anchors_for_grid(anchor_grid_for_shape(
+        image_shape,
+        pyramid_levels=pyramid_levels,
+        anchor_params=anchor_params,
+        shapes_callback=shapes_callback,
+    ))
+
+
+AnchorCacheInfo = collections.namedtuple('AnchorCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class AnchorCache(object):
+    """ Bounded LRU cache of anchors, keyed on image shape, pyramid levels, anchor parameters and shapes callback.
+
+    Batches that are grouped by aspect ratio are padded to a handful of distinct shapes,
+    so the anchors for those shapes only have to be computed once.
+    The cached arrays are marked read-only, since they are shared between all users of the cache.
+
+    Args
+        maxsize: Maximum number of anchor arrays to keep in the cache.
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits    = 0
+        self.misses  = 0
+        self._cache  = collections.OrderedDict()
+        self._lock   = threading.Lock()
+
+    def _get_entry(self, image_shape, pyramid_levels, anchor_params, shapes_callback):
+        """ Return the (anchors, anchor_grid) entry for a given shape, computing it if it is not cached yet.
+        """
+        key = (
+            tuple(image_shape),
+            None if pyramid_levels is None else tuple(pyramid_levels),
+            None if anchor_params is None else anchor_params.key(),
+            shapes_callback,
         )
-        shifted_anchors = shift(image_shapes[idx], anchor_params.strides[idx], anchors)
-        all_anchors     = np.append(all_anchors, shifted_anchors, axis=0)
 
-    return all_anchors
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        anchor_grid = anchor_grid_for_shape(
+            image_shape,
+            pyramid_levels=pyramid_levels,
+            anchor_params=anchor_params,
+            shapes_callback=shapes_callback,
+        )
+        anchors = anchors_for_grid(anchor_grid)
+        anchors.setflags(write=False)
+        entry = (anchors, anchor_grid)
+
+        with self._lock:
+            self._cache[key] = entry
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return entry
+
+    def get(self, image_shape, pyramid_levels=None, anchor_params=None, shapes_callback=None):
+        """ Return the anchors for a given shape, computing them with anchors_for_shape if they are not cached yet.
+
+        See anchors_for_shape for a description of the arguments.
+        """
+        return self._get_entry(image_shape, pyramid_levels, anchor_params, shapes_callback)[0]
+
+    def get_grid(self, image_shape, pyramid_levels=None, anchor_params=None, shapes_callback=None):
+        """ Return the AnchorGrid for a given shape, computing it with anchor_grid_for_shape if it is not cached yet.
+
+        See anchor_grid_for_shape for a description of the arguments.
+        """
+        return self._get_entry(image_shape, pyramid_levels, anchor_params, shapes_callback)[1]
+
+    def info(self):
+        """ Returns the hit and miss counters and the size of the cache.
+        """
+        with self._lock:
+            return AnchorCacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def clear(self):
+        """ Removes all anchors from the cache and resets the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits   = 0
+            self.misses = 0
+
+
+"""
+The anchor cache shared by all generators in this process (forked workers inherit its contents).
+"""
+AnchorCache.default = AnchorCache()
 
 
 def shift(shape, stride, anchors):
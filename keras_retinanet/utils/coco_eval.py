@@ -16,45 +16,31 @@ limitations under the License.
 
 from pycocotools.cocoeval import COCOeval
 
-import keras
-import numpy as np
-import json
+from .eval import predict_images
 
-import progressbar
-assert(callable(progressbar.progressbar)), "Using wrong progressbar module, install 'progressbar2' instead."
+import json
 
 
-def evaluate_coco(generator, model, threshold=0.05):
+def evaluate_coco(generator, model, threshold=0.05, batch_size=1, prefetch=2):
     """ Use the pycocotools to evaluate a COCO model on a dataset.
 
     Args
-        generator : The generator for generating the evaluation data.
-        model     : The model to evaluate.
-        threshold : The score threshold to use.
+        generator  : The generator for generating the evaluation data.
+        model      : The model to evaluate.
+        threshold  : The score threshold to use.
+        batch_size : The number of images per call to the model.
+        prefetch   : The number of batches to prepare in the background while the model runs.
     """
     # start collecting results
     results = []
     image_ids = []
-    for index in progressbar.progressbar(range(generator.size()), prefix='COCO evaluation: '):
-        image = generator.load_image(index)
-        image = generator.preprocess_image(image)
-        image, scale = generator.resize_image(image)
-
-        if keras.backend.image_data_format() == 'channels_first':
-            image = image.transpose((2, 0, 1))
-
-        # run network
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
-
-        # correct boxes for image scale
-        boxes /= scale
-
+    for index, _, boxes, scores, labels, _ in predict_images(generator, model, batch_size=batch_size, prefetch=prefetch, prefix='COCO evaluation: '):
         # change to (x, y, w, h) (MS COCO standard)
-        boxes[:, :, 2] -= boxes[:, :, 0]
-        boxes[:, :, 3] -= boxes[:, :, 1]
+        boxes[:, 2] -= boxes[:, 0]
+        boxes[:, 3] -= boxes[:, 1]
 
         # compute predicted labels and scores
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
+        for box, score, label in zip(boxes, scores, labels):
             # scores are sorted, so we can break
             if score < threshold:
                 break
@@ -6,48 +6,358 @@
 # --------------------------------------------------------
 
 cimport cython
+from cython cimport floating
+from cython.parallel cimport prange
 import numpy as np
 cimport numpy as np
+from libc.math cimport floor, ceil
 
 
-def compute_overlap(
-    np.ndarray[double, ndim=2] boxes,
-    np.ndarray[double, ndim=2] query_boxes
-):
+def _as_float_arrays(*arrays):
+    """ Convert arrays to a common floating point type (float32 if all arrays are float32, float64 otherwise).
+
+    Arrays that already have the common type are not copied.
+    """
+    if all(np.asarray(a).dtype == np.float32 for a in arrays):
+        dtype = np.float32
+    else:
+        dtype = np.float64
+    return [np.asarray(a, dtype=dtype) for a in arrays]
+
+
+cdef inline floating _overlap(
+    floating x1, floating y1, floating x2, floating y2,
+    floating query_x1, floating query_y1, floating query_x2, floating query_y2,
+    floating query_area
+) noexcept nogil:
+    """ Compute the overlap between the box (x1, y1, x2, y2) and a query box with area query_area.
+    """
+    cdef floating iw, ih, ua
+    iw = min(x2, query_x2) - max(x1, query_x1) + 1
+    if iw > 0:
+        ih = min(y2, query_y2) - max(y1, query_y1) + 1
+        if ih > 0:
+            ua = (x2 - x1 + 1) * (y2 - y1 + 1) + query_area - iw * ih
+            return iw * ih / ua
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _compute_overlap(const floating[:, :] boxes, const floating[:, :] query_boxes, const floating[:] box_areas, floating[:, :] overlaps, int num_threads) noexcept nogil:
+    cdef Py_ssize_t N = boxes.shape[0]
+    cdef Py_ssize_t K = query_boxes.shape[0]
+    cdef Py_ssize_t n, k
+
+    for n in prange(N, num_threads=num_threads, schedule='static'):
+        for k in range(K):
+            overlaps[n, k] = _overlap(
+                boxes[n, 0], boxes[n, 1], boxes[n, 2], boxes[n, 3],
+                query_boxes[k, 0], query_boxes[k, 1], query_boxes[k, 2], query_boxes[k, 3],
+                box_areas[k]
+            )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _compute_overlap_max(const floating[:, :] boxes, const floating[:, :] query_boxes, const floating[:] box_areas, floating[:] max_overlaps, np.int64_t[:] argmax_overlaps, int num_threads) noexcept nogil:
+    cdef Py_ssize_t N = boxes.shape[0]
+    cdef Py_ssize_t K = query_boxes.shape[0]
+    cdef Py_ssize_t n, k
+    cdef floating overlap
+
+    for n in prange(N, num_threads=num_threads, schedule='static'):
+        for k in range(K):
+            overlap = _overlap(
+                boxes[n, 0], boxes[n, 1], boxes[n, 2], boxes[n, 3],
+                query_boxes[k, 0], query_boxes[k, 1], query_boxes[k, 2], query_boxes[k, 3],
+                box_areas[k]
+            )
+            if overlap > max_overlaps[n]:
+                max_overlaps[n]    = overlap
+                argmax_overlaps[n] = k
+
+
+# The wrappers below convert the arrays to memoryviews and release the GIL while the kernels run,
+# so that multiple Python threads can compute overlaps concurrently.
+# The inputs are const memoryviews, so read-only arrays (eg. cached anchors) are accepted without a copy.
+def _compute_overlap_float(const float[:, :] boxes, const float[:, :] query_boxes, const float[:] box_areas, float[:, :] overlaps, int num_threads):
+    with nogil:
+        _compute_overlap(boxes, query_boxes, box_areas, overlaps, num_threads)
+
+
+def _compute_overlap_double(const double[:, :] boxes, const double[:, :] query_boxes, const double[:] box_areas, double[:, :] overlaps, int num_threads):
+    with nogil:
+        _compute_overlap(boxes, query_boxes, box_areas, overlaps, num_threads)
+
+
+def _compute_overlap_max_float(const float[:, :] boxes, const float[:, :] query_boxes, const float[:] box_areas, float[:] max_overlaps, np.int64_t[:] argmax_overlaps, int num_threads):
+    with nogil:
+        _compute_overlap_max(boxes, query_boxes, box_areas, max_overlaps, argmax_overlaps, num_threads)
+
+
+def _compute_overlap_max_double(const double[:, :] boxes, const double[:, :] query_boxes, const double[:] box_areas, double[:] max_overlaps, np.int64_t[:] argmax_overlaps, int num_threads):
+    with nogil:
+        _compute_overlap_max(boxes, query_boxes, box_areas, max_overlaps, argmax_overlaps, num_threads)
+
+
+def _query_box_areas(query_boxes):
+    """ Compute the areas of the query boxes, using the same (+1) convention as the overlap computation.
+    """
+    return (query_boxes[:, 2] - query_boxes[:, 0] + 1) * (query_boxes[:, 3] - query_boxes[:, 1] + 1)
+
+
+def compute_overlap(boxes, query_boxes, int num_threads=1):
     """
     Args
-        a: (N, 4) ndarray of float
-        b: (K, 4) ndarray of float
+        boxes: (N, 4) ndarray of float
+        query_boxes: (K, 4) ndarray of float
+        num_threads: Number of OpenMP threads to use (only has an effect if the module is compiled with OpenMP).
 
     Returns
-        overlaps: (N, K) ndarray of overlap between boxes and query_boxes
-    """
-    cdef unsigned int N = boxes.shape[0]
-    cdef unsigned int K = query_boxes.shape[0]
-    cdef np.ndarray[double, ndim=2] overlaps = np.zeros((N, K), dtype=np.float64)
-    cdef double iw, ih, box_area
-    cdef double ua
-    cdef unsigned int k, n
+        overlaps: (N, K) ndarray of overlap between boxes and query_boxes.
+                  The overlaps are float32 if both inputs are float32, float64 otherwise.
+    """
+    boxes, query_boxes = _as_float_arrays(boxes, query_boxes)
+    overlaps  = np.zeros((boxes.shape[0], query_boxes.shape[0]), dtype=boxes.dtype)
+    box_areas = np.ascontiguousarray(_query_box_areas(query_boxes))
+
+    if boxes.dtype == np.float32:
+        _compute_overlap_float(boxes, query_boxes, box_areas, overlaps, num_threads)
+    else:
+        _compute_overlap_double(boxes, query_boxes, box_areas, overlaps, num_threads)
+
+    return overlaps
+
+
+def compute_overlap_max(boxes, query_boxes, int num_threads=1):
+    """ Compute for each box the maximum overlap with any of the query boxes.
+
+    This is equivalent to taking the max and argmax over axis 1 of compute_overlap(boxes, query_boxes),
+    but without constructing the (N, K) overlap matrix.
+
+    Args
+        boxes: (N, 4) ndarray of float
+        query_boxes: (K, 4) ndarray of float
+        num_threads: Number of OpenMP threads to use (only has an effect if the module is compiled with OpenMP).
+
+    Returns
+        max_overlaps: (N,) ndarray of the maximum overlap of each box with any query box
+        argmax_overlaps: (N,) ndarray with the index of the query box with the maximum overlap (0 if there is no overlap)
+    """
+    boxes, query_boxes = _as_float_arrays(boxes, query_boxes)
+    max_overlaps    = np.zeros((boxes.shape[0],), dtype=boxes.dtype)
+    argmax_overlaps = np.zeros((boxes.shape[0],), dtype=np.int64)
+    box_areas       = np.ascontiguousarray(_query_box_areas(query_boxes))
+
+    if boxes.dtype == np.float32:
+        _compute_overlap_max_float(boxes, query_boxes, box_areas, max_overlaps, argmax_overlaps, num_threads)
+    else:
+        _compute_overlap_max_double(boxes, query_boxes, box_areas, max_overlaps, argmax_overlaps, num_threads)
+
+    return max_overlaps, argmax_overlaps
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _compute_overlap_grid(
+    const double[:, :, :] base_anchors,
+    const np.int64_t[:, :] shapes,
+    const double[:] strides,
+    const np.int64_t[:] offsets,
+    const double[:, :] query_boxes,
+    double[:] max_overlaps,
+    np.int64_t[:] argmax_overlaps
+) noexcept nogil:
+    cdef Py_ssize_t L = base_anchors.shape[0]
+    cdef Py_ssize_t A = base_anchors.shape[1]
+    cdef Py_ssize_t K = query_boxes.shape[0]
+    cdef Py_ssize_t l, a, k
+    cdef np.int64_t x, y, x_start, x_end, y_start, y_end, offset, n
+    cdef double iw, ih, box_area, ua, overlap
+    cdef double min_x1, min_y1, max_x2, max_y2, shift_x, shift_y
+    cdef double ax1, ay1, ax2, ay2
+
     for k in range(K):
         box_area = (
             (query_boxes[k, 2] - query_boxes[k, 0] + 1) *
             (query_boxes[k, 3] - query_boxes[k, 1] + 1)
         )
-        for n in range(N):
-            iw = (
-                min(boxes[n, 2], query_boxes[k, 2]) -
-                max(boxes[n, 0], query_boxes[k, 0]) + 1
-            )
-            if iw > 0:
-                ih = (
-                    min(boxes[n, 3], query_boxes[k, 3]) -
-                    max(boxes[n, 1], query_boxes[k, 1]) + 1
-                )
-                if ih > 0:
-                    ua = np.float64(
-                        (boxes[n, 2] - boxes[n, 0] + 1) *
-                        (boxes[n, 3] - boxes[n, 1] + 1) +
-                        box_area - iw * ih
-                    )
-                    overlaps[n, k] = iw * ih / ua
-    return overlaps
+        for l in range(L):
+            # the extent of the base anchors of this level
+            min_x1 = base_anchors[l, 0, 0]
+            min_y1 = base_anchors[l, 0, 1]
+            max_x2 = base_anchors[l, 0, 2]
+            max_y2 = base_anchors[l, 0, 3]
+            for a in range(1, A):
+                min_x1 = min(min_x1, base_anchors[l, a, 0])
+                min_y1 = min(min_y1, base_anchors[l, a, 1])
+                max_x2 = max(max_x2, base_anchors[l, a, 2])
+                max_y2 = max(max_y2, base_anchors[l, a, 3])
+
+            # the (conservative) range of cells whose anchors can intersect with the query box
+            x_start = max(<np.int64_t>floor((query_boxes[k, 0] - 1 - max_x2) / strides[l] - 0.5), 0)
+            x_end   = min(<np.int64_t>ceil((query_boxes[k, 2] + 1 - min_x1) / strides[l] - 0.5), shapes[l, 1] - 1)
+            y_start = max(<np.int64_t>floor((query_boxes[k, 1] - 1 - max_y2) / strides[l] - 0.5), 0)
+            y_end   = min(<np.int64_t>ceil((query_boxes[k, 3] + 1 - min_y1) / strides[l] - 0.5), shapes[l, 0] - 1)
+
+            for y in range(y_start, y_end + 1):
+                shift_y = (y + 0.5) * strides[l]
+                for x in range(x_start, x_end + 1):
+                    shift_x = (x + 0.5) * strides[l]
+                    offset  = offsets[l] + (y * shapes[l, 1] + x) * A
+                    for a in range(A):
+                        ax1 = base_anchors[l, a, 0] + shift_x
+                        ax2 = base_anchors[l, a, 2] + shift_x
+                        iw = (
+                            min(ax2, query_boxes[k, 2]) -
+                            max(ax1, query_boxes[k, 0]) + 1
+                        )
+                        if iw > 0:
+                            ay1 = base_anchors[l, a, 1] + shift_y
+                            ay2 = base_anchors[l, a, 3] + shift_y
+                            ih = (
+                                min(ay2, query_boxes[k, 3]) -
+                                max(ay1, query_boxes[k, 1]) + 1
+                            )
+                            if ih > 0:
+                                ua = (
+                                    (ax2 - ax1 + 1) *
+                                    (ay2 - ay1 + 1) +
+                                    box_area - iw * ih
+                                )
+                                overlap = iw * ih / ua
+                                n = offset + a
+                                if overlap > max_overlaps[n]:
+                                    max_overlaps[n]    = overlap
+                                    argmax_overlaps[n] = k
+
+
+def compute_overlap_grid(base_anchors, shapes, strides, query_boxes):
+    """ Compute the maximum overlap of anchors laid out on a grid with query_boxes.
+
+    The anchors are expected to be laid out as done by anchors_for_shape, ie. for every level,
+    for every (y, x) position in the level, for every base anchor (base_anchors[level] shifted by ((x + 0.5) * stride, (y + 0.5) * stride)).
+    For each query box, only the grid cells whose anchors could intersect with it are visited,
+    so the full (N, K) overlap matrix is never constructed.
+
+    Args
+        base_anchors: (L, A, 4) ndarray of float, the unshifted anchors for each level
+        shapes: (L, 2) ndarray of int, the (height, width) of each level
+        strides: (L,) ndarray of float, the stride of each level
+        query_boxes: (K, 4) ndarray of float
+
+    Returns
+        max_overlaps: (N,) ndarray of the maximum overlap of each anchor with any query box
+        argmax_overlaps: (N,) ndarray with the index of the query box with the maximum overlap (0 if there is no overlap)
+    """
+    base_anchors = np.asarray(base_anchors, dtype=np.float64)
+    shapes       = np.asarray(shapes, dtype=np.int64)
+    strides      = np.asarray(strides, dtype=np.float64)
+    query_boxes  = np.asarray(query_boxes, dtype=np.float64)
+
+    offsets = np.zeros((shapes.shape[0] + 1,), dtype=np.int64)
+    np.cumsum(shapes[:, 0] * shapes[:, 1] * base_anchors.shape[1], out=offsets[1:])
+
+    max_overlaps    = np.zeros((offsets[-1],), dtype=np.float64)
+    argmax_overlaps = np.zeros((offsets[-1],), dtype=np.int64)
+
+    cdef const double[:, :, :] base_anchors_view  = base_anchors
+    cdef const np.int64_t[:, :] shapes_view       = shapes
+    cdef const double[:] strides_view             = strides
+    cdef const np.int64_t[:] offsets_view         = offsets
+    cdef const double[:, :] query_boxes_view      = query_boxes
+    cdef double[:] max_overlaps_view              = max_overlaps
+    cdef np.int64_t[:] argmax_overlaps_view       = argmax_overlaps
+
+    with nogil:
+        _compute_overlap_grid(
+            base_anchors_view, shapes_view, strides_view, offsets_view,
+            query_boxes_view, max_overlaps_view, argmax_overlaps_view
+        )
+
+    return max_overlaps, argmax_overlaps
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _non_max_suppression(const floating[:, :] boxes, const np.int64_t[:] order, double iou_threshold, np.int64_t[:] keep) noexcept nogil:
+    cdef Py_ssize_t N = order.shape[0]
+    cdef Py_ssize_t K = keep.shape[0]
+    cdef Py_ssize_t num_kept = 0
+    cdef Py_ssize_t n, k, i, j
+    cdef double iw, ih, area_i, area_j, inter
+    cdef bint suppressed
+
+    for n in range(N):
+        if num_kept >= K:
+            break
+
+        i          = order[n]
+        area_i     = max(boxes[i, 2] - boxes[i, 0], 0) * max(boxes[i, 3] - boxes[i, 1], 0)
+        suppressed = False
+
+        # compare with the kept boxes, the most recently kept boxes first
+        for k in range(num_kept - 1, -1, -1):
+            j      = keep[k]
+            area_j = max(boxes[j, 2] - boxes[j, 0], 0) * max(boxes[j, 3] - boxes[j, 1], 0)
+            if area_i <= 0 or area_j <= 0:
+                continue
+
+            iw = min(boxes[i, 2], boxes[j, 2]) - max(boxes[i, 0], boxes[j, 0])
+            ih = min(boxes[i, 3], boxes[j, 3]) - max(boxes[i, 1], boxes[j, 1])
+            if iw <= 0 or ih <= 0:
+                continue
+
+            inter = iw * ih
+            if inter / (area_i + area_j - inter) > iou_threshold:
+                suppressed = True
+                break
+
+        if not suppressed:
+            keep[num_kept] = i
+            num_kept      += 1
+
+    return num_kept
+
+
+def _non_max_suppression_float(const float[:, :] boxes, const np.int64_t[:] order, double iou_threshold, np.int64_t[:] keep):
+    cdef Py_ssize_t num_kept
+    with nogil:
+        num_kept = _non_max_suppression(boxes, order, iou_threshold, keep)
+    return num_kept
+
+
+def _non_max_suppression_double(const double[:, :] boxes, const np.int64_t[:] order, double iou_threshold, np.int64_t[:] keep):
+    cdef Py_ssize_t num_kept
+    with nogil:
+        num_kept = _non_max_suppression(boxes, order, iou_threshold, keep)
+    return num_kept
+
+
+def non_max_suppression(boxes, scores, double iou_threshold=0.5, int max_output_size=300):
+    """ Greedy non maximum suppression, with the same (IoU without +1) convention as tf.image.non_max_suppression.
+
+    Every box is only compared with the boxes that are kept, so the cost is bounded by N * max_output_size.
+
+    Args
+        boxes: (N, 4) ndarray of float
+        scores: (N,) ndarray of float
+        iou_threshold: Boxes that overlap a higher scoring kept box with an IoU above this threshold are suppressed.
+        max_output_size: Maximum number of boxes to keep.
+
+    Returns
+        keep: ndarray with the indices of the kept boxes, in order of decreasing score
+    """
+    boxes, = _as_float_arrays(boxes)
+    boxes  = np.ascontiguousarray(boxes)
+    order  = np.argsort(-np.asarray(scores)).astype(np.int64)
+    keep   = np.zeros((min(max_output_size, boxes.shape[0]),), dtype=np.int64)
+
+    if boxes.dtype == np.float32:
+        num_kept = _non_max_suppression_float(boxes, order, iou_threshold, keep)
+    else:
+        num_kept = _non_max_suppression_double(boxes, order, iou_threshold, keep)
+
+    return keep[:num_kept]
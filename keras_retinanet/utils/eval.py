@@ -14,10 +14,14 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from .anchors import compute_overlap
+from .compute_overlap import compute_overlap
+from .image import compute_image_batch
 from .visualization import draw_detections, draw_annotations
 
+import collections
+import concurrent.futures
 import keras
+import multiprocessing
 import numpy as np
 import os
 import time
@@ -56,7 +60,201 @@ def _compute_ap(recall, precision):
     return ap
 
 
-def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None):
+def _match_detections(detections, annotations, iou_threshold):
+    """ Match the detections of a single image and class to its annotations.
+
+    Detections are processed in the order in which they are given (sorted by descending score).
+    A detection is a true positive if its highest overlapping annotation has an overlap of at least iou_threshold
+    and that annotation was not already detected by an earlier detection.
+
+    # Arguments
+        detections    : (D, 5) ndarray of detections (x1, y1, x2, y2, score).
+        annotations   : (A, 4) ndarray of annotations (x1, y1, x2, y2).
+        iou_threshold : The threshold used to consider when a detection is positive or negative.
+    # Returns
+        A (D,) boolean ndarray which is True for the true positive detections.
+    """
+    true_positives = np.zeros((detections.shape[0],), dtype=bool)
+    if detections.shape[0] == 0 or annotations.shape[0] == 0:
+        return true_positives
+
+    overlaps             = compute_overlap(detections[:, :4], annotations)
+    assigned_annotations  = np.argmax(overlaps, axis=1)
+    max_overlaps         = overlaps[np.arange(detections.shape[0]), assigned_annotations]
+
+    # only the first candidate assigned to an annotation detects it, the others are false positives
+    candidates = np.where(max_overlaps >= iou_threshold)[0]
+    _, first   = np.unique(assigned_annotations[candidates], return_index=True)
+    true_positives[candidates[first]] = True
+
+    return true_positives
+
+
+def _evaluate_label(args):
+    """ Compute the average precision of a single class.
+
+    # Arguments
+        args : Tuple of (detections, annotations, iou_threshold), where detections and annotations contain
+               the detections and annotations of this class for every image.
+    # Returns
+        A tuple of (average precision, number of annotations).
+    """
+    all_detections, all_annotations, iou_threshold = args
+
+    # count the detections so that the results can be accumulated in preallocated arrays
+    num_detections  = sum(detections.shape[0] for detections in all_detections)
+    true_positives  = np.zeros((num_detections,))
+    scores          = np.zeros((num_detections,))
+    num_annotations = 0.0
+    offset          = 0
+
+    for detections, annotations in zip(all_detections, all_annotations):
+        num_annotations += annotations.shape[0]
+        end              = offset + detections.shape[0]
+
+        scores[offset:end]         = detections[:, 4]
+        true_positives[offset:end] = _match_detections(detections, annotations, iou_threshold)
+        offset                     = end
+
+    false_positives = 1 - true_positives
+
+    # no annotations -> AP for this class is 0 (is this correct?)
+    if num_annotations == 0:
+        return 0, 0
+
+    # sort by score
+    indices         = np.argsort(-scores)
+    false_positives = false_positives[indices]
+    true_positives  = true_positives[indices]
+
+    # compute false positives and true positives
+    false_positives = np.cumsum(false_positives)
+    true_positives  = np.cumsum(true_positives)
+
+    # compute recall and precision
+    recall    = true_positives / num_annotations
+    precision = true_positives / np.maximum(true_positives + false_positives, np.finfo(np.float64).eps)
+
+    # compute average precision
+    average_precision = _compute_ap(recall, precision)
+    return average_precision, num_annotations
+
+
+def _image_batches(generator, batch_size):
+    """ Divide the images of a generator in batches of batch_size images.
+
+    Batches of more than one image are formed from images with a similar aspect ratio (like the 'ratio' group method of the generators),
+    to limit the amount of padding that is necessary to combine them in a single batch.
+
+    # Arguments
+        generator  : The generator that represents the dataset.
+        batch_size : The maximum number of images per batch.
+    # Returns
+        A list of lists of image indices.
+    """
+    order = list(range(generator.size()))
+    if batch_size > 1:
+        order.sort(key=lambda x: generator.image_aspect_ratio(x))
+
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _load_image_batch(generator, group):
+    """ Load and preprocess a batch of images.
+
+    # Arguments
+        generator : The generator that represents the dataset.
+        group     : The indices of the images in the batch.
+    # Returns
+        A tuple of (raw_images, image_batch, scales, shapes, timings), where shapes contains the (height, width) of every resized image
+        (without the padding of the batch) and timings contains the time spent to decode and preprocess the batch.
+    """
+    start = time.time()
+    if getattr(generator, 'image_cache', None) is not None or getattr(generator, 'reduced_decode', False):
+        # the images are loaded already resized (or reduced while decoding), the raw images are only loaded when they are needed
+        raw_images     = [None] * len(group)
+        images, scales = zip(*[generator.load_resized_image(image_index) for image_index in group])
+        decoded        = time.time()
+    else:
+        raw_images = [generator.load_image(image_index) for image_index in group]
+        decoded    = time.time()
+
+        # resize the images first, so that they are preprocessed at the (usually lower) resized resolution
+        images = []
+        scales = []
+        for raw_image in raw_images:
+            image, scale = generator.resize_image(raw_image)
+            images.append(image)
+            scales.append(scale)
+
+    shapes      = [image.shape[:2] for image in images]
+    image_batch = compute_image_batch(images, generator.preprocess_image, dtype=keras.backend.floatx())
+    if keras.backend.image_data_format() == 'channels_first':
+        image_batch = image_batch.transpose((0, 3, 1, 2))
+
+    timings = {
+        'decode'     : decoded - start,
+        'preprocess' : time.time() - decoded,
+    }
+    return raw_images, image_batch, scales, shapes, timings
+
+
+def predict_images(generator, model, batch_size=1, prefetch=2, prefix='Running network: '):
+    """ Run a model on all images of a generator, batch_size images at a time.
+
+    While the model runs, the next prefetch batches are loaded and preprocessed by a pool of prefetch threads.
+    The boxes are clipped to the (resized) image, since the model can only clip them to the padded batch,
+    and corrected for the scale with which each image was resized.
+
+    # Arguments
+        generator  : The generator that represents the dataset.
+        model      : The model to run on the images.
+        batch_size : The number of images per call to the model.
+        prefetch   : The number of batches to prepare in the background (0 to load batches synchronously).
+        prefix     : The prefix of the progress bar.
+    # Returns
+        A generator yielding a tuple of (image_index, raw_image, boxes, scores, labels, timings) for every image
+        (raw_image is None if the generator loads its images from an image cache or with reduced_decode),
+        where timings is a dict with the time spent to decode, preprocess and run inference on this image (an even share of the time spent on its batch).
+    """
+    batches   = _image_batches(generator, batch_size)
+    executor  = concurrent.futures.ThreadPoolExecutor(max_workers=prefetch) if prefetch > 0 else None
+    pending   = collections.deque()
+    submitted = 0
+
+    try:
+        for group in progressbar.progressbar(batches, prefix=prefix):
+            if executor is None:
+                raw_images, image_batch, scales, shapes, timings = _load_image_batch(generator, group)
+            else:
+                # keep the current batch and the next prefetch batches in the queue
+                while submitted < len(batches) and len(pending) <= prefetch:
+                    pending.append(executor.submit(_load_image_batch, generator, batches[submitted]))
+                    submitted += 1
+                raw_images, image_batch, scales, shapes, timings = pending.popleft().result()
+
+            # run network
+            start = time.time()
+            boxes, scores, labels = model.predict_on_batch(image_batch)[:3]
+            timings['inference'] = time.time() - start
+
+            image_timings = {stage: duration / len(group) for stage, duration in timings.items()}
+            for batch_index, (image_index, raw_image, scale, (height, width)) in enumerate(zip(group, raw_images, scales, shapes)):
+                # clip boxes to the image, the padding of the batch is to the bottom right (padded boxes of -1 are unchanged)
+                image_boxes = np.minimum(boxes[batch_index], np.array([width - 1, height - 1, width - 1, height - 1], dtype=boxes.dtype))
+
+                # correct boxes for image scale
+                image_boxes /= scale
+
+                yield image_index, raw_image, image_boxes, scores[batch_index], labels[batch_index], dict(image_timings)
+    finally:
+        if executor is not None:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+
+
+def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None, batch_size=1, prefetch=2):
     """ Get the detections from the model using the generator.
 
     The result is a list of lists such that the size is:
@@ -68,44 +266,37 @@ def _get_detections(generator, model, score_threshold=0.05, max_detections=100,
         score_threshold : The score confidence threshold to use.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save the images with visualized detections to.
+        batch_size      : The number of images per call to the model.
+        prefetch        : The number of batches to prepare in the background while the model runs.
     # Returns
-        A list of lists containing the detections for each image in the generator.
+        A list of lists containing the detections for each image in the generator,
+        and a list containing the time spent in each stage (decode, preprocess, inference, postprocess) for each image.
     """
     all_detections = [[None for i in range(generator.num_classes()) if generator.has_label(i)] for j in range(generator.size())]
-    all_inferences = [None for i in range(generator.size())]
-
-    for i in progressbar.progressbar(range(generator.size()), prefix='Running network: '):
-        raw_image    = generator.load_image(i)
-        image        = generator.preprocess_image(raw_image.copy())
-        image, scale = generator.resize_image(image)
-
-        if keras.backend.image_data_format() == 'channels_first':
-            image = image.transpose((2, 0, 1))
+    all_timings    = [None for i in range(generator.size())]
 
-        # run network
+    for i, raw_image, boxes, scores, labels, timings in predict_images(generator, model, batch_size=batch_size, prefetch=prefetch):
         start = time.time()
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))[:3]
-        inference_time = time.time() - start
-
-        # correct boxes for image scale
-        boxes /= scale
 
         # select indices which have a score above the threshold
-        indices = np.where(scores[0, :] > score_threshold)[0]
+        indices = np.where(scores > score_threshold)[0]
 
         # select those scores
-        scores = scores[0][indices]
+        scores = scores[indices]
 
         # find the order with which to sort the scores
         scores_sort = np.argsort(-scores)[:max_detections]
 
         # select detections
-        image_boxes      = boxes[0, indices[scores_sort], :]
+        image_boxes      = boxes[indices[scores_sort], :]
         image_scores     = scores[scores_sort]
-        image_labels     = labels[0, indices[scores_sort]]
+        image_labels     = labels[indices[scores_sort]]
         image_detections = np.concatenate([image_boxes, np.expand_dims(image_scores, axis=1), np.expand_dims(image_labels, axis=1)], axis=1)
 
         if save_path is not None:
+            if raw_image is None:
+                raw_image = generator.load_image(i)
+
             draw_annotations(raw_image, generator.load_annotations(i), label_to_name=generator.label_to_name)
             draw_detections(raw_image, image_boxes, image_scores, image_labels, label_to_name=generator.label_to_name, score_threshold=score_threshold)
 
@@ -118,9 +309,10 @@ def _get_detections(generator, model, score_threshold=0.05, max_detections=100,
 
             all_detections[i][label] = image_detections[image_detections[:, -1] == label, :-1]
 
-        all_inferences[i] = inference_time
+        timings['postprocess'] = time.time() - start
+        all_timings[i]         = timings
 
-    return all_detections, all_inferences
+    return all_detections, all_timings
 
 
 def _get_annotations(generator):
@@ -156,7 +348,10 @@ def evaluate(
     iou_threshold=0.5,
     score_threshold=0.05,
     max_detections=100,
-    save_path=None
+    save_path=None,
+    workers=1,
+    batch_size=1,
+    prefetch=2
 ):
     """ Evaluate a given dataset using a given model.
 
@@ -167,13 +362,25 @@ def evaluate(
         score_threshold : The score confidence threshold to use for detections.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save images with visualized detections to.
+        workers         : The number of processes used to compute the average precisions (one class per task).
+        batch_size      : The number of images per call to the model.
+        prefetch        : The number of batches to prepare in the background while the model runs.
     # Returns
-        A dict mapping class names to mAP scores.
+        A dict mapping class names to mAP scores, and a dict with the average time per image spent in each stage
+        (decode, preprocess, inference, postprocess). Since decoding and preprocessing overlap with inference,
+        the sum of these times can be larger than the total time spent.
     """
     # gather all detections and annotations
-    all_detections, all_inferences = _get_detections(generator, model, score_threshold=score_threshold, max_detections=max_detections, save_path=save_path)
-    all_annotations    = _get_annotations(generator)
-    average_precisions = {}
+    all_detections, all_timings = _get_detections(
+        generator,
+        model,
+        score_threshold=score_threshold,
+        max_detections=max_detections,
+        save_path=save_path,
+        batch_size=batch_size,
+        prefetch=prefetch
+    )
+    all_annotations = _get_annotations(generator)
 
     # all_detections = pickle.load(open('all_detections.pkl', 'rb'))
     # all_annotations = pickle.load(open('all_annotations.pkl', 'rb'))
@@ -181,64 +388,23 @@ def evaluate(
     # pickle.dump(all_annotations, open('all_annotations.pkl', 'wb'))
 
     # process detections and annotations
-    for label in range(generator.num_classes()):
-        if not generator.has_label(label):
-            continue
-
-        false_positives = np.zeros((0,))
-        true_positives  = np.zeros((0,))
-        scores          = np.zeros((0,))
-        num_annotations = 0.0
-
-        for i in range(generator.size()):
-            detections           = all_detections[i][label]
-            annotations          = all_annotations[i][label]
-            num_annotations     += annotations.shape[0]
-            detected_annotations = []
-
-            for d in detections:
-                scores = np.append(scores, d[4])
-
-                if annotations.shape[0] == 0:
-                    false_positives = np.append(false_positives, 1)
-                    true_positives  = np.append(true_positives, 0)
-                    continue
-
-                overlaps            = compute_overlap(np.expand_dims(d, axis=0), annotations)
-                assigned_annotation = np.argmax(overlaps, axis=1)
-                max_overlap         = overlaps[0, assigned_annotation]
-
-                if max_overlap >= iou_threshold and assigned_annotation not in detected_annotations:
-                    false_positives = np.append(false_positives, 0)
-                    true_positives  = np.append(true_positives, 1)
-                    detected_annotations.append(assigned_annotation)
-                else:
-                    false_positives = np.append(false_positives, 1)
-                    true_positives  = np.append(true_positives, 0)
-
-        # no annotations -> AP for this class is 0 (is this correct?)
-        if num_annotations == 0:
-            average_precisions[label] = 0, 0
-            continue
-
-        # sort by score
-        indices         = np.argsort(-scores)
-        false_positives = false_positives[indices]
-        true_positives  = true_positives[indices]
-
-        # compute false positives and true positives
-        false_positives = np.cumsum(false_positives)
-        true_positives  = np.cumsum(true_positives)
-
-        # compute recall and precision
-        recall    = true_positives / num_annotations
-        precision = true_positives / np.maximum(true_positives + false_positives, np.finfo(np.float64).eps)
-
-        # compute average precision
-        average_precision  = _compute_ap(recall, precision)
-        average_precisions[label] = average_precision, num_annotations
-
-        # inference time
-        inference_time = np.sum(all_inferences) / generator.size()
-
-    return average_precisions, inference_time
+    labels = [label for label in range(generator.num_classes()) if generator.has_label(label)]
+    shards = [
+        ([detections[label] for detections in all_detections], [annotations[label] for annotations in all_annotations], iou_threshold)
+        for label in labels
+    ]
+
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_evaluate_label, shards)
+    else:
+        results = [_evaluate_label(shard) for shard in shards]
+
+    average_precisions = dict(zip(labels, results))
+
+    # average time per image for every stage
+    timings = {}
+    for stage in ['decode', 'preprocess', 'inference', 'postprocess']:
+        timings[stage] = np.sum([image_timings[stage] for image_timings in all_timings]) / generator.size()
+
+    return average_precisions, timings
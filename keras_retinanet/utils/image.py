@@ -22,6 +22,16 @@ from PIL import Image
 from .transform import change_transform_origin
 
 
+def _image_to_bgr(image):
+    """ Convert a PIL image to a BGR numpy array.
+
+    RGB images are not converted by PIL (which would copy them), the channels are swapped by OpenCV in a single pass.
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+
+
 def read_image_bgr(path):
     """ Read an image in BGR format.
 
@@ -29,8 +39,34 @@ def read_image_bgr(path):
         path: Path to the image.
     """
     # We deliberately don't use cv2.imread here, since it gives no feedback on errors while reading the image.
-    image = np.asarray(Image.open(path).convert('RGB'))
-    return image[:, :, ::-1].copy()
+    return _image_to_bgr(Image.open(path))
+
+
+def read_image_bgr_reduced(path, min_side=800, max_side=1333):
+    """ Read an image in BGR format, at a reduced resolution if it will be downscaled by at least a factor 2.
+
+    JPEG images are decoded at 1/2, 1/4 or 1/8 of their resolution (using DCT scaling), as long as the decoded image
+    is still at least as large as the image resized using min_side and max_side. Other images are decoded at full resolution.
+
+    Args
+        path     : Path to the image.
+        min_side : The min side the image will be resized to.
+        max_side : The max side the image will be resized to.
+
+    Returns
+        A tuple (image, scale), where scale is the size of the decoded image relative to the full resolution image.
+    """
+    image         = Image.open(path)
+    width, height = image.size
+
+    # the header is parsed when opening, so the resize scale is known before decoding
+    scale = compute_resize_scale((height, width, 3), min_side=min_side, max_side=max_side)
+    if scale <= 0.5:
+        # draft selects the largest reduction that keeps the image at least as large as the resized image
+        image.draft('RGB', (int(round(width * scale)), int(round(height * scale))))
+
+    # the decoded size is rounded up, use the smallest relative size so scaled boxes stay inside the image
+    return _image_to_bgr(image), min(float(image.width) / width, float(image.height) / height)
 
 
 def preprocess_image(x, mode='caffe'):
@@ -61,6 +97,40 @@ def preprocess_image(x, mode='caffe'):
     return x
 
 
+def compute_image_batch(images, preprocess, batch_size=None, dtype=np.float32):
+    """ Preprocess images and combine them in a single batch, padding them to the same shape.
+
+    Images are expected to be resized already (and may still be uint8), so that preprocessing is done at the resized resolution.
+    Each preprocessed image is written directly into its slice of the batch and only the padding is zeroed.
+
+    Args
+        images: List of images of shape (None, None, 3).
+        preprocess: Function handler for preprocessing a single image (see Backbone.preprocess_image).
+        batch_size: The size of the batch (defaults to the number of images), missing entries are filled with zeros.
+        dtype: The type of the batch.
+
+    Returns
+        The image batch of shape (batch_size, max_height, max_width, channels).
+    """
+    if batch_size is None:
+        batch_size = len(images)
+
+    # get the max image shape
+    max_shape   = tuple(max(image.shape[x] for image in images) for x in range(3))
+    image_batch = np.empty((batch_size,) + max_shape, dtype=dtype)
+
+    # copy all images to the upper left part of the image batch object, and zero the rest
+    for image_index, image in enumerate(images):
+        height, width, channels = image.shape
+        image_batch[image_index, :height, :width, :channels] = preprocess(image)
+        image_batch[image_index, :height, :width, channels:] = 0
+        image_batch[image_index, :height, width:]            = 0
+        image_batch[image_index, height:]                    = 0
+    image_batch[len(images):] = 0
+
+    return image_batch
+
+
 def adjust_transform_for_image(transform, image, relative_translation):
     """ Adjust a transformation for a specific image.
 
@@ -126,7 +196,7 @@ class TransformParameters:
             return cv2.INTER_LANCZOS4
 
 
-def apply_transform(matrix, image, params):
+def apply_transform(matrix, image, params, output_shape=None):
     """
     Apply a transformation to an image.
 
@@ -136,14 +206,18 @@ def apply_transform(matrix, image, params):
     Mathematically speaking, that means that the matrix is a transformation from the transformed image space to the original image space.
 
     Args
-      matrix: A homogeneous 3 by 3 matrix holding representing the transformation to apply.
-      image:  The image to transform.
-      params: The transform parameters (see TransformParameters)
+      matrix:       A homogeneous 3 by 3 matrix holding representing the transformation to apply.
+      image:        The image to transform.
+      params:       The transform parameters (see TransformParameters)
+      output_shape: The (height, width) of the generated image (defaults to the shape of the image).
     """
+    if output_shape is None:
+        output_shape = image.shape[:2]
+
     output = cv2.warpAffine(
         image,
         matrix[:2, :],
-        dsize       = (image.shape[1], image.shape[0]),
+        dsize       = (output_shape[1], output_shape[0]),
         flags       = params.cvInterpolation(),
         borderMode  = params.cvBorderMode(),
         borderValue = params.cval,
@@ -256,6 +330,20 @@ class VisualEffect:
     def __call__(self, image):
         """ Apply a visual effect on the image.
 
+        For uint8 images the effects are applied using lookup tables (see apply_lookup_tables),
+        which gives the same result as applying them one by one (see apply_separately).
+
+        Args
+            image: Image to adjust
+        """
+        if image.dtype != np.uint8:
+            return self.apply_separately(image)
+
+        return self.apply_lookup_tables(image)
+
+    def apply_separately(self, image):
+        """ Apply a visual effect on the image, one adjustment at a time.
+
         Args
             image: Image to adjust
         """
@@ -278,6 +366,47 @@ class VisualEffect:
 
         return image
 
+    def apply_lookup_tables(self, image):
+        """ Apply a visual effect on a uint8 image using per channel lookup tables.
+
+        Contrast and brightness are combined in a single lookup table for the BGR image,
+        hue and saturation in a single lookup table for the HSV image.
+        The input image is not modified, all operations after the first lookup are done in place.
+
+        Args
+            image: Image to adjust, with dtype uint8.
+        """
+        values = np.arange(256, dtype=np.float64)
+
+        # contrast and brightness, per BGR channel
+        if self.contrast_factor or self.brightness_delta:
+            lut = np.repeat(values[:, None], image.shape[2], axis=1)
+            if self.contrast_factor:
+                mean = np.array(cv2.mean(image)[:image.shape[2]])
+                lut  = _clip((lut - mean) * self.contrast_factor + mean)
+            if self.brightness_delta:
+                lut = _clip(lut + self.brightness_delta * 255)
+            image = cv2.LUT(image, lut.astype(np.uint8).reshape(256, 1, image.shape[2]))
+
+        # hue and saturation, on the HSV image
+        if self.hue_delta or self.saturation_factor:
+            hsv_lut = np.repeat(values[:, None], 3, axis=1)
+            if self.hue_delta:
+                hsv_lut[:, 0] = np.mod(hsv_lut[:, 0] + self.hue_delta * 180, 180)
+            if self.saturation_factor:
+                hsv_lut[:, 1] = np.clip(hsv_lut[:, 1] * self.saturation_factor, 0, 255)
+            hsv_lut = hsv_lut.astype(np.uint8).reshape(256, 1, 3)
+
+            # only convert in place if the image is not the input image
+            if self.contrast_factor or self.brightness_delta:
+                cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=image)
+            else:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            cv2.LUT(image, hsv_lut, dst=image)
+            cv2.cvtColor(image, cv2.COLOR_HSV2BGR, dst=image)
+
+        return image
+
 
 def random_visual_effect_generator(
     contrast_range=(0.9, 1.1),
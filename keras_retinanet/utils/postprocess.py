@@ -0,0 +1,226 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import keras
+import numpy as np
+
+from .compute_overlap import non_max_suppression
+
+
+def bbox_transform_inv(boxes, deltas, mean=None, std=None):
+    """ Applies deltas (usually regression results) to boxes (usually anchors), like layers.RegressBoxes.
+
+    Args
+        boxes  : np.array of shape (..., 4) for (x1, y1, x2, y2).
+        deltas : np.array of the same shape as boxes with the (normalized) deltas (d_x1, d_y1, d_x2, d_y2).
+        mean   : The mean value used when computing deltas (defaults to [0, 0, 0, 0]).
+        std    : The standard deviation used when computing deltas (defaults to [0.2, 0.2, 0.2, 0.2]).
+
+    Returns
+        A np.array of the same shape as boxes, but with deltas applied to each box.
+    """
+    if mean is None:
+        mean = [0, 0, 0, 0]
+    if std is None:
+        std = [0.2, 0.2, 0.2, 0.2]
+
+    sizes = np.concatenate([boxes[..., 2:] - boxes[..., :2]] * 2, axis=-1)
+    return (boxes + (deltas * np.asarray(std, dtype=deltas.dtype) + np.asarray(mean, dtype=deltas.dtype)) * sizes).astype(boxes.dtype)
+
+
+def clip_boxes(boxes, image_shape):
+    """ Clip boxes to lie inside an image, like layers.ClipBoxes.
+
+    Args
+        boxes       : np.array of shape (..., 4) for (x1, y1, x2, y2).
+        image_shape : The (height, width) of the (padded) network input.
+
+    Returns
+        A np.array with the clipped boxes.
+    """
+    height, width = image_shape[:2]
+    upper         = np.array([width - 1, height - 1, width - 1, height - 1], dtype=boxes.dtype)
+    return np.clip(boxes, 0, upper)
+
+
+def filter_detections(
+    boxes,
+    classification,
+    other                 = [],
+    class_specific_filter = True,
+    nms                   = True,
+    score_threshold       = 0.05,
+    max_detections        = 300,
+    nms_threshold         = 0.5
+):
+    """ Filter the detections of an image using the boxes and classification values, like layers.filter_detections.
+
+    Args
+        boxes                 : np.array of shape (num_boxes, 4) containing the boxes in (x1, y1, x2, y2) format.
+        classification        : np.array of shape (num_boxes, num_classes) containing the classification scores.
+        other                 : List of np.arrays of shape (num_boxes, ...) to filter along with the boxes and classification scores.
+        class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+        nms                   : Flag to enable/disable non maximum suppression.
+        score_threshold       : Threshold used to prefilter the boxes with.
+        max_detections        : Maximum number of detections to keep.
+        nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
+
+    Returns
+        A list of [boxes, scores, labels, other[0], other[1], ...], padded with -1's to max_detections detections.
+    """
+    def _filter(candidates, scores):
+        if nms and len(candidates):
+            return candidates[non_max_suppression(boxes[candidates], scores, iou_threshold=nms_threshold, max_output_size=max_detections)]
+        return candidates
+
+    if class_specific_filter:
+        # find all candidates at once, in order of their class
+        class_indices, anchor_indices = np.nonzero((classification > score_threshold).T)
+        splits                        = np.flatnonzero(np.diff(class_indices)) + 1
+
+        indices = []
+        labels  = []
+        for candidates, candidate_labels in zip(np.split(anchor_indices, splits), np.split(class_indices, splits)):
+            if len(candidates):
+                candidates = _filter(candidates, classification[candidates, candidate_labels[0]])
+                indices.append(candidates)
+                labels.append(candidate_labels[:len(candidates)])
+
+        indices = np.concatenate(indices) if indices else np.zeros((0,), dtype=np.int64)
+        labels  = np.concatenate(labels) if labels else np.zeros((0,), dtype=np.int64)
+    else:
+        scores  = np.max(classification, axis=1)
+        labels  = np.argmax(classification, axis=1)
+        indices = np.flatnonzero(scores > score_threshold)
+        indices = _filter(indices, scores[indices])
+        labels  = labels[indices]
+
+    # select top k, in order of decreasing score
+    scores = classification[indices, labels]
+    top    = np.argsort(-scores, kind='stable')[:max_detections]
+    count  = len(top)
+
+    # pad the outputs with -1's
+    def _pad(values, dtype):
+        padded         = -np.ones((max_detections,) + values.shape[1:], dtype=dtype)
+        padded[:count] = values
+        return padded
+
+    indices = indices[top]
+    return [
+        _pad(boxes[indices], boxes.dtype),
+        _pad(scores[top], classification.dtype),
+        _pad(labels[top], np.int32),
+    ] + [_pad(o[indices], o.dtype) for o in other]
+
+
+class PostProcessor(object):
+    """ Decode and filter the raw outputs of a RetinaNet model on the host (see models.retinanet.retinanet_raw).
+
+    The results are the same as the outputs of the inference model (retinanet_bbox) with the same parameters.
+    """
+
+    def __init__(
+        self,
+        nms                   = True,
+        class_specific_filter = True,
+        nms_threshold         = 0.5,
+        score_threshold       = 0.05,
+        max_detections        = 300,
+        mean                  = None,
+        std                   = None,
+    ):
+        """ Initialize a PostProcessor.
+
+        Args
+            nms                   : Flag to enable/disable NMS.
+            class_specific_filter : Whether to perform filtering per class, or take the best scoring class and filter those.
+            nms_threshold         : Threshold for the IoU value to determine when a box should be suppressed.
+            score_threshold       : Threshold used to prefilter the boxes with.
+            max_detections        : Maximum number of detections to keep.
+            mean                  : The mean of the regression values (as in layers.RegressBoxes).
+            std                   : The standard deviation of the regression values (as in layers.RegressBoxes).
+        """
+        self.nms                   = nms
+        self.class_specific_filter = class_specific_filter
+        self.nms_threshold         = nms_threshold
+        self.score_threshold       = score_threshold
+        self.max_detections        = max_detections
+        self.mean                  = mean
+        self.std                   = std
+
+    def __call__(self, image_shape, anchors, regression, classification, *other):
+        """ Compute the detections of a batch.
+
+        Args
+            image_shape    : The (height, width) of the (padded) network input.
+            anchors        : np.array of shape (batch_size, num_boxes, 4) with the anchors.
+            regression     : np.array of shape (batch_size, num_boxes, 4) with the regression values.
+            classification : np.array of shape (batch_size, num_boxes, num_classes) with the classification scores.
+            other          : np.arrays of shape (batch_size, num_boxes, ...) to filter along with the boxes.
+
+        Returns
+            A list of [boxes, scores, labels, other[0], other[1], ...] with a batch dimension, like the outputs of retinanet_bbox.
+        """
+        boxes = clip_boxes(bbox_transform_inv(anchors, regression, mean=self.mean, std=self.std), image_shape)
+
+        detections = [
+            filter_detections(
+                boxes[i],
+                classification[i],
+                [o[i] for o in other],
+                class_specific_filter = self.class_specific_filter,
+                nms                   = self.nms,
+                score_threshold       = self.score_threshold,
+                max_detections        = self.max_detections,
+                nms_threshold         = self.nms_threshold,
+            ) for i in range(classification.shape[0])
+        ]
+
+        return [np.stack(outputs, axis=0) for outputs in zip(*detections)]
+
+
+def predict_pipelined(model, batches, postprocessor=None):
+    """ Predict batches with a raw output model, post-processing every batch while the next batch is predicted.
+
+    Args
+        model         : A model created with retinanet_raw (or convert_model with raw_outputs=True).
+        batches       : Iterable of image batches of shape (batch_size, height, width, channels).
+        postprocessor : The PostProcessor to compute the detections with (defaults to PostProcessor()).
+
+    Returns
+        A generator yielding the detections of every batch, as returned by PostProcessor.
+    """
+    if postprocessor is None:
+        postprocessor = PostProcessor()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for batch in batches:
+            if keras.backend.image_data_format() == 'channels_first':
+                image_shape = batch.shape[2:4]
+            else:
+                image_shape = batch.shape[1:3]
+
+            outputs = model.predict_on_batch(batch)
+            if pending is not None:
+                yield pending.result()
+            pending = executor.submit(postprocessor, image_shape, *[np.asarray(o) for o in outputs])
+
+        if pending is not None:
+            yield pending.result()
@@ -54,6 +54,33 @@ def transform_aabb(transform, aabb):
     return [min_corner[0], min_corner[1], max_corner[0], max_corner[1]]
 
 
+def transform_aabbs(transform, aabbs):
+    """ Apply a transformation to a set of axis aligned bounding boxes.
+
+    This is the vectorized version of transform_aabb: the corners of all AABBs are transformed with a single matrix multiplication.
+
+    Args
+        transform: The transformation to apply.
+        aabbs:     (N, 4) array of AABBs (x1, y1, x2, y2).
+    Returns
+        The new AABBs as (N, 4) array (x1, y1, x2, y2).
+    """
+    aabbs = np.asarray(aabbs, dtype=np.float64).reshape(-1, 4)
+
+    # All 4 corners of every AABB as homogeneous points, shape (N, 4, 3).
+    points = np.stack([
+        aabbs[:, [0, 2, 0, 2]],
+        aabbs[:, [1, 3, 3, 1]],
+        np.ones((aabbs.shape[0], 4)),
+    ], axis=2)
+
+    # Transform all corners, shape (N, 4, 2).
+    points = points.dot(np.asarray(transform, dtype=np.float64)[:2].T)
+
+    # Extract the min and max corners again.
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
 def _random_vector(min, max, prng=DEFAULT_PRNG):
     """ Construct a random vector between min and max.
     Args
@@ -1,3 +1,5 @@
+import sys
+
 import setuptools
 from setuptools.extension import Extension
 from distutils.command.build_ext import build_ext as DistUtilsBuildExt
@@ -34,10 +36,15 @@ class BuildExtension(setuptools.Command):
         return self._command.run(*args, **kwargs)
 
 
+# OpenMP is used to parallelize the overlap computation, it is only enabled where the default compiler supports it.
+openmp_args = ['-fopenmp'] if sys.platform.startswith('linux') else []
+
 extensions = [
     Extension(
         'keras_retinanet.utils.compute_overlap',
-        ['keras_retinanet/utils/compute_overlap.pyx']
+        ['keras_retinanet/utils/compute_overlap.pyx'],
+        extra_compile_args=openmp_args,
+        extra_link_args=openmp_args,
     ),
 ]
 
@@ -60,8 +67,10 @@ setuptools.setup(
             'retinanet-evaluate=keras_retinanet.bin.evaluate:main',
             'retinanet-debug=keras_retinanet.bin.debug:main',
             'retinanet-convert-model=keras_retinanet.bin.convert_model:main',
+            'retinanet-build-image-cache=keras_retinanet.bin.build_image_cache:main',
+            'retinanet-build-shards=keras_retinanet.bin.build_shards:main',
         ],
     },
     ext_modules    = extensions,
-    setup_requires = ["cython>=0.28", "numpy>=1.14.0"]
+    setup_requires = ["cython>=0.29.31", "numpy>=1.14.0"]
 )
@@ -92,3 +92,27 @@ def test_vgg():
         'coco',
         'tests/test-data/coco',
     ])
+
+
+@pytest.mark.parametrize('arguments, loader_workers', [
+    (['--multiprocessing', '--workers=3'], 3),
+    (['--multiprocessing', '--workers=3', '--loader-workers=2'], 2),
+    (['--workers=3'], 0),
+])
+def test_shards_multiprocessing(arguments, loader_workers):
+    # ignore warnings in this test
+    warnings.simplefilter('ignore')
+
+    # forked fit_generator workers would all read the same shard stream, so shards are streamed through the loader
+    args = keras_retinanet.bin.train.parse_args(arguments + ['shards', 'tests/test-data/shards'])
+    assert args.loader_workers == loader_workers
+
+
+def test_evaluation_workers():
+    # the average precisions are computed with --workers processes during training
+    args = keras_retinanet.bin.train.parse_args(['--workers=3', '--no-snapshots', 'csv', 'annotations.csv', 'classes.csv'])
+
+    callbacks  = keras_retinanet.bin.train.create_callbacks(None, None, None, object(), args)
+    evaluation = [c.callback for c in callbacks if isinstance(c, keras_retinanet.callbacks.RedirectModel)]
+    assert len(evaluation) == 1
+    assert evaluation[0].workers == 3
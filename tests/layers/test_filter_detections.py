@@ -17,8 +17,10 @@ limitations under the License.
 import keras
 import keras_retinanet.backend
 import keras_retinanet.layers
+import keras_retinanet.utils.tf_version
 
 import numpy as np
+import pytest
 
 
 class TestFilterDetections(object):
@@ -171,3 +173,64 @@ class TestFilterDetections(object):
         np.testing.assert_array_equal(actual_boxes, expected_boxes)
         np.testing.assert_array_equal(actual_scores, expected_scores)
         np.testing.assert_array_equal(actual_labels, expected_labels)
+
+    def test_batched(self):
+        np.random.seed(0)
+
+        # random boxes, with many overlapping boxes of different classes
+        corners        = np.random.uniform(0, 100, (2, 200, 2))
+        sizes          = np.random.uniform(5, 40, (2, 200, 2))
+        boxes          = np.concatenate([corners, corners + sizes], axis=2).astype(keras.backend.floatx())
+        classification = np.random.uniform(0, 1, (2, 200, 4)).astype(keras.backend.floatx()) ** 4
+        other          = [np.random.uniform(0, 1, (2, 200, 3)).astype(keras.backend.floatx())]
+
+        inputs = [keras.backend.constant(boxes), keras.backend.constant(classification)] + [keras.backend.constant(o) for o in other]
+
+        for nms in [True, False]:
+            for class_specific_filter in [True, False]:
+                kwargs = {'nms': nms, 'class_specific_filter': class_specific_filter, 'max_detections': 50}
+
+                # with enough candidates, the batched filtering finds the same detections
+                expected = [keras.backend.eval(o) for o in keras_retinanet.layers.FilterDetections(**kwargs).call(inputs)]
+                actual   = [keras.backend.eval(o) for o in keras_retinanet.layers.FilterDetections(pre_nms_top_k=800, **kwargs).call(inputs)]
+
+                for a, e in zip(actual, expected):
+                    assert a.shape == e.shape
+                    np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-4)
+
+    def test_batched_unclipped(self):
+        np.random.seed(1)
+
+        # unclipped boxes (partially outside of a 800x1333 image), with many classes
+        corners        = np.random.uniform(-300, 1300, (2, 400, 2))
+        sizes          = np.random.uniform(16, 400, (2, 400, 2))
+        boxes          = np.concatenate([corners, corners + sizes], axis=2).astype(keras.backend.floatx())
+        classification = (np.random.permutation(2 * 400 * 500).reshape(2, 400, 500) / (2 * 400 * 500.0)) ** 16  # no equal scores
+        classification = classification.astype(keras.backend.floatx())
+
+        # a box of class 1 that lies exactly (max + 1) below a box of class 0, so the two would coincide if the class offsets
+        # didn't account for negative coordinates
+        upper                = boxes.max()
+        boxes[0, 0]          = [upper - 100, upper - 100, upper, upper]
+        boxes[0, 1]          = boxes[0, 0] - (upper + 1)
+        classification[0, 0] = [0.999] + [0] * 499
+        classification[0, 1] = [0, 0.998] + [0] * 498
+
+        inputs = [keras.backend.constant(boxes), keras.backend.constant(classification)]
+
+        # with enough candidates, the batched filtering finds the same detections as the filtering per class
+        kwargs   = {'max_detections': 100}
+        expected = [keras.backend.eval(o) for o in keras_retinanet.layers.FilterDetections(**kwargs).call(inputs)]
+        actual   = [keras.backend.eval(o) for o in keras_retinanet.layers.FilterDetections(pre_nms_top_k=2000, **kwargs).call(inputs)]
+
+        for a, e in zip(actual, expected):
+            assert a.shape == e.shape
+            np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-4)
+
+    def test_batched_tf_version(self, monkeypatch):
+        # batched NMS is not available before tensorflow 2.3.0
+        monkeypatch.setattr(keras_retinanet.utils.tf_version, 'tf_version', lambda: (2, 2, 0))
+
+        inputs = [keras.backend.constant(np.zeros((1, 10, 4))), keras.backend.constant(np.zeros((1, 10, 3)))]
+        with pytest.raises(ValueError):
+            keras_retinanet.layers.FilterDetections(pre_nms_top_k=5).call(inputs)
@@ -19,6 +19,7 @@ import keras_retinanet.backend
 import keras_retinanet.layers
 
 import numpy as np
+import pytest
 
 
 class TestAnchors(object):
@@ -210,3 +211,60 @@ class TestRegressBoxes(object):
         ], dtype=keras.backend.floatx())
 
         np.testing.assert_array_almost_equal(actual, expected, decimal=2)
+
+
+class TestDecodeBoxes(object):
+    @pytest.mark.parametrize('image_shape', [None, (60, 80)])
+    def test_simple(self, image_shape):
+        np.random.seed(0)
+
+        mean = [0.1, 0, -0.1, 0]
+        std  = [0.2, 0.1, 0.2, 0.3]
+
+        # anchors that partially lie outside of the image, so some boxes are clipped
+        corners    = np.random.uniform(-20, 90, (2, 50, 2))
+        anchors    = np.concatenate([corners, corners + np.random.uniform(4, 40, (2, 50, 2))], axis=2)
+        regression = np.random.uniform(-1, 1, (2, 50, 4))
+        image      = np.zeros((2, 60, 80, 3))
+
+        image, anchors, regression = [keras.backend.constant(value.astype(keras.backend.floatx())) for value in [image, anchors, regression]]
+
+        layer  = keras_retinanet.layers.DecodeBoxes(mean=mean, std=std, image_shape=image_shape)
+        actual = keras.backend.eval(layer.call([image, anchors, regression]))
+
+        # compare with applying RegressBoxes and ClipBoxes separately
+        boxes    = keras_retinanet.layers.RegressBoxes(mean=mean, std=std).call([anchors, regression])
+        expected = keras.backend.eval(keras_retinanet.layers.ClipBoxes().call([image, boxes]))
+
+        np.testing.assert_array_almost_equal(actual, expected, decimal=4)
+        assert actual.min() >= 0 and actual[..., 0::2].max() <= 79 and actual[..., 1::2].max() <= 59
+
+        # the layer can be recreated from its config
+        layer = keras_retinanet.layers.DecodeBoxes.from_config(layer.get_config())
+        np.testing.assert_array_almost_equal(keras.backend.eval(layer.call([image, anchors, regression])), expected, decimal=4)
+
+
+class TestSelectTopKPerLevel(object):
+    def test_simple(self):
+        np.random.seed(0)
+
+        # two levels with 5 and 3 anchors, and a batch of two images (the anchors are the same for every image)
+        level_anchors  = [np.tile(np.random.uniform(0, 100, (1, 5, 4)), (2, 1, 1)), np.tile(np.random.uniform(0, 100, (1, 3, 4)), (2, 1, 1))]
+        regression     = np.random.uniform(-1, 1, (2, 8, 4))
+        classification = np.random.uniform(0, 1, (2, 8, 3))
+        other          = np.random.uniform(0, 1, (2, 8, 2))
+
+        inputs  = [keras.backend.constant(value.astype(keras.backend.floatx())) for value in level_anchors + [regression, classification, other]]
+        layer   = keras_retinanet.layers.SelectTopKPerLevel(k=4, num_levels=2)
+        outputs = [keras.backend.eval(output) for output in layer.call(inputs)]
+
+        anchors = np.concatenate(level_anchors, axis=1)
+        scores  = classification.max(axis=2)
+        for b in range(2):
+            # the 4 best anchors of the first level, and all 3 anchors of the second level, in order of their score
+            expected = np.concatenate([np.argsort(-scores[b, :5])[:4], 5 + np.argsort(-scores[b, 5:])])
+            for output, value in zip(outputs, [anchors, regression, classification, other]):
+                assert output.shape[1] == 7
+                np.testing.assert_almost_equal(output[b], value[b, expected], decimal=5)
+
+        assert layer.get_config()['k'] == 4
@@ -0,0 +1,81 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import keras
+import numpy as np
+import pytest
+
+import keras_retinanet.layers  # noqa: F401
+from keras_retinanet.models.retinanet import retinanet_bbox
+
+
+def tiny_retinanet(num_classes=3, num_anchors=9):
+    """ Create a small model with the pyramid features and outputs of a RetinaNet training model. """
+    inputs = keras.layers.Input(shape=(None, None, 3))
+
+    # P3 has stride 8, every next level has twice the stride
+    x = inputs
+    for _ in range(3):
+        x = keras.layers.Conv2D(8, 3, strides=2, padding='same', activation='relu')(x)
+
+    features = []
+    for level in range(3, 8):
+        if level > 3:
+            x = keras.layers.Conv2D(8, 3, strides=2, padding='same', activation='relu')(x)
+        x = keras.layers.Activation('linear', name='P{}'.format(level))(x)
+        features.append(x)
+
+    regression = keras.layers.Concatenate(axis=1, name='regression')([
+        keras.layers.Reshape((-1, 4))(keras.layers.Conv2D(num_anchors * 4, 1)(f)) for f in features
+    ])
+    classification = keras.layers.Concatenate(axis=1, name='classification')([
+        keras.layers.Reshape((-1, num_classes))(keras.layers.Conv2D(num_anchors * num_classes, 1, activation='sigmoid')(f)) for f in features
+    ])
+
+    return keras.models.Model(inputs=inputs, outputs=[regression, classification])
+
+
+@pytest.mark.parametrize('level_top_k', [None, 10000])
+def test_static_anchors(level_top_k):
+    np.random.seed(0)
+    model = tiny_retinanet()
+    image = np.random.uniform(-1, 1, (2, 100, 130, 3)).astype(keras.backend.floatx())
+
+    dynamic = retinanet_bbox(model=model, level_top_k=level_top_k)
+    static  = retinanet_bbox(model=model, level_top_k=level_top_k, image_shape=(100, 130))
+
+    assert static.inputs[0].shape[1:3] == (100, 130)
+    assert not any(isinstance(layer, keras_retinanet.layers.Anchors) for layer in static.layers)
+
+    expected = dynamic.predict_on_batch(image)
+    actual   = static.predict_on_batch(image)
+    for a, e in zip(actual, expected):
+        np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-4)
+
+    # the static model can be saved and loaded
+    config = static.get_config()
+    custom_objects = {
+        'StaticAnchors'      : keras_retinanet.layers.StaticAnchors,
+        'RegressBoxes'       : keras_retinanet.layers.RegressBoxes,
+        'ClipBoxes'          : keras_retinanet.layers.ClipBoxes,
+        'DecodeBoxes'        : keras_retinanet.layers.DecodeBoxes,
+        'FilterDetections'   : keras_retinanet.layers.FilterDetections,
+        'SelectTopKPerLevel' : keras_retinanet.layers.SelectTopKPerLevel,
+    }
+    restored = keras.models.Model.from_config(config, custom_objects=custom_objects)
+    restored.set_weights(static.get_weights())
+    for a, e in zip(restored.predict_on_batch(image), expected):
+        np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,96 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from keras_retinanet.preprocessing.annotation_store import AnnotationStore
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+
+
+def write_csv_dataset(tmpdir):
+    classes     = tmpdir.join('classes.csv')
+    annotations = tmpdir.join('annotations.csv')
+    classes.write('a,0\nb,1\n')
+    annotations.write('img_1.jpg,1,2,3,4,a\nimg_1.jpg,5,6,7,8,b\nimg_2.jpg,,,,,\n')
+    for name in ('img_1.jpg', 'img_2.jpg'):
+        cv2.imwrite(str(tmpdir.join(name)), np.zeros((16, 24, 3), dtype=np.uint8))
+    return str(annotations), str(classes)
+
+
+def is_memmap(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_from_annotations():
+    store = AnnotationStore.from_annotations([
+        {'labels': np.array([0, 1]), 'bboxes': np.array([[1, 2, 3, 4], [5, 6, 7, 8]])},
+        {'labels': np.empty((0,)), 'bboxes': np.empty((0, 4))},
+        {'labels': np.array([2]), 'bboxes': np.array([[9, 10, 11, 12]])},
+    ])
+
+    assert store.size() == 3
+    np.testing.assert_equal(store.offsets, [0, 2, 2, 3])
+    np.testing.assert_equal(store.load_annotations(0)['labels'], [0, 1])
+    np.testing.assert_equal(store.load_annotations(2)['bboxes'], [[9, 10, 11, 12]])
+    assert store.load_annotations(1)['bboxes'].shape == (0, 4)
+
+
+def test_save_load(tmpdir):
+    source = tmpdir.join('source.txt')
+    source.write('annotations')
+    path   = str(tmpdir.join('cache'))
+
+    store = AnnotationStore.from_unsorted([1, 0, 1], [0, 1, 2], [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]], num_images=2)
+    store.save(path, [str(source)], key={'a': 1}, extra=['img_1', 'img_2'])
+
+    loaded, extra = AnnotationStore.load(path, [str(source)], key={'a': 1})
+    assert extra == ['img_1', 'img_2']
+    assert is_memmap(loaded.bboxes)
+    np.testing.assert_equal(loaded.labels, store.labels)
+    np.testing.assert_equal(loaded.bboxes, store.bboxes)
+    np.testing.assert_equal(loaded.offsets, store.offsets)
+
+    # a different key invalidates the cache
+    assert AnnotationStore.load(path, [str(source)], key={'a': 2}) is None
+
+    # a modified source invalidates the cache
+    stat = os.stat(str(source))
+    os.utime(str(source), (stat.st_atime, stat.st_mtime + 10))
+    assert AnnotationStore.load(path, [str(source)], key={'a': 1}) is None
+
+    # a missing cache is not an error
+    assert AnnotationStore.load(str(tmpdir.join('missing')), [str(source)]) is None
+
+
+def test_csv_generator_cache(tmpdir):
+    annotations, classes = write_csv_dataset(tmpdir)
+    path                 = str(tmpdir.join('cache'))
+
+    generator = CSVGenerator(annotations, classes, annotation_store_path=path)
+    assert os.path.exists(os.path.join(path, 'metadata.json'))
+
+    cached = CSVGenerator(annotations, classes, annotation_store_path=path)
+    assert cached.image_names == generator.image_names
+    for image_index in range(generator.size()):
+        np.testing.assert_equal(cached.load_annotations(image_index)['bboxes'], generator.load_annotations(image_index)['bboxes'])
+        np.testing.assert_equal(cached.load_annotations(image_index)['labels'], generator.load_annotations(image_index)['labels'])
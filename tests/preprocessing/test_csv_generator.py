@@ -15,6 +15,8 @@ limitations under the License.
 """
 
 import csv
+import cv2
+import numpy as np
 import pytest
 try:
     from io import StringIO
@@ -213,3 +215,53 @@ def test_read_annotations_empty_image():
 
     # Check that lines without annotations don't clear earlier annotations.
     assert csv_generator._read_annotations(csv_str('a.png,0,1,2,3,a\na.png,,,,,'), {'a': 1}) == {'a.png': [annotation(0, 1,  2,  3, 'a')]}
+
+
+def test_read_annotation_store():
+    classes = {'a': 1, 'b': 2, 'c': 4}
+    image_names, store = csv_generator._read_annotation_store(csv_str(
+        'a.png,0,1,2,3,a'   '\n'
+        'b.png,4,5,6,7,b'   '\n'
+        'e.png,,,,,'        '\n'
+        'a.png,8,9,10,11,c' '\n'
+    ), classes)
+
+    assert image_names == ['a.png', 'b.png', 'e.png']
+    assert store.size() == 3
+
+    annotations = store.load_annotations(0)
+    np.testing.assert_equal(annotations['labels'], [1, 4])
+    np.testing.assert_equal(annotations['bboxes'], [[0, 1, 2, 3], [8, 9, 10, 11]])
+    assert annotations['labels'].dtype == np.int32
+    assert annotations['bboxes'].dtype == np.float32
+
+    # the annotations are read-only views into the store
+    assert annotations['bboxes'].base is not None
+    with pytest.raises(ValueError):
+        annotations['bboxes'] *= 2
+
+    np.testing.assert_equal(store.load_annotations(1)['bboxes'], [[4, 5, 6, 7]])
+    assert store.load_annotations(2)['bboxes'].shape == (0, 4)
+    assert store.load_annotations(2)['labels'].shape == (0,)
+
+
+def test_image_data(tmpdir):
+    contents = (
+        'a.png,0,1,2,3,a'   '\n'
+        'b.png,4,5,6,7,b'   '\n'
+        'e.png,,,,,'        '\n'
+        'a.png,8,9,10,11,c' '\n'
+    )
+    classes = {'a': 1, 'b': 2, 'c': 4}
+
+    tmpdir.join('annotations.csv').write(contents)
+    tmpdir.join('classes.csv').write(''.join('{},{}\n'.format(name, label) for name, label in classes.items()))
+    for name, shape in [('a.png', (20, 30)), ('b.png', (30, 20)), ('e.png', (20, 20))]:
+        cv2.imwrite(str(tmpdir.join(name)), np.zeros(shape + (3,), dtype=np.uint8))
+
+    generator = csv_generator.CSVGenerator(str(tmpdir.join('annotations.csv')), str(tmpdir.join('classes.csv')))
+
+    # image_data is built from the annotation store, in the format of _read_annotations
+    assert generator.image_data == csv_generator._read_annotations(csv_str(contents), classes)
+    with pytest.raises(AttributeError):
+        generator.image_data = {}
@@ -15,19 +15,20 @@ limitations under the License.
 """
 
 from keras_retinanet.preprocessing.generator import Generator
+from keras_retinanet.utils.transform import random_transform_generator
 
 import numpy as np
 import pytest
 
 
 class SimpleGenerator(Generator):
-    def __init__(self, bboxes, labels, num_classes=0, image=None):
+    def __init__(self, bboxes, labels, num_classes=0, image=None, **kwargs):
         assert(len(bboxes) == len(labels))
         self.bboxes       = bboxes
         self.labels       = labels
         self.num_classes_ = num_classes
         self.image        = image
-        super(SimpleGenerator, self).__init__(group_method='none', shuffle_groups=False)
+        super(SimpleGenerator, self).__init__(group_method='none', shuffle_groups=False, **kwargs)
 
     def num_classes(self):
         return self.num_classes_
@@ -270,3 +271,44 @@ class TestFilterAnnotations(object):
         # test that only object with class 5 is present in labels_batch
         labels = np.unique(np.argmax(labels_batch == 5, axis=2))
         assert(len(labels) == 1 and labels[0] == 0), 'Expected only class 0 to be present, but got classes {}'.format(labels)
+
+
+class TestResizeBeforeAugment(object):
+    def test_targets(self):
+        bboxes = [
+            np.array([
+                [ 20,  30, 120, 180],
+                [300, 100, 550, 350],
+            ], dtype=float)
+        ]
+        labels = [np.array([1, 2])]
+
+        image = np.random.RandomState(0).randint(0, 256, (400, 600, 3)).astype(np.uint8)
+
+        targets = []
+        for resize_before_augment in [False, True]:
+            generator = SimpleGenerator(
+                [b.copy() for b in bboxes],
+                labels,
+                num_classes=3,
+                image=image,
+                image_min_side=200,
+                image_max_side=400,
+                transform_generator=random_transform_generator(
+                    prng=np.random.RandomState(1),
+                    min_rotation=-0.1,
+                    max_rotation=0.1,
+                    min_translation=(-0.1, -0.1),
+                    max_translation=(0.1, 0.1),
+                    flip_x_chance=0.5,
+                ),
+                resize_before_augment=resize_before_augment,
+            )
+            inputs, batch_targets = generator[0]
+            targets.append((inputs, batch_targets))
+
+        (inputs, (regression, classification)), (expected_inputs, (expected_regression, expected_classification)) = targets
+
+        assert inputs.shape == expected_inputs.shape
+        np.testing.assert_equal(classification, expected_classification)
+        np.testing.assert_allclose(regression, expected_regression, atol=1e-4)
@@ -0,0 +1,81 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+from keras_retinanet.preprocessing.image_cache import ImageCache, write_image_cache
+
+
+def write_csv_dataset(tmpdir, shapes):
+    classes = tmpdir.join('classes.csv')
+    classes.write('a,0\n')
+
+    prng  = np.random.RandomState(0)
+    lines = []
+    for i, shape in enumerate(shapes):
+        name = 'img_{}.png'.format(i)
+        cv2.imwrite(str(tmpdir.join(name)), prng.randint(0, 256, shape + (3,)).astype(np.uint8))
+        lines.append('{},10,20,60,70,a\n'.format(name))
+
+    annotations = tmpdir.join('annotations.csv')
+    annotations.write(''.join(lines))
+    return str(annotations), str(classes)
+
+
+def test_write_image_cache(tmpdir):
+    annotations, classes = write_csv_dataset(tmpdir, [(100, 150), (120, 80), (90, 90)])
+    path                 = str(tmpdir.join('cache'))
+
+    generator = CSVGenerator(annotations, classes, image_min_side=64, image_max_side=96, shuffle_groups=False)
+    write_image_cache(generator, path, shard_size=20000, workers=2)
+
+    image_cache = ImageCache(path)
+    assert image_cache.size() == 3
+    assert image_cache.metadata['num_shards'] > 1
+
+    for image_index in range(generator.size()):
+        expected, scale = generator.resize_image(generator.load_image(image_index))
+        image           = image_cache.load_image(image_index)
+
+        np.testing.assert_array_equal(image, expected)
+        assert image_cache.scale(image_index) == pytest.approx(scale)
+        assert image_cache.paths[image_index] == generator.image_path(image_index)
+        assert not image.flags.writeable
+
+
+def test_generator_image_cache(tmpdir):
+    annotations, classes = write_csv_dataset(tmpdir, [(100, 150), (120, 80), (90, 90), (80, 160)])
+    path                 = str(tmpdir.join('cache'))
+
+    generator_args = {'image_min_side': 64, 'image_max_side': 96, 'shuffle_groups': False, 'batch_size': 2}
+    generator      = CSVGenerator(annotations, classes, **generator_args)
+    write_image_cache(generator, path)
+
+    cached = CSVGenerator(annotations, classes, image_cache_path=path, **generator_args)
+    for group in generator.groups:
+        inputs, targets               = generator.compute_input_output(group)
+        cached_inputs, cached_targets = cached.compute_input_output(group)
+
+        np.testing.assert_array_equal(cached_inputs, inputs)
+        for target, cached_target in zip(targets, cached_targets):
+            np.testing.assert_array_equal(cached_target, target)
+
+    # the cache must be created with the same resize parameters
+    with pytest.raises(ValueError):
+        CSVGenerator(annotations, classes, image_cache_path=path, image_min_side=32, image_max_side=96)
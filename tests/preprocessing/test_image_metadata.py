@@ -0,0 +1,85 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+from keras_retinanet.preprocessing.image_metadata import ImageMetadata
+
+
+def write_csv_dataset(tmpdir, shapes):
+    classes = tmpdir.join('classes.csv')
+    classes.write('a,0\n')
+
+    lines = []
+    for i, shape in enumerate(shapes):
+        name = 'img_{}.png'.format(i)
+        cv2.imwrite(str(tmpdir.join(name)), np.zeros(shape + (3,), dtype=np.uint8))
+        lines.append('{},1,2,3,4,a\n'.format(name))
+
+    annotations = tmpdir.join('annotations.csv')
+    annotations.write(''.join(lines))
+    return str(annotations), str(classes)
+
+
+def test_build_save_load(tmpdir):
+    annotations, classes = write_csv_dataset(tmpdir, [(10, 20), (30, 15)])
+    paths                = [str(tmpdir.join('img_0.png')), str(tmpdir.join('img_1.png'))]
+    reads                = []
+
+    def read_image_size(image_index):
+        reads.append(image_index)
+        return [(20, 10), (15, 30)][image_index]
+
+    metadata = ImageMetadata.build(paths, read_image_size, workers=2)
+    assert sorted(reads) == [0, 1]
+    assert metadata.image_size(0) == (20, 10)
+    assert metadata.image_size(1) == (15, 30)
+    assert metadata.file_sizes[0] == os.path.getsize(paths[0])
+
+    path = str(tmpdir.join('metadata.npz'))
+    metadata.save(path)
+    loaded = ImageMetadata.load(path)
+    assert loaded.same_as(metadata)
+
+    # only changed files are read again
+    reads = []
+    stat  = os.stat(paths[1])
+    os.utime(paths[1], (stat.st_atime, stat.st_mtime + 10))
+    rebuilt = ImageMetadata.build(paths, read_image_size, workers=2, previous=loaded)
+    assert reads == [1]
+    assert not rebuilt.same_as(loaded)
+
+    assert ImageMetadata.load(str(tmpdir.join('missing.npz'))) is None
+
+
+def test_generator_image_metadata(tmpdir):
+    annotations, classes = write_csv_dataset(tmpdir, [(10, 20), (30, 15), (8, 8)])
+    path                 = str(tmpdir.join('cache', 'metadata.npz'))
+
+    generator = CSVGenerator(annotations, classes, shuffle_groups=False, image_metadata_path=path)
+    assert os.path.exists(path)
+    assert generator.image_metadata.size() == 3
+
+    for image_index in range(generator.size()):
+        assert generator.image_path(image_index) == generator.resolve_image_path(image_index)
+        assert generator.image_size(image_index) == generator.read_image_size(image_index)
+
+    np.testing.assert_almost_equal([generator.image_aspect_ratio(i) for i in range(3)], [2.0, 0.5, 1.0])
+    assert [group[0] for group in generator.groups] == [1, 2, 0]
@@ -0,0 +1,84 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+import pytest
+
+from keras_retinanet.preprocessing.generator import Generator
+from keras_retinanet.preprocessing.loader import MultiprocessLoader
+
+
+class SimpleGenerator(Generator):
+    """ Generator with images that are filled with their index. """
+    def __init__(self, num_images=6, fail_on=None, **kwargs):
+        self.num_images = num_images
+        self.fail_on    = fail_on
+        super(SimpleGenerator, self).__init__(group_method='none', shuffle_groups=False, image_min_side=64, image_max_side=96, **kwargs)
+
+    def size(self):
+        return self.num_images
+
+    def num_classes(self):
+        return 2
+
+    def image_path(self, image_index):
+        return str(image_index)
+
+    def load_image(self, image_index):
+        if image_index == self.fail_on:
+            raise ValueError('failed to load image {}'.format(image_index))
+        return np.full((48, 64, 3), image_index, dtype=np.uint8)
+
+    def load_annotations(self, image_index):
+        return {'labels': np.array([image_index % 2]), 'bboxes': np.array([[4.0, 4.0, 30.0, 40.0]])}
+
+
+def first_pixel(inputs):
+    # the images are filled with their index, after preprocessing the first pixel still identifies the batch
+    return float(inputs[0, 0, 0, 0])
+
+
+@pytest.mark.parametrize('slot_size', [None, 1024])
+def test_loader(slot_size):
+    generator = SimpleGenerator(batch_size=2)
+    expected  = dict((first_pixel(inputs), (inputs, targets)) for inputs, targets in (generator[i] for i in range(len(generator))))
+
+    # batches arrive in completion order, the next pass may already have started, so batches can repeat
+    with MultiprocessLoader(generator, workers=2, num_slots=2, slot_size=slot_size, seed=0) as loader:
+        batches   = [next(loader) for _ in range(len(generator))]
+        metrics   = loader.metrics()
+        processes = loader.processes
+
+    for inputs, targets in batches:
+        key = first_pixel(inputs)
+        assert key in expected
+        np.testing.assert_array_equal(inputs, expected[key][0])
+        for target, expected_target in zip(targets, expected[key][1]):
+            np.testing.assert_array_equal(target, expected_target)
+
+    assert metrics['batches'] == len(generator)
+    assert metrics['queue_depth'] >= 0
+    assert metrics['pickled'] == (len(generator) if slot_size else 0)
+    assert not any(process.is_alive() for process in processes)
+
+
+def test_loader_error():
+    generator = SimpleGenerator(batch_size=2, fail_on=3)
+
+    with MultiprocessLoader(generator, workers=1, seed=0) as loader:
+        with pytest.raises(RuntimeError):
+            for _ in range(len(generator)):
+                next(loader)
@@ -0,0 +1,99 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import itertools
+
+import cv2
+import numpy as np
+
+from keras_retinanet.preprocessing.csv_generator import CSVGenerator
+from keras_retinanet.preprocessing.sharded import ShardedGenerator, read_shard, write_shards
+
+
+def write_sharded_dataset(tmpdir, num_images=7, images_per_shard=3):
+    classes = tmpdir.join('classes.csv')
+    classes.write('a,0\nb,1\n')
+
+    prng  = np.random.RandomState(0)
+    lines = []
+    for i in range(num_images):
+        name  = 'img_{}.jpg'.format(i)
+        shape = (prng.randint(40, 80), prng.randint(40, 80), 3)
+        cv2.imwrite(str(tmpdir.join(name)), prng.randint(0, 256, shape).astype(np.uint8))
+        lines.append('{},{},{},{},{},{}\n'.format(name, 1, 2, 20 + i, 30, 'ab'[i % 2]))
+
+    annotations = tmpdir.join('annotations.csv')
+    annotations.write(''.join(lines))
+
+    generator = CSVGenerator(str(annotations), str(classes), shuffle_groups=False)
+    write_shards(generator, str(tmpdir.join('shards')), images_per_shard=images_per_shard)
+    return generator, str(tmpdir.join('shards'))
+
+
+def test_write_read_shards(tmpdir):
+    generator, path = write_sharded_dataset(tmpdir)
+
+    records = list(itertools.chain(*[read_shard(str(tmpdir.join('shards', 'shard_{:05d}.rec'.format(i)))) for i in range(3)]))
+    assert len(records) == generator.size()
+
+    for image_index, record in enumerate(records):
+        with open(generator.image_path(image_index), 'rb') as f:
+            assert record.image == f.read()
+        assert (record.width, record.height) == generator.image_size(image_index)
+        np.testing.assert_array_equal(record.labels, generator.load_annotations(image_index)['labels'])
+        np.testing.assert_array_equal(record.bboxes, generator.load_annotations(image_index)['bboxes'])
+
+
+def test_sharded_generator(tmpdir):
+    generator, path = write_sharded_dataset(tmpdir)
+
+    sharded = ShardedGenerator(path, batch_size=2, shuffle_buffer_size=3, group_buffer_size=2)
+    assert sharded.size() == 7
+    assert len(sharded) == 4
+    assert sharded.num_classes() == 2
+    assert sharded.label_to_name(1) == 'b'
+
+    # every pass over the shards contains every record once
+    names = [record.name for record in itertools.islice(sharded.stream_records(), 14)]
+    assert collections.Counter(names) == collections.Counter(['img_{}.jpg'.format(i) for i in range(7)] * 2)
+
+    # groups are sorted by aspect ratio within the grouping window of two batches
+    ordered = ShardedGenerator(path, batch_size=2, group_buffer_size=2, shuffle_groups=False)
+    groups  = list(itertools.islice(ordered.stream_groups(), 4))
+    for window in (groups[0] + groups[1], groups[2] + groups[3]):
+        ratios = [float(record.width) / record.height for record in window]
+        assert ratios == sorted(ratios)
+
+    inputs, targets = sharded[0]
+    assert inputs.shape[0] == 2
+    assert targets[0].shape[0] == 2
+    assert not sharded.records
+
+
+def test_sharded_generator_workers(tmpdir):
+    generator, path = write_sharded_dataset(tmpdir)
+
+    # every worker streams its own shards, so together the workers see every record once per pass
+    names = []
+    for worker_id in range(3):
+        sharded = ShardedGenerator(path, batch_size=1, shuffle_groups=False)
+        sharded.init_worker(worker_id, 3)
+
+        num_records = sum(len(list(read_shard(shard))) for shard in sharded.shards)
+        names.extend(record.name for record in itertools.islice(sharded.stream_records(), num_records))
+
+    assert sorted(names) == sorted('img_{}.jpg'.format(i) for i in range(7))
@@ -31,3 +31,39 @@ def test_smooth_l1():
     loss = keras.backend.eval(loss)
 
     assert loss == pytest.approx((((1 - 0.5 / 9) * 2 + (0.5 * 9 * 0.05 ** 2)) / 3))
+
+
+def test_sparse_losses():
+    np.random.seed(0)
+
+    num_classes    = 3
+    classification = np.random.uniform(0.01, 0.99, (2, 6, num_classes)).astype(keras.backend.floatx())
+    regression     = np.random.uniform(-1, 1, (2, 6, 4)).astype(keras.backend.floatx())
+
+    # anchor states and labels of positive anchors (-1 for other anchors)
+    states  = np.array([[1, 0, -1, 1, 0, 0], [0, 0, 1, 0, -1, 0]], dtype=keras.backend.floatx())
+    labels  = np.array([[2, -1, -1, 0, -1, -1], [-1, -1, 1, -1, -1, -1]], dtype=keras.backend.floatx())
+    targets = np.random.uniform(-1, 1, (2, 6, 4)).astype(keras.backend.floatx())
+
+    # dense targets
+    dense_labels = np.zeros((2, 6, num_classes + 1), dtype=keras.backend.floatx())
+    dense_labels[..., -1] = states
+    for b, a in zip(*np.where(labels >= 0)):
+        dense_labels[b, a, int(labels[b, a])] = 1
+    dense_regression = np.concatenate([targets, states[..., None]], axis=2)
+
+    # sparse targets, regression targets of positive anchors padded with anchor index -1
+    sparse_labels     = np.stack([labels, states], axis=2)
+    sparse_regression = np.full((2, 2, 5), -1, dtype=keras.backend.floatx())
+    sparse_regression[0, :, 0]   = [0, 3]
+    sparse_regression[0, :, 1:]  = targets[0, [0, 3]]
+    sparse_regression[1, :1, 0]  = [2]
+    sparse_regression[1, :1, 1:] = targets[1, [2]]
+
+    focal        = keras.backend.eval(keras_retinanet.losses.focal()(dense_labels, classification))
+    focal_sparse = keras.backend.eval(keras_retinanet.losses.focal_sparse()(sparse_labels, classification))
+    assert focal_sparse == pytest.approx(focal)
+
+    smooth_l1        = keras.backend.eval(keras_retinanet.losses.smooth_l1()(dense_regression, regression))
+    smooth_l1_sparse = keras.backend.eval(keras_retinanet.losses.smooth_l1_sparse()(sparse_regression, regression))
+    assert smooth_l1_sparse == pytest.approx(smooth_l1)
@@ -2,7 +2,16 @@ import numpy as np
 import configparser
 import keras
 
-from keras_retinanet.utils.anchors import anchors_for_shape, AnchorParameters
+from keras_retinanet.utils.anchors import (
+    anchor_grid_for_shape,
+    anchor_targets_bbox,
+    anchor_targets_bbox_sparse,
+    anchors_for_grid,
+    anchors_for_shape,
+    compute_gt_annotations,
+    AnchorCache,
+    AnchorParameters,
+)
 from keras_retinanet.utils.config import read_config_file, parse_anchor_parameters
 
 
@@ -59,6 +68,134 @@ def test_anchors_for_shape_dimensions():
     assert all_anchors.shape == (1008, 4)
 
 
+def test_anchor_cache():
+    sizes   = [32, 64, 128]
+    strides = [8, 16, 32]
+    ratios  = np.array([0.5, 1, 2, 3], keras.backend.floatx())
+    scales  = np.array([1, 1.2, 1.6], keras.backend.floatx())
+    anchor_params = AnchorParameters(sizes, strides, ratios, scales)
+
+    cache = AnchorCache(maxsize=2)
+    anchors = cache.get((64, 64, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params)
+    np.testing.assert_array_equal(anchors, anchors_for_shape((64, 64, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params))
+    assert cache.info() == (0, 1, 2, 1)
+
+    # equal parameters in a different object should hit the cache
+    anchor_params_copy = AnchorParameters(list(sizes), list(strides), ratios.copy(), scales.copy())
+    assert cache.get((64, 64, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params_copy) is anchors
+    assert cache.info() == (1, 1, 2, 1)
+
+    # the cache is bounded, the least recently used entry is evicted first
+    cache.get((32, 64, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params)
+    cache.get((64, 32, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params)
+    assert cache.info() == (1, 3, 2, 2)
+    assert cache.get((64, 64, 3), pyramid_levels=[3, 4, 5], anchor_params=anchor_params) is not anchors
+
+    cache.clear()
+    assert cache.info() == (0, 0, 2, 0)
+
+
+def test_anchor_targets_bbox():
+    anchors = np.array([
+        [ 0,  0, 10, 10],
+        [ 4,  0, 14, 10],
+        [20, 20, 30, 30],
+        [40, 40, 50, 50],
+    ], dtype=np.float64)
+
+    image_group       = [np.zeros((32, 32, 3)), np.zeros((32, 32, 3))]
+    annotations_group = [
+        {'bboxes': np.array([[0, 0, 10, 10], [20, 20, 30, 31]], dtype=np.float64), 'labels': np.array([1, 2])},
+        {'bboxes': np.zeros((0, 4)), 'labels': np.zeros((0,))},
+    ]
+
+    regression_batch, labels_batch = anchor_targets_bbox(anchors, image_group, annotations_group, num_classes=3)
+
+    assert regression_batch.shape == (2, 4, 5)
+    assert labels_batch.shape == (2, 4, 4)
+    assert regression_batch.dtype == keras.backend.floatx()
+    assert labels_batch.dtype == keras.backend.floatx()
+
+    # anchor states: positive, ignored (0.4 < IoU < 0.5), positive, outside of the image
+    np.testing.assert_array_equal(labels_batch[0, :, -1], [1, -1, 1, -1])
+    np.testing.assert_array_equal(regression_batch[0, :, -1], [1, -1, 1, -1])
+    np.testing.assert_array_equal(labels_batch[0, :, :-1], [[0, 1, 0], [0, 0, 0], [0, 0, 1], [0, 0, 0]])
+
+    # only positive anchors get regression targets
+    np.testing.assert_almost_equal(regression_batch[0, 0, :-1], [0, 0, 0, 0])
+    np.testing.assert_almost_equal(regression_batch[0, 2, :-1], [0, 0, 0, 0.5])
+    np.testing.assert_array_equal(regression_batch[0, [1, 3], :-1], 0)
+
+    # an image without annotations only has negative anchors, except for those outside of the image
+    np.testing.assert_array_equal(labels_batch[1, :, -1], [0, 0, 0, -1])
+    np.testing.assert_array_equal(labels_batch[1, :, :-1], 0)
+    np.testing.assert_array_equal(regression_batch[1], [[0, 0, 0, 0, 0]] * 3 + [[0, 0, 0, 0, -1]])
+
+
+def test_anchor_targets_bbox_sparse():
+    anchors = np.array([
+        [ 0,  0, 10, 10],
+        [ 4,  0, 14, 10],
+        [20, 20, 30, 30],
+        [40, 40, 50, 50],
+    ], dtype=np.float64)
+
+    image_group       = [np.zeros((32, 32, 3)), np.zeros((32, 32, 3))]
+    annotations_group = [
+        {'bboxes': np.array([[0, 0, 10, 10], [20, 20, 30, 31]], dtype=np.float64), 'labels': np.array([1, 2])},
+        {'bboxes': np.zeros((0, 4)), 'labels': np.zeros((0,))},
+    ]
+
+    regression_batch, labels_batch = anchor_targets_bbox_sparse(anchors, image_group, annotations_group, num_classes=3)
+    dense_regression, dense_labels = anchor_targets_bbox(anchors, image_group, annotations_group, num_classes=3)
+
+    # the label of positive anchors is stored as an index, the anchor states are the same as the dense targets
+    assert labels_batch.shape == (2, 4, 2)
+    np.testing.assert_array_equal(labels_batch[:, :, 1], dense_labels[:, :, -1])
+    np.testing.assert_array_equal(labels_batch[0, :, 0], [1, -1, 2, -1])
+    np.testing.assert_array_equal(labels_batch[1, :, 0], -1)
+
+    # regression targets are only stored for positive anchors, padded to the largest number of positives in the batch
+    assert regression_batch.shape == (2, 2, 5)
+    np.testing.assert_array_equal(regression_batch[0, :, 0], [0, 2])
+    np.testing.assert_almost_equal(regression_batch[0, :, 1:], dense_regression[0, [0, 2], :-1])
+    np.testing.assert_array_equal(regression_batch[1, :, 0], [-1, -1])
+
+
+def test_anchor_targets_bbox_read_only_anchors():
+    # the anchors returned by an AnchorCache are read-only
+    anchors = AnchorCache().get((64, 64, 3))
+    assert not anchors.flags.writeable
+
+    image_group       = [np.zeros((64, 64, 3))]
+    annotations_group = [{'bboxes': np.array([[4, 4, 40, 50]], dtype=np.float64), 'labels': np.array([1])}]
+
+    expected = anchor_targets_bbox(anchors.copy(), image_group, annotations_group, num_classes=3)
+    for anchor_grid in [None, anchor_grid_for_shape((64, 64, 3))]:
+        result = anchor_targets_bbox(anchors, image_group, annotations_group, num_classes=3, anchor_grid=anchor_grid)
+        for e, r in zip(expected, result):
+            np.testing.assert_array_equal(e, r)
+
+
+def test_compute_gt_annotations_grid():
+    np.random.seed(0)
+
+    for image_shape in [(64, 64, 3), (200, 333, 3)]:
+        anchor_grid = anchor_grid_for_shape(image_shape)
+        anchors     = anchors_for_grid(anchor_grid)
+        np.testing.assert_array_equal(anchors, anchors_for_shape(image_shape))
+
+        corners     = np.random.uniform(-10, image_shape[1], (50, 2))
+        sizes       = np.random.uniform(1, 200, (50, 2))
+        annotations = np.concatenate([corners, corners + sizes], axis=1)
+
+        # visiting only nearby anchors should give exactly the same result as the full overlap matrix
+        expected = compute_gt_annotations(anchors, annotations)
+        result   = compute_gt_annotations(anchors, annotations, anchor_grid=anchor_grid)
+        for e, r in zip(expected, result):
+            np.testing.assert_array_equal(e, r)
+
+
 def test_anchors_for_shape_values():
     sizes   = [12]
     strides = [8]
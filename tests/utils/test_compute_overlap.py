@@ -0,0 +1,89 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from keras_retinanet.utils.compute_overlap import compute_overlap, compute_overlap_max
+
+
+def random_boxes(count, seed):
+    prng    = np.random.RandomState(seed)
+    corners = prng.uniform(0, 100, (count, 2))
+    sizes   = prng.uniform(1, 50, (count, 2))
+    return np.concatenate([corners, corners + sizes], axis=1)
+
+
+def test_compute_overlap():
+    boxes = np.array([
+        [0, 0,  9,  9],
+        [5, 5, 14, 14],
+    ], dtype=np.float64)
+    query_boxes = np.array([
+        [ 0,  0,  9,  9],
+        [20, 20, 29, 29],
+    ], dtype=np.float64)
+
+    overlaps = compute_overlap(boxes, query_boxes)
+
+    assert overlaps.dtype == np.float64
+    np.testing.assert_almost_equal(overlaps, [
+        [1, 0],
+        [25 / 175, 0],
+    ])
+
+
+def test_compute_overlap_float32():
+    boxes       = random_boxes(50, seed=0)
+    query_boxes = random_boxes(10, seed=1)
+
+    overlaps_64 = compute_overlap(boxes, query_boxes)
+    overlaps_32 = compute_overlap(boxes.astype(np.float32), query_boxes.astype(np.float32))
+
+    assert overlaps_32.dtype == np.float32
+    np.testing.assert_allclose(overlaps_32, overlaps_64, rtol=1e-5, atol=1e-6)
+
+    # mixed inputs are computed in float64
+    assert compute_overlap(boxes.astype(np.float32), query_boxes).dtype == np.float64
+
+
+def test_compute_overlap_max():
+    boxes       = random_boxes(200, seed=2)
+    query_boxes = random_boxes(20, seed=3)
+
+    overlaps = compute_overlap(boxes, query_boxes)
+    for num_threads in [1, 2]:
+        max_overlaps, argmax_overlaps = compute_overlap_max(boxes, query_boxes, num_threads=num_threads)
+        np.testing.assert_array_equal(max_overlaps, np.max(overlaps, axis=1))
+        np.testing.assert_array_equal(argmax_overlaps, np.argmax(overlaps, axis=1))
+
+
+def test_compute_overlap_read_only():
+    boxes       = random_boxes(50, seed=4)
+    query_boxes = random_boxes(10, seed=5)
+    expected    = compute_overlap(boxes, query_boxes)
+
+    # read-only arrays (eg. cached anchors) are accepted, in both precisions
+    for dtype in [np.float32, np.float64]:
+        read_only_boxes       = boxes.astype(dtype)
+        read_only_query_boxes = query_boxes.astype(dtype)
+        read_only_boxes.setflags(write=False)
+        read_only_query_boxes.setflags(write=False)
+
+        np.testing.assert_allclose(compute_overlap(read_only_boxes, read_only_query_boxes), expected, rtol=1e-5, atol=1e-6)
+
+        max_overlaps, argmax_overlaps = compute_overlap_max(read_only_boxes, read_only_query_boxes)
+        np.testing.assert_allclose(max_overlaps, np.max(expected, axis=1), rtol=1e-5, atol=1e-6)
+        np.testing.assert_array_equal(argmax_overlaps, np.argmax(expected, axis=1))
@@ -0,0 +1,211 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from keras_retinanet.utils.compute_overlap import compute_overlap
+from keras_retinanet.utils.eval import _match_detections, evaluate, predict_images
+
+
+def match_detections_reference(detections, annotations, iou_threshold):
+    """ Match detections one at a time, the way evaluate used to. """
+    true_positives       = []
+    detected_annotations = []
+
+    for d in detections:
+        if annotations.shape[0] == 0:
+            true_positives.append(False)
+            continue
+
+        overlaps            = compute_overlap(np.expand_dims(d, axis=0), annotations)
+        assigned_annotation = np.argmax(overlaps, axis=1)
+        max_overlap         = overlaps[0, assigned_annotation]
+
+        if max_overlap >= iou_threshold and assigned_annotation not in detected_annotations:
+            true_positives.append(True)
+            detected_annotations.append(assigned_annotation)
+        else:
+            true_positives.append(False)
+
+    return np.array(true_positives, dtype=bool)
+
+
+def test_match_detections():
+    detections = np.array([
+        [0,  0,  10, 10, 0.9],  # matches the first annotation
+        [1,  1,  10, 10, 0.8],  # duplicate of the first annotation
+        [50, 50, 60, 60, 0.7],  # no overlap
+        [20, 20, 30, 30, 0.6],  # matches the second annotation
+    ])
+    annotations = np.array([
+        [0,  0,  10, 10],
+        [20, 20, 30, 30],
+    ])
+
+    np.testing.assert_array_equal(_match_detections(detections, annotations, 0.5), [True, False, False, True])
+    np.testing.assert_array_equal(_match_detections(detections, annotations[:0], 0.5), [False] * 4)
+    np.testing.assert_array_equal(_match_detections(detections[:0], annotations, 0.5), np.zeros((0,), dtype=bool))
+
+
+def test_match_detections_random():
+    prng = np.random.RandomState(0)
+    for _ in range(50):
+        num_detections  = prng.randint(0, 30)
+        num_annotations = prng.randint(0, 10)
+
+        corners     = prng.uniform(0, 50, (num_annotations, 2))
+        annotations = np.concatenate([corners, corners + prng.uniform(5, 20, (num_annotations, 2))], axis=1)
+
+        corners    = prng.uniform(0, 50, (num_detections, 2))
+        detections = np.concatenate([
+            corners,
+            corners + prng.uniform(5, 20, (num_detections, 2)),
+            np.sort(prng.uniform(0, 1, (num_detections, 1)), axis=0)[::-1],
+        ], axis=1)
+
+        np.testing.assert_array_equal(
+            _match_detections(detections, annotations, 0.3),
+            match_detections_reference(detections, annotations, 0.3)
+        )
+
+
+class SimpleGenerator(object):
+    """ Minimal generator with random annotations.
+
+    The images have different aspect ratios and are filled with their index, so that a model can recognize them.
+    """
+    def __init__(self, num_images=10, num_classes=3, seed=0):
+        prng = np.random.RandomState(seed)
+
+        self.annotations = []
+        self.shapes      = []
+        for _ in range(num_images):
+            count   = prng.randint(0, 5)
+            corners = prng.uniform(0, 50, (count, 2))
+            self.annotations.append({
+                'bboxes': np.concatenate([corners, corners + prng.uniform(5, 20, (count, 2))], axis=1),
+                'labels': prng.randint(0, num_classes, count),
+            })
+            self.shapes.append((prng.randint(50, 100), prng.randint(50, 100), 3))
+        self.classes = num_classes
+
+    def size(self):
+        return len(self.annotations)
+
+    def num_classes(self):
+        return self.classes
+
+    def has_label(self, label):
+        return True
+
+    def image_aspect_ratio(self, image_index):
+        return float(self.shapes[image_index][1]) / float(self.shapes[image_index][0])
+
+    def load_image(self, image_index):
+        return np.full(self.shapes[image_index], image_index, dtype=np.uint8)
+
+    def load_annotations(self, image_index):
+        return self.annotations[image_index]
+
+    def preprocess_image(self, image):
+        return image.astype(np.float32)
+
+    def resize_image(self, image):
+        return image, 2.0
+
+
+class SimpleModel(object):
+    """ Model returning the (scaled) annotations of the generator with some noise as detections. """
+    def __init__(self, generator, max_detections=5):
+        self.generator      = generator
+        self.max_detections = max_detections
+        self.batch_sizes    = []
+
+    def predict_on_batch(self, inputs):
+        self.batch_sizes.append(inputs.shape[0])
+
+        boxes  = np.full((inputs.shape[0], self.max_detections, 4), -1, dtype=np.float32)
+        scores = np.full((inputs.shape[0], self.max_detections), -1, dtype=np.float32)
+        labels = np.full((inputs.shape[0], self.max_detections), -1, dtype=np.int32)
+        for batch_index, image in enumerate(inputs):
+            image_index = int(image[0, 0, 0])
+            annotations = self.generator.load_annotations(image_index)
+            prng        = np.random.RandomState(image_index)
+
+            count = annotations['labels'].shape[0]
+            boxes[batch_index, :count]  = (annotations['bboxes'] + prng.uniform(-5, 5, (count, 4))) * 2
+            scores[batch_index, :count] = prng.uniform(0.1, 1, count)
+            labels[batch_index, :count] = annotations['labels']
+
+        return boxes, scores, labels
+
+
+
+class ClippingModel(SimpleModel):
+    """ Model with large detections that are clipped to the (padded) input, like the boxes of retinanet_bbox. """
+    def predict_on_batch(self, inputs):
+        boxes, scores, labels = super(ClippingModel, self).predict_on_batch(inputs)
+
+        height, width = inputs.shape[1:3]
+        valid         = scores >= 0
+        boxes[valid] += [0, 0, 100, 100]
+        boxes[valid]  = np.clip(boxes[valid], 0, [width - 1, height - 1, width - 1, height - 1])
+        return boxes, scores, labels
+
+def test_evaluate_workers():
+    generator = SimpleGenerator()
+
+    serial, _   = evaluate(generator, SimpleModel(generator))
+    parallel, _ = evaluate(generator, SimpleModel(generator), workers=2)
+
+    assert serial == parallel
+    assert sorted(serial.keys()) == [0, 1, 2]
+
+
+def test_evaluate_batch_size():
+    generator = SimpleGenerator()
+
+    model = SimpleModel(generator)
+    single, _ = evaluate(generator, model)
+    assert model.batch_sizes == [1] * 10
+
+    model = SimpleModel(generator)
+    batched, _ = evaluate(generator, model, batch_size=4)
+    assert model.batch_sizes == [4, 4, 2]
+
+    assert single == batched
+
+
+def test_evaluate_prefetch():
+    generator = SimpleGenerator()
+
+    synchronous, _      = evaluate(generator, SimpleModel(generator), batch_size=3, prefetch=0)
+    prefetched, timings = evaluate(generator, SimpleModel(generator), batch_size=3, prefetch=2)
+
+    assert synchronous == prefetched
+    assert sorted(timings.keys()) == ['decode', 'inference', 'postprocess', 'preprocess']
+
+
+def test_predict_images_batch_size():
+    generator = SimpleGenerator()
+
+    # in a batch, the boxes are clipped to the image and not to the padded batch, as if every image was predicted alone
+    single  = dict((i, boxes) for i, _, boxes, _, _, _ in predict_images(generator, ClippingModel(generator), batch_size=1))
+    batched = dict((i, boxes) for i, _, boxes, _, _, _ in predict_images(generator, ClippingModel(generator), batch_size=4))
+
+    assert sorted(single.keys()) == sorted(batched.keys()) == list(range(generator.size()))
+    for image_index, boxes in single.items():
+        np.testing.assert_array_equal(batched[image_index], boxes)
@@ -0,0 +1,115 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from keras_retinanet.utils.image import (
+    VisualEffect,
+    compute_image_batch,
+    preprocess_image,
+    random_visual_effect_generator,
+    read_image_bgr,
+    read_image_bgr_reduced,
+    resize_image,
+)
+
+
+def test_compute_image_batch():
+    prng   = np.random.RandomState(0)
+    images = [
+        prng.randint(0, 256, (20, 30, 3)).astype(np.uint8),
+        prng.randint(0, 256, (25, 10, 3)).astype(np.uint8),
+    ]
+
+    image_batch = compute_image_batch(images, preprocess_image, batch_size=3)
+
+    expected = np.zeros((3, 25, 30, 3), dtype=np.float32)
+    expected[0, :20, :30] = preprocess_image(images[0])
+    expected[1, :25, :10] = preprocess_image(images[1])
+
+    assert image_batch.dtype == np.float32
+    np.testing.assert_array_equal(image_batch, expected)
+
+
+def test_resize_before_preprocess():
+    prng  = np.random.RandomState(0)
+    image = prng.randint(0, 256, (60, 80, 3)).astype(np.uint8)
+
+    # preprocessing is affine, so resizing first only differs by the fixed point arithmetic and rounding of the uint8 resize
+    expected, _ = resize_image(preprocess_image(image), min_side=90, max_side=200)
+    resized, _  = resize_image(image, min_side=90, max_side=200)
+
+    np.testing.assert_allclose(preprocess_image(resized), expected, atol=1)
+
+
+def test_visual_effect_lookup_tables():
+    np.random.seed(0)
+    prng      = np.random.RandomState(0)
+    generator = random_visual_effect_generator(
+        contrast_range=(0.5, 1.5),
+        brightness_range=(-0.3, 0.3),
+        hue_range=(-0.5, 0.5),
+        saturation_range=(0.5, 1.5)
+    )
+    effects = [next(generator) for _ in range(10)] + [
+        VisualEffect(contrast_factor=0, brightness_delta=0, hue_delta=0.1, saturation_factor=0),
+        VisualEffect(contrast_factor=1.2, brightness_delta=0, hue_delta=0, saturation_factor=0),
+    ]
+
+    for effect in effects:
+        image    = prng.randint(0, 256, (30, 40, 3)).astype(np.uint8)
+        original = image.copy()
+
+        result = effect(image)
+
+        # the input image is not modified
+        np.testing.assert_array_equal(image, original)
+
+        # the result matches applying the effects one by one
+        assert result.dtype == np.uint8
+        assert np.abs(result.astype(np.int16) - effect.apply_separately(image)).max() <= 1
+
+
+def test_read_image_bgr(tmpdir):
+    path  = str(tmpdir.join('image.png'))
+    image = np.random.RandomState(0).randint(0, 256, (20, 30, 3)).astype(np.uint8)
+    cv2.imwrite(path, image)
+
+    np.testing.assert_array_equal(read_image_bgr(path), image)
+
+    # grayscale images are converted to three channels
+    Image.fromarray(image[:, :, 0]).save(path)
+    assert read_image_bgr(path).shape == (20, 30, 3)
+
+
+def test_read_image_bgr_reduced(tmpdir):
+    path  = str(tmpdir.join('image.jpg'))
+    image = cv2.resize(np.random.RandomState(0).randint(0, 256, (8, 12, 3)).astype(np.uint8), (601, 400))
+    cv2.imwrite(path, image)
+
+    # a resize scale of 0.25 allows decoding at a quarter of the resolution
+    reduced, scale = read_image_bgr_reduced(path, min_side=100, max_side=1000)
+    assert reduced.shape == (100, 151, 3)
+    assert scale == 100 / 400.0
+    assert np.abs(reduced.astype(np.int16) - cv2.resize(image, (151, 100), interpolation=cv2.INTER_AREA)).mean() < 5
+
+    # a resize scale above 0.5 requires a full resolution decode
+    full, scale = read_image_bgr_reduced(path, min_side=300, max_side=1000)
+    assert full.shape == (400, 601, 3)
+    assert scale == 1
+    np.testing.assert_array_equal(full, read_image_bgr(path))
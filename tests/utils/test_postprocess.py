@@ -0,0 +1,78 @@
+"""
+Copyright 2017-2018 Fizyr (https://fizyr.com)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import keras
+import numpy as np
+import pytest
+
+import keras_retinanet.layers
+from keras_retinanet.utils.postprocess import PostProcessor, predict_pipelined
+
+
+def create_raw_outputs(batch_size=2, num_boxes=300, num_classes=4, image_shape=(120, 150)):
+    prng           = np.random.RandomState(0)
+    corners        = prng.uniform(-10, 140, (batch_size, num_boxes, 2))
+    anchors        = np.concatenate([corners, corners + prng.uniform(8, 48, (batch_size, num_boxes, 2))], axis=2)
+    regression     = prng.normal(0, 1, (batch_size, num_boxes, 4))
+    classification = prng.uniform(0, 1, (batch_size, num_boxes, num_classes)) ** 4
+    other          = prng.uniform(0, 1, (batch_size, num_boxes, 3))
+    return [value.astype(keras.backend.floatx()) for value in (anchors, regression, classification, other)]
+
+
+def graph_detections(image_shape, anchors, regression, classification, other, **kwargs):
+    """ Compute the detections with the layers of the inference model. """
+    image = keras.backend.zeros((anchors.shape[0],) + image_shape + (3,))
+    boxes = keras_retinanet.layers.RegressBoxes().call([keras.backend.constant(anchors), keras.backend.constant(regression)])
+    boxes = keras_retinanet.layers.ClipBoxes().call([image, boxes])
+    return [keras.backend.eval(o) for o in keras_retinanet.layers.FilterDetections(max_detections=50, **kwargs).call(
+        [boxes, keras.backend.constant(classification), keras.backend.constant(other)]
+    )]
+
+
+@pytest.mark.parametrize('nms', [True, False])
+@pytest.mark.parametrize('class_specific_filter', [True, False])
+def test_postprocessor_parity(nms, class_specific_filter):
+    image_shape = (120, 150)
+    raw_outputs = create_raw_outputs(image_shape=image_shape)
+
+    expected = graph_detections(image_shape, *raw_outputs, nms=nms, class_specific_filter=class_specific_filter)
+    actual   = PostProcessor(nms=nms, class_specific_filter=class_specific_filter, max_detections=50)(image_shape, *raw_outputs)
+
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.shape == e.shape
+        assert a.dtype == e.dtype
+        np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-4)
+
+
+def test_predict_pipelined():
+    class RawModel(object):
+        """ Model that returns the same raw outputs for every batch. """
+        def __init__(self, raw_outputs):
+            self.raw_outputs = raw_outputs
+
+        def predict_on_batch(self, batch):
+            return self.raw_outputs
+
+    raw_outputs = create_raw_outputs()
+    batches     = [np.zeros((2, 120, 150, 3)) for _ in range(3)]
+    expected    = PostProcessor()((120, 150), *raw_outputs)
+
+    results = list(predict_pipelined(RawModel(raw_outputs), batches))
+    assert len(results) == 3
+    for result in results:
+        for r, e in zip(result, expected):
+            np.testing.assert_array_equal(r, e)